@@ -0,0 +1,49 @@
+"""
+Micro-benchmark of the aggTrades page decoders.
+
+Compares the regular `response.json()` + `pd.DataFrame(data)` path with
+`extract.decode_agg_trades` on a synthetic 1000-row page.
+
+Usage:
+    python benchmarks/bench_decode.py
+"""
+import os
+import sys
+import json
+import timeit
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from extract import decode_agg_trades
+
+def make_page(rows: int = 1000) -> bytes:
+    rng = np.random.default_rng(0)
+    data = [
+        {
+            "a": 3_000_000_000 + i,
+            "p": f"{67_000 + rng.random():.8f}",
+            "q": f"{rng.random():.8f}",
+            "f": 4_000_000_000 + 2 * i,
+            "l": 4_000_000_001 + 2 * i,
+            "T": 1_700_000_000_000 + i,
+            "m": bool(i % 2),
+            "M": True,
+        }
+        for i in range(rows)
+    ]
+    return json.dumps(data, separators=(",", ":")).encode()
+
+def main():
+    body = make_page()
+    runs = 500
+    json_path = timeit.timeit(lambda: pd.DataFrame(json.loads(body)), number=runs) / runs
+    fast_path = timeit.timeit(lambda: decode_agg_trades(body), number=runs) / runs
+
+    print(f"json + DataFrame:  {json_path * 1e3:.3f} ms/page")
+    print(f"decode_agg_trades: {fast_path * 1e3:.3f} ms/page")
+    print(f"speed-up:          {json_path / fast_path:.1f}x")
+
+if __name__ == "__main__":
+    main()
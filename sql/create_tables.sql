@@ -1,8 +1,78 @@
+-- Trades are range-partitioned by month on time. The loader creates the
+-- monthly partitions (trades_YYYY_MM) on demand, and each one inherits the time
+-- index, so dashboard range queries only touch the months they cover. Old months
+-- can be detached cheaply with partitions.detach_partitions.
 CREATE TABLE IF NOT EXISTS trades (
-	trade_id BIGINT PRIMARY KEY,
-	price NUMERIC(18, 6),
-	quantity NUMERIC(18, 6),
-	quote_qty NUMERIC(18, 6),
-	time TIMESTAMP,
-	order_type VARCHAR(6)
+	trade_id BIGINT NOT NULL,
+	price NUMERIC(24, 8),
+	quantity NUMERIC(24, 8),
+	quote_qty NUMERIC(32, 16),
+	time TIMESTAMP NOT NULL,
+	order_type VARCHAR(6),
+	PRIMARY KEY (trade_id, time)
+) PARTITION BY RANGE (time);
+
+CREATE INDEX IF NOT EXISTS trades_time_idx ON trades (time);
+
+-- An existing unpartitioned trades table can be kept as a single partition
+-- holding everything before the first monthly partition:
+-- ALTER TABLE trades RENAME TO trades_legacy;
+-- (create the partitioned trades table above)
+-- ALTER TABLE trades_legacy ALTER COLUMN time SET NOT NULL;
+-- ALTER TABLE trades ATTACH PARTITION trades_legacy
+--     FOR VALUES FROM (MINVALUE) TO ('<first day of the next month>');
+
+-- Tables created with the former NUMERIC(18, 6) columns can be widened to keep
+-- fixed-point prices and quote quantities exact:
+-- ALTER TABLE trades
+--     ALTER COLUMN price TYPE NUMERIC(24, 8),
+--     ALTER COLUMN quantity TYPE NUMERIC(24, 8),
+--     ALTER COLUMN quote_qty TYPE NUMERIC(32, 16);
+
+CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+	symbol VARCHAR(20) PRIMARY KEY,
+	trade_id BIGINT NOT NULL,
+	updated_at TIMESTAMP NOT NULL
 );
+
+-- Candle rollups maintained incrementally by the loader. Same layout for
+-- candles_1m, candles_1h and candles_1d (and candles_<symbol>_<resolution> for
+-- the pairs of a watchlist).
+CREATE TABLE IF NOT EXISTS candles_1m (
+	bucket TIMESTAMP PRIMARY KEY,
+	open DOUBLE PRECISION NOT NULL,
+	high DOUBLE PRECISION NOT NULL,
+	low DOUBLE PRECISION NOT NULL,
+	close DOUBLE PRECISION NOT NULL,
+	volume DOUBLE PRECISION NOT NULL,
+	trades_count BIGINT NOT NULL,
+	signed_volume DOUBLE PRECISION NOT NULL,
+	first_trade_id BIGINT NOT NULL,
+	last_trade_id BIGINT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS candles_1h (LIKE candles_1m INCLUDING ALL);
+CREATE TABLE IF NOT EXISTS candles_1d (LIKE candles_1m INCLUDING ALL);
+
+-- One-off population of the rollups from trades loaded before they existed
+-- (repeat with date_trunc('hour') / date_trunc('day') for candles_1h / candles_1d):
+-- INSERT INTO candles_1m
+-- SELECT
+--     date_trunc('minute', time),
+--     (ARRAY_AGG(price ORDER BY trade_id ASC))[1],
+--     MAX(price),
+--     MIN(price),
+--     (ARRAY_AGG(price ORDER BY trade_id DESC))[1],
+--     SUM(quantity),
+--     COUNT(*),
+--     SUM(CASE WHEN order_type = 'Buy' THEN quantity ELSE -quantity END),
+--     MIN(trade_id),
+--     MAX(trade_id)
+-- FROM trades
+-- GROUP BY 1
+-- ON CONFLICT (bucket) DO NOTHING;
+
+-- When a watchlist of symbols is configured, each pair is stored in its own
+-- trades_<symbol> table with the same layout and partitioning, which the
+-- loader creates on the pair's first load as:
+-- CREATE TABLE IF NOT EXISTS trades_ethusdt (LIKE trades INCLUDING ALL)
+--     PARTITION BY RANGE (time);
@@ -0,0 +1,221 @@
+from typing import Callable, Hashable, Iterator, List, Tuple, Union
+import datetime as dt
+import hashlib
+import os
+import pickle
+import zlib
+import pandas as pd
+from utils import get_logger, naive_utc
+logger = get_logger("analytics_cache")
+
+HOUR = pd.Timedelta(1, "h")
+# Pieces end one millisecond before the next one starts (trade times are in ms).
+TICK = pd.Timedelta(1, "ms")
+
+Bounds = Tuple[pd.Timestamp, pd.Timestamp]
+
+def hour_pieces(start_time: dt.datetime, end_time: dt.datetime) -> List[Tuple[pd.Timestamp, pd.Timestamp, bool]]:
+    """
+
+    Split an inclusive time range at every full hour.
+
+
+    Args:
+        start_time: Start of the range (inclusive), naive UTC or timezone-aware.
+        end_time: End of the range (inclusive).
+
+
+    Returns:
+        List of (start, end, whole) tuples of naive UTC timestamps, where whole
+        tells whether the piece covers its entire hour.
+    """
+    start, end = naive_utc(start_time), naive_utc(end_time)
+    pieces = []
+    cursor = start
+    while cursor <= end:
+        hour_end = cursor.floor("h") + HOUR
+        piece_end = min(hour_end - TICK, end)
+        whole = cursor == hour_end - HOUR and piece_end == hour_end - TICK
+        pieces.append((cursor, piece_end, whole))
+        cursor = hour_end
+
+    return pieces
+
+def _entry(directory: str, hour: pd.Timestamp) -> str:
+    return os.path.join(directory, f"{hour:%Y%m%d%H}.pkl.z")
+
+def _digest(params: Hashable) -> str:
+    return hashlib.sha1(repr(params).encode()).hexdigest()[:16]
+
+
+class PartialCache:
+    """
+
+    Persistent, size-bounded cache of per-hour partial results.
+
+    Analyses whose partial results merge exactly (lag sums, histograms) are
+    computed hour by hour: `partials` returns the cached hours of a range and
+    only computes the missing ones, so sliding a window by one hour
+    costs a single hour of new work. Entries are compressed pickles stored under
+    `path`, one file per hour, and the least recently used ones are deleted once
+    the cache grows beyond `max_bytes`.
+
+
+    Args:
+        path: Directory of the cache, created when missing.
+        max_bytes: Size above which the least recently used entries are evicted.
+    """
+    def __init__(self, path: str, max_bytes: int = 256 * 2 ** 20):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def partials(self, kind: str, params: Hashable, start_time: dt.datetime, end_time: dt.datetime,
+                 compute: Callable[[List[Bounds]], List[object]],
+                 complete_before: Union[dt.datetime, None] = None) -> List[object]:
+        """
+
+        Return the partial results of every hour piece of a time range.
+
+
+        Args:
+            kind: Name of the analysis (e.g. "correlations").
+            params: Parameters the partial results depend on, e.g. the source and
+                the maximum lag. Their repr must be stable across processes.
+            start_time: Start of the range (inclusive).
+            end_time: End of the range (inclusive).
+            compute: Called with the inclusive (start, end) bounds of the missing
+                pieces, returns (or yields, to stream them) their partial results
+                in the same order. Each run of consecutive missing pieces is
+                computed in one call.
+            complete_before: Time up to which the data is known to be fully
+                loaded. Only whole hours ending by then are cached; when None
+                nothing is cached.
+
+
+        Returns:
+            Partial results of the pieces of `hour_pieces(start_time, end_time)`,
+            in time order.
+        """
+        pieces = self.iter_partials(
+            kind, params, start_time, end_time, compute, complete_before, batch_size=None
+        )
+        return [value for _, value in pieces]
+
+    def iter_partials(self, kind: str, params: Hashable, start_time: dt.datetime, end_time: dt.datetime,
+                      compute: Callable[[List[Bounds]], List[object]],
+                      complete_before: Union[dt.datetime, None] = None,
+                      batch_size: Union[int, None] = 1) -> Iterator[Tuple[Bounds, object]]:
+        """
+
+        Same as `partials`, but yield the partial results one piece at a time,
+        in time order, as soon as they are read or computed.
+
+        Callers can show progress and merge results as they arrive, and stop
+        early by closing the iterator; the pieces computed so far stay cached.
+        When `compute` yields its results, each piece is passed on as soon as it
+        is done rather than once its whole batch is, and closing the iterator
+        closes `compute`'s.
+
+
+        Args:
+            batch_size: Most consecutive missing pieces passed to a single
+                `compute` call (unlimited when None), e.g. the number of workers
+                `compute` runs them on.
+
+
+        Returns:
+            Iterator of ((start, end), partial result) tuples.
+        """
+        directory = os.path.join(self.path, kind, _digest(params))
+        limit = naive_utc(complete_before) if complete_before is not None else None
+        pieces = hour_pieces(start_time, end_time)
+        cacheable = [whole and limit is not None and start + HOUR <= limit for start, _, whole in pieces]
+
+        pending: List[int] = []
+        computed = 0
+
+        def flush():
+            nonlocal computed
+            batch = list(pending)
+            pending.clear()
+            values = compute([pieces[i][:2] for i in batch])
+            streamed = isinstance(values, Iterator)
+            if not streamed:
+                # Already computed: cache them all, even if the caller stops midway.
+                values = list(values)
+                computed += len(values)
+                for i, value in zip(batch, values):
+                    if cacheable[i]:
+                        self._put(directory, pieces[i][0], value)
+            try:
+                for i, value in zip(batch, values):
+                    if streamed:
+                        computed += 1
+                        if cacheable[i]:
+                            self._put(directory, pieces[i][0], value)
+                    yield pieces[i][:2], value
+            finally:
+                if streamed and hasattr(values, "close"):
+                    values.close()
+
+        try:
+            for i, (start, _, _) in enumerate(pieces):
+                value = self._get(directory, start) if cacheable[i] else None
+                if value is None:
+                    pending.append(i)
+                    if batch_size is not None and len(pending) >= batch_size:
+                        yield from flush()
+                    continue
+                if pending:
+                    yield from flush()
+                yield pieces[i][:2], value
+            if pending:
+                yield from flush()
+        finally:
+            logger.info(f"{kind}: {len(pieces)} pieces, {computed} computed")
+            if computed:
+                self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+    def _get(self, directory: str, hour: pd.Timestamp):
+        path = _entry(directory, hour)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.loads(zlib.decompress(f.read()))
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+            logger.warning(f"Ignoring unreadable cache entry {path}")
+            return None
+
+        return value
+
+    def _put(self, directory: str, hour: pd.Timestamp, value: object):
+        os.makedirs(directory, exist_ok=True)
+        path = _entry(directory, hour)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+        os.replace(temporary, path)
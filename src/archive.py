@@ -0,0 +1,139 @@
+from typing import Dict, Iterator, List, Union
+import datetime as dt
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
+from transform import as_float
+from utils import get_logger, naive_utc
+logger = get_logger("archive")
+
+RAW = "raw"
+TRADES = "trades"
+# Hive-style directories: <root>/<dataset>/symbol=BTCUSDT/date=2026-03-01/
+PARTITIONING = ds.partitioning(
+    pa.schema([("symbol", pa.string()), ("date", pa.string())]), flavor="hive"
+)
+
+def write_archive(raw: Union[pd.DataFrame, None], transformed: pd.DataFrame, root: str, symbol: str,
+                  scales: Union[Dict[str, int], None] = None):
+    """
+
+    Write a batch of trades to the local Parquet archive.
+
+    The raw rows (as returned by the Binance API) and the transformed columns are
+    stored as two datasets under `root`, each partitioned by symbol and UTC date.
+    Files are named after the first trade id of the batch, so writing the same
+    batch again replaces its files instead of duplicating the trades.
+
+
+    Args:
+        raw: Pandas dataframe of the aggregated trades as returned by the API,
+            or None to archive the transformed columns only.
+        transformed: Pandas dataframe of the same trades after `transform`.
+        root: Directory of the archive.
+        symbol: Trading pair symbol (e.g., "BTCUSDT").
+        scales: Decimals of the fixed-point columns of `transformed`, as passed
+            to `transform`. Those columns are stored as floats.
+    """
+    if transformed.empty:
+        return
+    trades = pd.DataFrame(
+        {
+            "trade_id": transformed["trade_id"].to_numpy(),
+            "price": as_float(transformed, "price", scales),
+            "quantity": as_float(transformed, "quantity", scales),
+            "quote_qty": as_float(transformed, "quote_qty", scales),
+            "time": transformed["time"].to_numpy(),
+            "order_type": transformed["order_type"].astype(str).to_numpy(),
+            "sign": np.where((transformed["order_type"] == "Sell").to_numpy(), -1, 1).astype(np.int8),
+        },
+        copy=False,
+    )
+    first_id = int(trades["trade_id"].min())
+    if raw is not None and not raw.empty:
+        _write(raw, pd.to_datetime(raw["T"], unit="ms"), os.path.join(root, RAW), symbol, first_id)
+    _write(trades, trades["time"], os.path.join(root, TRADES), symbol, first_id)
+    logger.info(f"Archived {len(trades)} trades of {symbol} into {root}")
+
+def read_trades(root: str, symbol: str, start_time: dt.datetime, end_time: dt.datetime,
+                columns: List[str], chunk_rows: int = 1_000_000) -> Iterator[pd.DataFrame]:
+    """
+
+    Stream archived trades of a time range in time order.
+
+
+    Args:
+        root: Directory of the archive.
+        symbol: Trading pair symbol (e.g., "BTCUSDT").
+        start_time: Start of the range (inclusive), naive UTC or timezone-aware.
+        end_time: End of the range (inclusive).
+        columns: Columns to read, any of trade_id, price, quantity, quote_qty,
+            time, order_type and sign.
+        chunk_rows: Number of rows of each yielded dataframe (the last one may be
+            shorter).
+
+
+    Yields:
+        Pandas dataframes with the requested columns.
+
+
+    Notes:
+        Files are memory-mapped and only the requested columns are decoded. The
+        symbol/date filter prunes whole directories and the time filter is pushed
+        down to the Parquet row group statistics. Parquet files are not part of
+        the load transaction: a batch archived by a load that then failed to
+        commit is archived again by the retry, possibly under another file name.
+        Each day is therefore deduplicated on trade_id (and sorted by it) before
+        its rows are yielded.
+    """
+    path = os.path.join(root, TRADES)
+    if not os.path.isdir(path):
+        return
+    dataset = ds.dataset(
+        path, format="parquet", partitioning=PARTITIONING,
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+    start, end = naive_utc(start_time), naive_utc(end_time)
+    time = ds.field("time")
+    partitions = (
+        (ds.field("symbol") == symbol)
+        & (ds.field("date") >= start.strftime("%Y-%m-%d"))
+        & (ds.field("date") <= end.strftime("%Y-%m-%d"))
+    )
+    rows = (time >= pa.scalar(start, pa.timestamp("ms"))) & (time <= pa.scalar(end, pa.timestamp("ms")))
+
+    days = {}
+    for fragment in dataset.get_fragments(filter=partitions):
+        days.setdefault(os.path.dirname(fragment.path), []).append(fragment)
+    read = list(dict.fromkeys(["trade_id", *columns]))
+
+    # Date directories sort chronologically, and trade ids follow time within a day.
+    pending, pending_rows = [], 0
+    for day in sorted(days):
+        trades = pa.concat_tables(fragment.to_table(columns=read, filter=rows) for fragment in days[day])
+        _, first = np.unique(trades["trade_id"].to_numpy(), return_index=True)
+        trades = trades.take(first).select(columns)
+        for batch in trades.to_batches(max_chunksize=chunk_rows):
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            while pending_rows >= chunk_rows:
+                table = pa.Table.from_batches(pending)
+                yield table.slice(0, chunk_rows).to_pandas()
+                pending = table.slice(chunk_rows).to_batches()
+                pending_rows -= chunk_rows
+    if pending_rows:
+        yield pa.Table.from_batches(pending).to_pandas()
+
+def _write(df: pd.DataFrame, times: pd.Series, path: str, symbol: str, first_id: int):
+    table = pa.Table.from_pandas(
+        df.assign(symbol=symbol, date=times.dt.strftime("%Y-%m-%d").to_numpy()),
+        preserve_index=False,
+    )
+    ds.write_dataset(
+        table, path, format="parquet", partitioning=PARTITIONING,
+        basename_template=f"part-{first_id:020d}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
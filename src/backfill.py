@@ -0,0 +1,136 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Union
+import pandas as pd
+from extract import BASE_URL, BinanceSession, _process_call
+from utils import get_logger
+logger = get_logger("backfill")
+
+def backfill(symbol: str, start_id: int, end_id: int, workers: int = 4,
+             partition_size: int = 100_000, session: Union[BinanceSession, None] = None,
+             base_url: str = BASE_URL) -> pd.DataFrame:
+    """
+
+    Download a closed range of aggregated trade ids concurrently.
+
+
+    Args:
+        symbol: Trading pair symbol (e.g., "BTCUSDT").
+        start_id: First aggregated trade id to download.
+        end_id: Last aggregated trade id to download (inclusive).
+        workers: Maximum number of partitions fetched at the same time.
+        partition_size: Number of trade ids assigned to each partition.
+        session: HTTP session shared by all workers. Its rate limiter keeps the
+            combined request weight under the exchange cap. A new one with a pool
+            of `workers` connections is created when None.
+        base_url: Binance REST endpoint, overridable for tests.
+
+
+    Returns:
+        Pandas dataframe of aggregated trades as returned by the Binance API, sorted
+        by trade id.
+
+
+    Raises:
+        ValueError: If the stitched partitions overlap or leave a gap.
+    """
+    if end_id < start_id:
+        return pd.DataFrame()
+    if session is None:
+        session = BinanceSession(pool_size=workers)
+
+    partitions = partition_range(start_id, end_id, partition_size)
+    logger.info(f"Backfilling {symbol} trade ids {start_id}-{end_id} "
+                f"in {len(partitions)} partitions with {workers} workers")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pages = list(executor.map(
+            lambda bounds: _fetch_partition(symbol, bounds[0], bounds[1], session, base_url),
+            partitions
+        ))
+
+    pages = [page for page in pages if not page.empty]
+    if not pages:
+        return pd.DataFrame()
+    df = pd.concat(pages, ignore_index=True)
+    _check_contiguous(df["a"], start_id, end_id)
+
+    return df
+
+def backfill_time_range(symbol: str, start_time: int, end_time: Union[int, None] = None,
+                        trade_id: Union[int, None] = None, **kwargs) -> pd.DataFrame:
+    """
+
+    Backfill aggregated trades between two timestamps.
+
+
+    Args:
+        symbol: Trading pair symbol (e.g., "BTCUSDT").
+        start_time: Start timestamp in miliseconds.
+        end_time: End timestamp in miliseconds. Defaults to the latest trade.
+        trade_id: Start trade id, used instead of start_time when not None.
+        **kwargs: Forwarded to `backfill`.
+
+
+    Returns:
+        Pandas dataframe of aggregated trades as returned by the Binance API.
+    """
+    base_url = kwargs.get("base_url", BASE_URL)
+    if kwargs.get("session") is None:
+        kwargs["session"] = BinanceSession(pool_size=kwargs.get("workers", 4))
+    session = kwargs["session"]
+    start_id = trade_id if trade_id is not None else find_trade_id(symbol, start_time, session, base_url)
+    if end_time is None:
+        end_id = latest_trade_id(symbol, session, base_url)
+    else:
+        end_id = find_trade_id(symbol, end_time, session, base_url)
+        end_id = latest_trade_id(symbol, session, base_url) if end_id is None else end_id - 1
+    if start_id is None or end_id is None:
+        return pd.DataFrame()
+
+    return backfill(symbol, start_id, end_id, **kwargs)
+
+def partition_range(start_id: int, end_id: int, partition_size: int) -> List[Tuple[int, int]]:
+    """Split the closed range [start_id, end_id] into disjoint, ordered partitions."""
+    return [
+        (lo, min(lo + partition_size - 1, end_id))
+        for lo in range(start_id, end_id + 1, partition_size)
+    ]
+
+def find_trade_id(symbol: str, timestamp: int, session: BinanceSession,
+                  base_url: str = BASE_URL) -> Union[int, None]:
+    """Return the first aggregated trade id at or after timestamp."""
+    response = session.get(f"{base_url}/api/v3/aggTrades?symbol={symbol}&startTime={timestamp}&limit=1")
+    response.raise_for_status()
+    data = response.json()
+
+    return data[0]["a"] if data else None
+
+def latest_trade_id(symbol: str, session: BinanceSession,
+                    base_url: str = BASE_URL) -> Union[int, None]:
+    """Return the most recent aggregated trade id."""
+    response = session.get(f"{base_url}/api/v3/aggTrades?symbol={symbol}&limit=1")
+    response.raise_for_status()
+    data = response.json()
+
+    return data[-1]["a"] if data else None
+
+def _fetch_partition(symbol: str, lo: int, hi: int, session: BinanceSession,
+                     base_url: str) -> pd.DataFrame:
+    pages = []
+    trade_id = lo
+    while trade_id <= hi:
+        limit = min(1000, hi - trade_id + 1)
+        url = f"{base_url}/api/v3/aggTrades?symbol={symbol}&fromId={trade_id}&limit={limit}"
+        page, _, trade_id = _process_call(url, session)
+        if page.empty:
+            break
+        pages.append(page[page["a"] <= hi])
+
+    if not pages:
+        return pd.DataFrame()
+    return pd.concat(pages, ignore_index=True)
+
+def _check_contiguous(ids: pd.Series, start_id: int, end_id: int):
+    if not ids.is_monotonic_increasing or ids.duplicated().any():
+        raise ValueError("Backfill partitions overlap")
+    if ids.iloc[0] != start_id or ids.iloc[-1] - ids.iloc[0] + 1 != len(ids):
+        raise ValueError(f"Backfill left a gap between trade ids {start_id} and {end_id}")
@@ -0,0 +1,457 @@
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor
+import datetime as dt
+import os
+import threading
+import numpy as np
+import pandas as pd
+from fetch import fetch_signed_trades
+from utils import get_engine
+
+SERIES = ("sign", "size", "cross", "returns")
+# Sums and pair counts of every series, plus their first and last values.
+Partial = Dict[str, object]
+Source = Callable[[pd.Timestamp, pd.Timestamp], Iterable[pd.DataFrame]]
+
+# Smallest FFT used by the overlap-save blocks; larger lags get larger blocks.
+MIN_FFT_SIZE = 8192
+
+# Series multiplied together, as (leading, lagging) names.
+TRADE_PAIRS = (("sign", "sign"), ("size", "size"), ("sign", "size"))
+RETURN_PAIRS = (("returns", "returns"),)
+# Rows processed per accumulator update, bounding the size of its buffers.
+ACCUMULATOR_ROWS = 1 << 18
+
+_local = threading.local()
+
+def lag_sums(x: np.ndarray, y: np.ndarray, history: np.ndarray, k_max: int) -> np.ndarray:
+    """
+
+    Sum the lagged products of a chunk of two series with FFT overlap-save.
+
+
+    Args:
+        x: Chunk of the leading series.
+        y: Chunk of the lagging series, aligned with x.
+        history: Values of the lagging series preceding the chunk (at most the
+            last k_max are used), empty for the first chunk.
+        k_max: Largest lag.
+
+
+    Returns:
+        Array whose element i-1 is sum(x[t] * y[t - i]) over every t of the chunk
+        and every lag i in 1..k_max, with y[t - i] taken from `history` when it
+        precedes the chunk. Pairs reaching further back than the history are left
+        out, so each pair of a series is counted exactly once when the chunks are
+        processed in order with the previous values as history.
+
+
+    Notes:
+        The chunk is cut into blocks of B values and each block is correlated with
+        the k_max + B lagging values ending at it through one FFT of size
+        L >= B + k_max. All blocks are transformed at once and their spectra are
+        summed before a single inverse FFT, so the cost is O(N log L) instead of
+        the O(N * k_max) of one dot product per lag.
+    """
+    if len(x) == 0:
+        return np.zeros(k_max)
+    return _sums(*_spectra(x, y, history, k_max), k_max)
+
+def direct_lag_sums(x: np.ndarray, y: np.ndarray, history: np.ndarray, k_max: int) -> np.ndarray:
+    """Reference implementation of `lag_sums` with one dot product per lag."""
+    x = np.asarray(x, dtype=np.float64)
+    full = np.concatenate([np.asarray(history, dtype=np.float64)[-k_max:], y])
+    start = full.size - x.size
+    sums = np.zeros(k_max)
+    for i in range(1, k_max + 1):
+        skip = max(0, i - start)
+        if skip < x.size:
+            sums[i - 1] = np.dot(x[skip:], full[start + skip - i:full.size - i])
+
+    return sums
+
+def correlate_chunks(chunks: Iterable[pd.DataFrame], k_max: int, r_len: int) -> pd.DataFrame:
+    """
+
+    Compute the trade sign, size, sign-size and absolute return correlations of a
+    stream of trades.
+
+
+    Args:
+        chunks: Dataframes of consecutive trades in time order, with `sign`
+            (+1 buy, -1 sell), `quantity` and `price` columns.
+        k_max: Largest lag, in trades.
+        r_len: Number of trades each absolute log return spans.
+
+
+    Returns:
+        Pandas dataframe with one row per lag and the columns lag, autocorr_sign,
+        autocorr_size (of the signed sizes), autocorr_cross (sign at t against
+        signed size at t - lag) and autocorr_returns, each the mean lagged
+        product over every pair of the whole stream. Lags without any pair are NaN.
+    """
+    return to_frame(partial_correlations(chunks, k_max, r_len), k_max)
+
+def partial_correlations(chunks: Iterable[pd.DataFrame], k_max: int, r_len: int) -> Partial:
+    """
+
+    Accumulate the lagged product sums of a stream of trades.
+
+
+    Args:
+        chunks: Dataframes of consecutive trades in time order (see
+            `correlate_chunks`).
+        k_max: Largest lag, in trades.
+        r_len: Number of trades each absolute log return spans.
+
+
+    Returns:
+        Partial result holding the sums and pair counts of every series together
+        with their first and last values, which `merge_partials` uses to join it
+        exactly with the partial result of the trades that follow.
+    """
+    trades = _accumulator(k_max, TRADE_PAIRS)
+    returns_sums = _accumulator(k_max, RETURN_PAIRS)
+    head, tail = {}, {}
+    prices_before = np.empty(0)
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        signs = chunk["sign"].to_numpy(dtype=np.float64)
+        sizes = signs * chunk["quantity"].to_numpy(dtype=np.float64)
+        prices = chunk["price"].to_numpy(dtype=np.float64)
+        # Returns ending in this chunk may start in the previous one.
+        spanned = np.concatenate([prices_before, prices])
+        returns = np.abs(np.log(spanned[r_len:] / spanned[:max(0, spanned.size - r_len)]))
+
+        trades.update(sign=signs, size=sizes)
+        returns_sums.update(returns=returns)
+        for name, values in (("sign", signs), ("size", sizes), ("returns", returns), ("price", prices)):
+            keep = _keep(name, k_max, r_len)
+            before = head.get(name, np.empty(0))
+            if before.size < keep:
+                head[name] = np.concatenate([before, values[:keep - before.size]])
+            tail[name] = np.concatenate([tail.get(name, np.empty(0)), values[-keep:]])[-keep:]
+        prices_before = spanned[-r_len:]
+
+    if trades.count == 0:
+        return empty_partial()
+    return {
+        "n": trades.count,
+        "n_ret": returns_sums.count,
+        "sums": {
+            "sign": trades.sums[("sign", "sign")].copy(),
+            "size": trades.sums[("size", "size")].copy(),
+            "cross": trades.sums[("sign", "size")].copy(),
+            "returns": returns_sums.sums[("returns", "returns")].copy(),
+        },
+        "head": head,
+        "tail": tail,
+    }
+
+def merge_partials(first: Partial, second: Partial, k_max: int, r_len: int) -> Partial:
+    """
+
+    Join the partial results of two consecutive runs of trades.
+
+    The lagged products between the last k_max values of the first run and the
+    first k_max values of the second, and the returns spanning both runs, are
+    added, so merging the partial results of consecutive shards gives exactly the
+    partial result of a single pass over all of them.
+
+
+    Args:
+        first: Partial result of the earlier trades.
+        second: Partial result of the trades that immediately follow.
+        k_max: Largest lag, in trades.
+        r_len: Number of trades each absolute log return spans.
+
+
+    Returns:
+        Partial result of both runs.
+    """
+    if first["n"] == 0:
+        return second
+    if second["n"] == 0:
+        return first
+    before, after = first["tail"], second["head"]
+
+    # Returns whose r_len trades straddle the two runs.
+    prices = np.concatenate([before["price"], after["price"]])
+    bridge = np.abs(np.log(prices[r_len:] / prices[:max(0, prices.size - r_len)]))
+    returns_before = np.concatenate([before["returns"], bridge])[-k_max:]
+
+    sums = {name: first["sums"][name] + second["sums"][name] for name in SERIES}
+    sums["sign"] += _boundary_sums(after["sign"], before["sign"], k_max)
+    sums["size"] += _boundary_sums(after["size"], before["size"], k_max)
+    sums["cross"] += _boundary_sums(after["sign"], before["size"], k_max)
+    sums["returns"] += lag_sums(bridge, bridge, before["returns"], k_max)
+    sums["returns"] += _boundary_sums(after["returns"], returns_before, k_max)
+
+    middle = {"returns": bridge}
+    empty = np.empty(0)
+    return {
+        "n": first["n"] + second["n"],
+        "n_ret": first["n_ret"] + bridge.size + second["n_ret"],
+        "sums": sums,
+        "head": {
+            name: np.concatenate([first["head"][name], middle.get(name, empty), after[name]])[:_keep(name, k_max, r_len)]
+            for name in first["head"]
+        },
+        "tail": {
+            name: np.concatenate([before[name], middle.get(name, empty), second["tail"][name]])[-_keep(name, k_max, r_len):]
+            for name in before
+        },
+    }
+
+def empty_partial() -> Partial:
+    """Return the partial result of no trades."""
+    return {"n": 0, "n_ret": 0, "sums": {}, "head": {}, "tail": {}}
+
+def to_frame(partial: Partial, k_max: int) -> pd.DataFrame:
+    """Turn a partial result into the correlations returned by `correlate_chunks`."""
+    sums = {name: partial["sums"].get(name, np.zeros(k_max)) for name in SERIES}
+    lags = np.arange(1, k_max + 1)
+    counts = np.maximum(partial["n"] - lags, 0)
+    counts_ret = np.maximum(partial["n_ret"] - lags, 0)
+    return pd.DataFrame({
+        "lag": lags,
+        "autocorr_sign": _mean(sums["sign"], counts),
+        "autocorr_size": _mean(sums["size"], counts),
+        "autocorr_cross": _mean(sums["cross"], counts),
+        "autocorr_returns": _mean(sums["returns"], counts_ret),
+    })
+
+def shard_bounds(start_time: dt.datetime, end_time: dt.datetime,
+                 shards: int) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+    """Split an inclusive time range into consecutive, non-overlapping inclusive
+    ranges of (almost) equal length, at millisecond resolution."""
+    start, end = pd.Timestamp(start_time), pd.Timestamp(end_time)
+    edges = pd.date_range(start, end, periods=shards + 1).floor("ms")
+    return [
+        (edges[i], edges[i + 1] - pd.Timedelta(1, "ms") if i < shards - 1 else end)
+        for i in range(shards)
+    ]
+
+def parallel_correlations(source: Source, start_time: dt.datetime, end_time: dt.datetime,
+                          k_max: int, r_len: int, shards: Union[int, None] = None,
+                          workers: Union[int, None] = None) -> pd.DataFrame:
+    """
+
+    Compute the correlations of a time range (see `correlate_chunks`) on a
+    process pool, one time shard per task.
+
+
+    Args:
+        source: Picklable callable `source(start, end)` yielding the trades of an
+            inclusive time range in time order, e.g. a `functools.partial` of
+            `read_signed_trades` or `archive.read_trades`.
+        start_time: Start of the range (inclusive).
+        end_time: End of the range (inclusive).
+        k_max: Largest lag, in trades.
+        r_len: Number of trades each absolute log return spans.
+        shards: Number of time shards, four per worker by default so that
+            busier hours do not leave the other workers idle.
+        workers: Number of worker processes, one per CPU by default.
+
+
+    Returns:
+        Pandas dataframe of correlations, identical (up to floating point
+        rounding) to a single pass over the whole range.
+    """
+    workers = workers or os.cpu_count() or 1
+    bounds = shard_bounds(start_time, end_time, shards or 4 * workers)
+
+    total = empty_partial()
+    for partial in shard_partials(source, bounds, k_max, r_len, workers):
+        total = merge_partials(total, partial, k_max, r_len)
+
+    return to_frame(total, k_max)
+
+def shard_partials(source: Source, bounds: List[Tuple[pd.Timestamp, pd.Timestamp]],
+                   k_max: int, r_len: int, workers: Union[int, None] = None) -> List[Partial]:
+    """
+
+    Compute the partial results of consecutive time shards on a process pool.
+
+
+    Args:
+        source: Picklable callable yielding the trades of a time range (see
+            `parallel_correlations`).
+        bounds: Inclusive (start, end) time range of every shard.
+        k_max: Largest lag, in trades.
+        r_len: Number of trades each absolute log return spans.
+        workers: Number of worker processes, one per CPU by default. With a
+            single worker (or shard) everything runs in this process.
+
+
+    Returns:
+        Partial results of the shards, in the order of `bounds`.
+    """
+    return list(iter_shard_partials(source, bounds, k_max, r_len, workers))
+
+def iter_shard_partials(source: Source, bounds: List[Tuple[pd.Timestamp, pd.Timestamp]],
+                        k_max: int, r_len: int, workers: Union[int, None] = None) -> Iterator[Partial]:
+    """Same as `shard_partials`, but yield each partial result as soon as it and
+    those of the shards before it are done. Closing the iterator cancels the
+    shards not started yet."""
+    if not bounds:
+        return
+    workers = min(workers or os.cpu_count() or 1, len(bounds))
+    if workers == 1:
+        for start, end in bounds:
+            yield _shard_partial(source, start, end, k_max, r_len)
+        return
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [pool.submit(_shard_partial, source, start, end, k_max, r_len) for start, end in bounds]
+        for future in futures:
+            yield future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def read_signed_trades(db_url: str, start_time: dt.datetime, end_time: dt.datetime,
+                       chunk_rows: int = 1_000_000, table: str = "trades") -> Iterator[pd.DataFrame]:
+    """Stream the time, price, sign and quantity of the trades of an inclusive
+    time range from the database, in time order (see `fetch.fetch_signed_trades`)."""
+    yield from fetch_signed_trades(get_engine(db_url), start_time, end_time, chunk_rows, table)
+
+def _shard_partial(source: Source, start: pd.Timestamp, end: pd.Timestamp,
+                   k_max: int, r_len: int) -> Partial:
+    return partial_correlations(source(start, end), k_max, r_len)
+
+def _accumulator(k_max: int, pairs: Tuple[Tuple[str, str], ...]) -> "LagAccumulator":
+    """Return this thread's reset accumulator for the pairs, reusing its buffers
+    across shards and requests while k_max does not change."""
+    accumulators = _local.__dict__.setdefault("accumulators", {})
+    accumulator = accumulators.get(pairs)
+    if accumulator is None or accumulator.k_max != k_max:
+        accumulator = accumulators[pairs] = LagAccumulator(k_max, pairs)
+    accumulator.reset()
+
+    return accumulator
+
+def _keep(name: str, k_max: int, r_len: int) -> int:
+    """Number of first/last values of a series a partial result keeps."""
+    return r_len if name == "price" else k_max
+
+def _boundary_sums(x_head: np.ndarray, y_before: np.ndarray, k_max: int) -> np.ndarray:
+    """Sum the lagged products of the first values of x with the values of y that
+    precede them (the last one of `y_before` being one step before x[0])."""
+    sums = np.zeros(k_max)
+    if x_head.size and y_before.size:
+        products = np.convolve(x_head[:k_max], y_before[::-1][:k_max])[:k_max]
+        sums[:products.size] = products
+
+    return sums
+
+def _block(k_max: int):
+    """Return the FFT size and the number of leading values per block for k_max."""
+    size = max(MIN_FFT_SIZE, 1 << (4 * k_max - 1).bit_length())
+    return size, size - k_max
+
+def _spectra(x: np.ndarray, y: np.ndarray, history: np.ndarray, k_max: int):
+    """Return the per-block spectra of the leading blocks of x and of their y windows."""
+    size, block = _block(k_max)
+    n = len(x)
+    blocks = -(-n // block)
+    history = np.asarray(history, dtype=np.float64)[-k_max:]
+
+    leading = np.zeros(blocks * block)
+    leading[:n] = x
+    # The lagging series starts k_max values before the chunk, zero-padded when
+    # there is less history than that.
+    lagging = np.zeros(k_max + blocks * block)
+    lagging[k_max - history.size:k_max] = history
+    lagging[k_max:k_max + n] = y
+    windows = np.lib.stride_tricks.sliding_window_view(lagging, k_max + block)[::block]
+
+    x_spectra = np.fft.rfft(leading.reshape(blocks, block), size)
+    y_spectra = np.fft.rfft(windows, size)
+    return x_spectra, y_spectra
+
+def _sums(x_spectra: np.ndarray, y_spectra: np.ndarray, k_max: int) -> np.ndarray:
+    # Correlation at offset d pairs x[t] with window[t + d], i.e. with lag k_max - d.
+    correlation = np.fft.irfft((x_spectra.conj() * y_spectra).sum(axis=0), x_spectra.shape[1] * 2 - 2)
+    return correlation[:k_max][::-1].copy()
+
+def _mean(sums: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    return np.divide(sums, counts, out=np.full(sums.size, np.nan), where=counts > 0)
+
+
+class LagAccumulator:
+    """
+
+    Streaming sums of the lagged products of one or more pairs of series.
+
+    Consecutive chunks of the series are fed to `update`; the last k_max values of
+    every lagging series are kept between calls, so each pair of values is counted
+    exactly once whatever the chunking. Sums are accumulated in float64 with FFT
+    overlap-save (see `lag_sums`), and the block buffers are allocated once and
+    reused by every update and after `reset`.
+
+
+    Args:
+        k_max: Largest lag.
+        pairs: (leading, lagging) series names, e.g. ("sign", "size") sums
+            sign[t] * size[t - lag].
+        rows: Rows processed per block pass; longer chunks are split.
+
+
+    Attributes:
+        sums: Array of the lagged product sums of each pair, indexed by lag - 1.
+        count: Number of values fed so far.
+    """
+    def __init__(self, k_max: int, pairs: Iterable[Tuple[str, str]], rows: int = ACCUMULATOR_ROWS):
+        self.k_max = k_max
+        self.pairs = tuple(pairs)
+        self._size, self._block = _block(k_max)
+        blocks = -(-rows // self._block)
+        self._rows = blocks * self._block
+        self._leading = {x: np.zeros((blocks, self._block)) for x, _ in self.pairs}
+        # The first k_max values hold the end of the previous chunk.
+        self._lagging = {y: np.zeros(k_max + self._rows) for _, y in self.pairs}
+        self.sums = {pair: np.zeros(k_max) for pair in self.pairs}
+        self.count = 0
+
+    def reset(self):
+        """Forget every value fed so far, keeping the buffers."""
+        for sums in self.sums.values():
+            sums[:] = 0.0
+        for buffer in self._lagging.values():
+            buffer[:self.k_max] = 0.0
+        self.count = 0
+
+    def update(self, **series: np.ndarray):
+        """Add the next values of every series, passed by name as equal-length arrays."""
+        n = len(next(iter(series.values())))
+        for start in range(0, n, self._rows):
+            self._update({name: values[start:start + self._rows] for name, values in series.items()})
+
+    def lag_counts(self) -> np.ndarray:
+        """Return the number of pairs of each lag."""
+        return np.maximum(self.count - np.arange(1, self.k_max + 1), 0)
+
+    def _update(self, series: Dict[str, np.ndarray]):
+        k_max, block = self.k_max, self._block
+        n = len(next(iter(series.values())))
+        used = -(-n // block) * block
+
+        x_spectra = {}
+        for name, buffer in self._leading.items():
+            flat = buffer.reshape(-1)
+            flat[:n] = series[name]
+            flat[n:used] = 0.0
+            x_spectra[name] = np.fft.rfft(buffer[:used // block], self._size)
+        y_spectra = {}
+        for name, buffer in self._lagging.items():
+            buffer[k_max:k_max + n] = series[name]
+            buffer[k_max + n:k_max + used] = 0.0
+            windows = np.lib.stride_tricks.sliding_window_view(buffer[:k_max + used], k_max + block)[::block]
+            y_spectra[name] = np.fft.rfft(windows, self._size)
+
+        for x, y in self.pairs:
+            self.sums[(x, y)] += _sums(x_spectra[x], y_spectra[y], k_max)
+        for buffer in self._lagging.values():
+            buffer[:k_max] = buffer[n:n + k_max]
+        self.count += n
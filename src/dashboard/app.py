@@ -1,5 +1,10 @@
+import sys
+from pathlib import Path
 import streamlit as st
 
+# Make the ETL modules (archive, ...) importable from the pages.
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
 page_0 = st.Page("pages/page_0.py", title=":house_with_garden: Homepage")
 page_1 = st.Page("pages/page_1.py", title=":chart_with_upwards_trend: Market Overview")
 page_2 = st.Page("pages/page_2.py", title=":chart_with_downwards_trend: Correlations")
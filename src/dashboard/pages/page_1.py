@@ -1,9 +1,11 @@
-import sqlalchemy as sa
 import streamlit as st
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import pandas as pd
 import datetime as dt
+import time
+from downsample import downsample_candles, lttb, min_max
+from utils import get_engine
 
 INTERVAL_OPTIONS = {
         "Hourly": "hour",
@@ -61,7 +63,19 @@ MAX_RANGE = dt.timedelta(days=180)
 if end_time - start_time > MAX_RANGE:
     st.warning("Selected range is very large and may be slow.")
 
-engine = sa.create_engine(st.secrets["db_url"])
+engine = get_engine(st.secrets["db_url"], **st.secrets.get("db_pool", {}))
+
+# Points sent per trace, about the width of a chart in pixels.
+MAX_POINTS = st.secrets.get("max_points", 1000)
+
+# Coarsest candle rollup (maintained by the ETL loader) whose buckets nest
+# exactly into each chart interval.
+ROLLUP_TABLES = {
+        "hour": "candles_1h",
+        "day": "candles_1d",
+        "week": "candles_1d",
+        "month": "candles_1d",
+}
 
 def build_candles_query(
         interval: str,
@@ -70,21 +84,16 @@ def build_candles_query(
 ) -> str:
     return f"""
     SELECT
-        date_trunc('{interval}', time)           AS time_interval,
-        (ARRAY_AGG(price ORDER BY time ASC))[1]  AS open,
-        MAX(price)                               AS high,
-        MIN(price)                               AS low,
-        (ARRAY_AGG(price ORDER BY time DESC))[1] AS close,
-        SUM(quantity)                            AS volume,
-        COUNT(*)                                 AS trades_count,
-        SUM(
-            CASE 
-                WHEN order_type = 'Buy' THEN quantity
-                WHEN order_type = 'Sell' THEN -quantity
-            END
-        )                                        AS signed_volume
-    FROM trades
-    WHERE time BETWEEN '{start_time}' AND '{end_time}'
+        date_trunc('{interval}', bucket)            AS time_interval,
+        (ARRAY_AGG(open ORDER BY bucket ASC))[1]    AS open,
+        MAX(high)                                   AS high,
+        MIN(low)                                    AS low,
+        (ARRAY_AGG(close ORDER BY bucket DESC))[1]  AS close,
+        SUM(volume)                                 AS volume,
+        SUM(trades_count)                           AS trades_count,
+        SUM(signed_volume)                          AS signed_volume
+    FROM {ROLLUP_TABLES[interval]}
+    WHERE bucket BETWEEN '{start_time}' AND '{end_time}'
     GROUP BY time_interval
     ORDER BY time_interval;
     """
@@ -94,18 +103,32 @@ def load_candles(interval, start_time, end_time):
     query = build_candles_query(interval, start_time, end_time)
     return pd.read_sql(query, engine)
 
+def show(figure, total: int):
+    """Render a figure with its number of points and the server-side render time,
+    spent serializing the figure and enqueueing it to the browser (the browser's
+    paint time cannot be measured from here)."""
+    points = sum(len(trace.x) for trace in figure.data)
+    start = time.perf_counter()
+    st.plotly_chart(figure)
+    elapsed = time.perf_counter() - start
+    st.caption(f"{points:,} of {total:,} points, rendered and enqueued in {elapsed * 1000:,.0f} ms")
+
 if st.button("Run analysis"):
     df = load_candles(interval, start_time, end_time)
+    # Merged candles keep the extremes of the candles they replace.
+    candles = downsample_candles(df, MAX_POINTS, time_column="time_interval")
+    # Candles drawn as a volume bar (red or green), the others have no bar.
+    moved = int((df.close != df.open).sum())
 
     figure = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.7, 0.3])
 
     figure.add_trace(
             go.Candlestick(
-                x=df.time_interval,
-                open=df.open, 
-                high=df.high, 
-                low=df.low,
-                close=df.close,
+                x=candles.time_interval,
+                open=candles.open,
+                high=candles.high,
+                low=candles.low,
+                close=candles.close,
                 showlegend=False,
                 increasing_line_color='#26a69a',
                 decreasing_line_color='#ef5350'
@@ -114,13 +137,13 @@ if st.button("Run analysis"):
             col=1
     )
 
-    green_volume_df = df[df['close'] > df['open']]
-    red_volume_df = df[df['close'] < df['open']]
+    green_candles = candles[candles['close'] > candles['open']]
+    red_candles = candles[candles['close'] < candles['open']]
 
     figure.add_trace(
             go.Bar(
-                x=red_volume_df.time_interval,
-                y=red_volume_df.volume,
+                x=red_candles.time_interval,
+                y=red_candles.volume,
                 showlegend=False,
                 marker_color='#ef5350'
             ),
@@ -130,8 +153,8 @@ if st.button("Run analysis"):
 
     figure.add_trace(
             go.Bar(
-                x=green_volume_df.time_interval,
-                y=green_volume_df.volume,
+                x=green_candles.time_interval,
+                y=green_candles.volume,
                 showlegend=False,
                 marker_color='#26a69a'
             ),
@@ -145,14 +168,17 @@ if st.button("Run analysis"):
     figure.update_xaxes(title_text='Date', row=2)
 
     st.subheader(f"{interval_label} Candlesticks")
-    st.plotly_chart(figure)
+    show(figure, len(df) + moved)
+
+    volume = df.iloc[min_max(df.volume.to_numpy(), MAX_POINTS)]
+    counts = df.iloc[lttb(df.time_interval.to_numpy(), df.trades_count.to_numpy(), MAX_POINTS)]
 
     figure = make_subplots(specs=[[{"secondary_y": True}]])
 
     figure.add_trace(
             go.Bar(
-                x=df.time_interval,
-                y=df.volume,
+                x=volume.time_interval,
+                y=volume.volume,
                 name="Trade Volume",
                 marker_color="blue",
                 zorder=1
@@ -162,8 +188,8 @@ if st.button("Run analysis"):
 
     figure.add_trace(
             go.Scatter(
-                x=df.time_interval,
-                y=df.trades_count,
+                x=counts.time_interval,
+                y=counts.trades_count,
                 mode="lines",
                 name="Trade Count",
                 marker_color="red",
@@ -179,9 +205,15 @@ if st.button("Run analysis"):
     figure.update_xaxes(title_text="Date")
 
     st.subheader(f"{interval_label} Trade Volume and Counts")
-    st.plotly_chart(figure)
+    show(figure, 2 * len(df))
 
 
+    delta = df.signed_volume / df.volume
+    green_volume_df = df[df['close'] > df['open']]
+    red_volume_df = df[df['close'] < df['open']]
+    green_volume_df = green_volume_df.iloc[min_max(delta[green_volume_df.index].to_numpy(), MAX_POINTS // 2)]
+    red_volume_df = red_volume_df.iloc[min_max(delta[red_volume_df.index].to_numpy(), MAX_POINTS // 2)]
+
     figure = make_subplots()
 
     figure.add_trace(
@@ -208,4 +240,4 @@ if st.button("Run analysis"):
     figure.update_xaxes(title_text="Date")
 
     st.subheader(f"{interval_label} Delta Volume Normalized")
-    st.plotly_chart(figure)
+    show(figure, moved)
@@ -1,13 +1,15 @@
-import sqlalchemy as sa
 import streamlit as st
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import pandas as pd
-import numpy as np
 import datetime as dt
-from collections.abc import Iterator
-
-CHUNK_SIZE = 1000000
+import os
+import time
+from analytics_cache import PartialCache, hour_pieces
+from correlations import empty_partial, iter_shard_partials, merge_partials, to_frame
+from precompute import ANALYSIS_PRESETS, K_MAX, R_LEN, trade_source
+from rollups import loaded_until
+from sql_analytics import sql_correlation_partial
+from utils import get_engine
 
 range_mode = st.radio(
     "Time range",
@@ -18,15 +20,8 @@ range_mode = st.radio(
 now = dt.datetime.now(dt.UTC).replace(minute=0, second=0, microsecond=0)
 
 if range_mode == "Preset":
-    PRESETS = {
-        "Last 6 hours": dt.timedelta(hours=6),
-        "Last 12 hours": dt.timedelta(hours=12),
-        "Last 24 hours": dt.timedelta(hours=24),
-        "Last 48 hours": dt.timedelta(hours=48)
-    }
-
-    label = st.selectbox("Preset range", PRESETS)
-    delta = PRESETS[label]
+    label = st.selectbox("Preset range", ANALYSIS_PRESETS)
+    delta = ANALYSIS_PRESETS[label]
 
     start_time = now - delta
     end_time = now
@@ -57,182 +52,68 @@ k_max = st.sidebar.slider(
     "Max lag",
     min_value=1,
     max_value=500,
-    value=100
+    value=K_MAX
 )
 
 r_len = st.sidebar.number_input(
     "Trades per return",
     min_value=1,
-    value=100,
+    value=R_LEN,
     step=1
 )
 
-engine = sa.create_engine(st.secrets["db_url"])
-
-def read_trades_in_chunks(
-        start_time: dt.datetime,
-        end_time: dt.datetime
-) -> Iterator[pd.DataFrame]:
-    query = sa.text(f"""
-        SELECT
-            time,
-            price,
-            CASE
-                WHEN order_type = 'Buy'  THEN  1
-                WHEN order_type = 'Sell' THEN -1
-            END AS sign,
-            quantity
-        FROM trades
-        WHERE time BETWEEN :start_time AND :end_time
-        ORDER BY time
-    """)
-    with engine.connect() as conn:
-        for chunk in pd.read_sql(
-            query,
-            conn,
-            params={
-                "start_time": start_time,
-                "end_time": end_time,
-            },
-            chunksize=CHUNK_SIZE,
-        ):
-            yield chunk
-
-@st.cache_data(ttl=3600)
-def load_correlations(start_time, end_time, k_max, r_len):
-    autocorr_sign = np.zeros(k_max)
-    autocorr_size = np.zeros(k_max)
-    autocorr_cross = np.zeros(k_max)
-    autocorr_returns = np.zeros(k_max)
-
-    counts = np.zeros(k_max)
-    counts_ret = np.zeros(k_max)
-
-    signs = np.empty(CHUNK_SIZE+k_max, dtype=np.float32)
-    sizes = np.empty(CHUNK_SIZE+k_max, dtype=np.float32)
-    returns = np.empty(CHUNK_SIZE+k_max-r_len, dtype=np.float32)
-    signs[:k_max] *= 0.0
-    sizes[:k_max] *= 0.0
-    returns[:k_max] *= 0.0
-
-    start = 0
-    for chunk in read_trades_in_chunks(start_time, end_time):
-        n = len(chunk)
-        n_ret = n - r_len
-
-        signs[k_max:n+k_max] = chunk["sign"].to_numpy(dtype=np.float32, copy=False)
-        sizes[k_max:n+k_max] = signs[k_max:n+k_max] * chunk["quantity"].to_numpy(dtype=np.float32, copy=False)
-
-        if n_ret > 0:
-            returns[k_max:n_ret+k_max] = np.abs(
-                    np.log(
-                        np.divide(
-                            chunk["price"].to_numpy(dtype=np.float32, copy=False)[r_len:],
-                            chunk["price"].to_numpy(dtype=np.float32, copy=False)[:-r_len]
-                        )
-                    )
-            )
-
-        for i in range(1, k_max+1):
-            autocorr_sign[i-1] += np.dot(signs[i:n+k_max], signs[:n+k_max-i])
-            autocorr_size[i-1] += np.dot(sizes[i:n+k_max], sizes[:n+k_max-i])
-            autocorr_cross[i-1] += np.dot(signs[i:n+k_max], sizes[:n+k_max-i])
-            if n_ret > k_max:
-                autocorr_returns[i-1] += np.dot(returns[i:n_ret+k_max], returns[:n_ret+k_max-i])
-            counts[i-1] += n + start*k_max - i
-            counts_ret[i-1] += n + start*k_max - i - r_len
-
-        signs[:k_max] = signs[n:n+k_max]
-        sizes[:k_max] = sizes[n:n+k_max]
-        if n_ret > 0:
-            returns[:k_max] = returns[n_ret:n_ret+k_max]
-        start = 1
-
-        del chunk
-
-    df = pd.DataFrame(
-            {
-                "lag": np.arange(1, k_max+1),
-                "autocorr_sign": autocorr_sign / counts,
-                "autocorr_size": autocorr_size / counts,
-                "autocorr_cross": autocorr_cross / counts,
-                "autocorr_returns": autocorr_returns / counts_ret
-            }
-    )
-    return df
-
-if st.button("Run analysis"):
-    df = load_correlations(start_time, end_time, k_max, r_len)
-
-    figure = make_subplots()
-
-    figure.add_trace(
-            go.Scatter(
-                x=df.lag,
-                y=df.autocorr_sign,
-                mode="markers",
-                marker_color="red"
-            )
-    )
-
-    figure.update(layout_xaxis_rangeslider_visible=False)
-    figure.update_layout(title="BTC/USDT")
-    figure.update_yaxes(title_text="Correlation")
-    figure.update_xaxes(title_text="Lag")
-    figure.update_xaxes(type="log")
-    figure.update_yaxes(type="log")
+archive_path = st.secrets.get("archive_path")
+symbol = st.secrets.get("symbol", "BTCUSDT")
 
-    st.subheader("Trade Sign Autocorrelation")
-    st.plotly_chart(figure)
+source, source_key = trade_source(st.secrets["db_url"], archive_path, symbol)
 
-    figure = make_subplots()
-
-    figure.add_trace(
-            go.Scatter(
-                x=df.lag,
-                y=df.autocorr_size,
-                mode="markers",
-                marker_color="red"
-            )
-    )
-
-    figure.update(layout_xaxis_rangeslider_visible=False)
-    figure.update_layout(title="BTC/USDT")
-    figure.update_yaxes(title_text="Correlation")
-    figure.update_xaxes(title_text="Lag")
-    figure.update_xaxes(type="log")
-    figure.update_yaxes(type="log")
-
-    st.subheader("Trade Size Autocorrelation")
-    st.plotly_chart(figure)
-
-    figure = make_subplots()
-
-    figure.add_trace(
-            go.Scatter(
-                x=df.lag,
-                y=df.autocorr_cross,
-                mode="markers",
-                marker_color="red"
-            )
-    )
-
-    figure.update(layout_xaxis_rangeslider_visible=False)
-    figure.update_layout(title="BTC/USDT")
-    figure.update_yaxes(title_text="Correlation")
-    figure.update_xaxes(title_text="Lag")
-    figure.update_xaxes(type="log")
-    figure.update_yaxes(type="log")
-
-    st.subheader("Trade Sign-Size Cross-Correlation")
-    st.plotly_chart(figure)
+# Reduce the trades inside the database and only fetch the results.
+server_side = st.secrets.get("server_side", False) and not archive_path
+engine = get_engine(st.secrets["db_url"], **st.secrets.get("db_pool", {}))
+cache = PartialCache(
+    st.secrets.get("cache_path", ".cache/analytics"),
+    max_bytes=st.secrets.get("cache_max_mb", 256) * 2 ** 20,
+)
 
+# Shortest time between two redraws of the charts while the analysis runs.
+REDRAW_SECONDS = 1.0
+
+CHARTS = {
+    "autocorr_sign": "Trade Sign Autocorrelation",
+    "autocorr_size": "Trade Size Autocorrelation",
+    "autocorr_cross": "Trade Sign-Size Cross-Correlation",
+    "autocorr_returns": "Absolute Returns Autocorrelation",
+}
+
+def iter_correlations(start_time, end_time, k_max, r_len):
+    """Yield the end of the hours processed so far and the correlations of the
+    trades up to there, one hour at a time. Hours missing from the cache are
+    computed in batches, one per worker, and passed on as soon as they are done."""
+    def compute(bounds):
+        if server_side:
+            return (sql_correlation_partial(engine, start, end, k_max, r_len) for start, end in bounds)
+        return iter_shard_partials(source, bounds, k_max, r_len)
+
+    total = empty_partial()
+    for (_, end), partial in cache.iter_partials(
+        "correlations",
+        (source_key, k_max, r_len),
+        start_time,
+        end_time,
+        compute,
+        complete_before=loaded_until(engine),
+        batch_size=os.cpu_count() or 1,
+    ):
+        total = merge_partials(total, partial, k_max, r_len)
+        yield end, total
+
+def correlation_figure(df, column):
     figure = make_subplots()
 
     figure.add_trace(
             go.Scatter(
                 x=df.lag,
-                y=df.autocorr_returns,
+                y=df[column],
                 mode="markers",
                 marker_color="red"
             )
@@ -245,5 +126,42 @@ if st.button("Run analysis"):
     figure.update_xaxes(type="log")
     figure.update_yaxes(type="log")
 
-    st.subheader("Absolute Returns Autocorrelation")
-    st.plotly_chart(figure)
+    return figure
+
+def draw(df, placeholders, key):
+    for column, placeholder in placeholders.items():
+        with placeholder.container():
+            st.subheader(CHARTS[column])
+            st.plotly_chart(correlation_figure(df, column), key=f"{column}-{key}")
+
+params = (start_time, end_time, k_max, r_len)
+run = st.button("Run analysis")
+# Pressing Cancel re-runs the page, which stops the analysis in progress.
+if run:
+    st.button("Cancel")
+progress = st.empty()
+status = st.empty()
+placeholders = {column: st.empty() for column in CHARTS}
+
+if run:
+    hours = len(hour_pieces(start_time, end_time))
+    progress.progress(0.0, text="Computing correlations...")
+    drawn = 0.0
+    for done, (covered, total) in enumerate(iter_correlations(*params), start=1):
+        progress.progress(done / hours, text=f"Trades up to {covered:%Y-%m-%d %H:%M}")
+        if done < hours and time.monotonic() - drawn < REDRAW_SECONDS:
+            continue
+        df = to_frame(total, k_max)
+        st.session_state["correlations"] = (params, df, covered, done == hours)
+        draw(df, placeholders, done)
+        drawn = time.monotonic()
+    progress.empty()
+
+if st.session_state.get("correlations", (None,))[0] == params:
+    _, df, covered, complete = st.session_state["correlations"]
+    if not run:
+        draw(df, placeholders, "saved")
+    if not complete:
+        status.info(f"Analysis cancelled, showing the trades up to {covered:%Y-%m-%d %H:%M}.")
+    elif df.drop(columns="lag").isna().any().any():
+        status.warning("The selected range has too few trades for some lags, they are left out.")
@@ -1,13 +1,15 @@
-import sqlalchemy as sa
 import streamlit as st
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import pandas as pd
 import numpy as np
 import datetime as dt
-from collections.abc import Iterator
-
-CHUNK_SIZE = 1000000
+import time
+from analytics_cache import PartialCache, hour_pieces
+from histograms import LogHistogram, empty_histograms, merge_histograms, partial_histograms
+from precompute import ANALYSIS_PRESETS, R_LEN, trade_source
+from rollups import loaded_until
+from sql_analytics import sql_histogram_partial
+from utils import get_engine
 
 range_mode = st.radio(
     "Time range",
@@ -18,15 +20,8 @@ range_mode = st.radio(
 now = dt.datetime.now(dt.UTC).replace(minute=0, second=0, microsecond=0)
 
 if range_mode == "Preset":
-    PRESETS = {
-        "Last 6 hours": dt.timedelta(hours=6),
-        "Last 12 hours": dt.timedelta(hours=12),
-        "Last 24 hours": dt.timedelta(hours=24),
-        "Last 48 hours": dt.timedelta(hours=48)
-    }
-
-    label = st.selectbox("Preset range", PRESETS)
-    delta = PRESETS[label]
+    label = st.selectbox("Preset range", ANALYSIS_PRESETS)
+    delta = ANALYSIS_PRESETS[label]
 
     start_time = now - delta
     end_time = now
@@ -63,193 +58,69 @@ bins_size = st.sidebar.slider(
 r_len = st.sidebar.number_input(
     "Trades per return",
     min_value=1,
-    value=100,
+    value=R_LEN,
     step=1
 )
 
-engine = sa.create_engine(st.secrets["db_url"])
-
-def get_bins(
-        start_time: dt.datetime,
-        end_time: dt.datetime,
-        r_len: int,
-        bins: int
-) -> dict[str, np.ndarray]:
-    query = sa.text(f"""
-        WITH cte AS (
-            SELECT
-                (LEAD(EXTRACT(EPOCH FROM time), 1) OVER (ORDER BY time) - EXTRACT(EPOCH FROM time)) * 1000 AS time_dif,
-                ABS(LN(LEAD(price, :r_len) OVER (ORDER BY time) / price)) AS returns,
-                quantity
-            FROM trades
-            WHERE time BETWEEN :start_time AND :end_time
-        )
-        SELECT
-            MIN(time_dif) AS time_dif_min,
-            MAX(time_dif) AS time_dif_max,
-            MIN(returns) AS returns_min,
-            MAX(returns) AS returns_max,
-            MIN(quantity) AS quantity_min,
-            MAX(quantity) AS quantity_max
-        FROM cte;
-    """)
-    
-    with engine.connect() as conn:
-        df = pd.read_sql(
-            query,
-            conn,
-            params={
-                "r_len": r_len,
-                "start_time": start_time,
-                "end_time": end_time,
-            }
-        )
-        return {
-                "time_dif": np.linspace(df.time_dif_min[0], df.time_dif_max[0], bins+1),
-                "returns": np.linspace(df.returns_min[0], df.returns_max[0], bins+1),
-                "quantity": np.linspace(df.quantity_min[0], df.quantity_max[0], bins+1),
-        }
-
-def read_trades_in_chunks(
-        start_time: dt.datetime,
-        end_time: dt.datetime
-) -> Iterator[pd.DataFrame]:
-    query = sa.text(f"""
-        SELECT
-            EXTRACT(EPOCH FROM time) * 1000 AS seconds,
-            price,
-            quantity
-        FROM trades
-        WHERE time BETWEEN :start_time AND :end_time
-        ORDER BY time
-    """)
-    with engine.connect() as conn:
-        for chunk in pd.read_sql(
-            query,
-            conn,
-            params={
-                "start_time": start_time,
-                "end_time": end_time,
-            },
-            chunksize=CHUNK_SIZE,
-        ):
-            yield chunk
-
-@st.cache_data(ttl=3600)
-def load_histograms(start_time, end_time, r_len, bins_size):
-    bins = get_bins(start_time, end_time, r_len, bins_size)
-
-    counts_time = np.zeros(bins_size)
-    counts_qty = np.zeros(bins_size)
-    counts_ret = np.zeros(bins_size)
-
-    time_dif = np.empty(CHUNK_SIZE-1, dtype=np.float32)
-    returns = np.empty(CHUNK_SIZE-r_len, dtype=np.float32)
-
-    hist_time = np.empty(bins_size)
-    hist_qty = np.empty(bins_size)
-    hist_ret = np.empty(bins_size)
-    for chunk in read_trades_in_chunks(start_time, end_time):
-        n = len(chunk)
-        n_ret = n - r_len
-
-        if n_ret > 0:
-            returns[:n_ret] = np.abs(
-                    np.log(
-                        np.divide(
-                            chunk["price"].to_numpy(dtype=np.float32, copy=False)[r_len:],
-                            chunk["price"].to_numpy(dtype=np.float32, copy=False)[:-r_len]
-                        )
-                    )
-            )
-            hist_ret[:], _ = np.histogram(
-                    returns[:n_ret],
-                    bins=bins["returns"]
-            )
-            counts_ret[:] += hist_ret[:]
-
-        time_dif[:n-1] = np.subtract(
-                chunk["seconds"].to_numpy(dtype=np.float64, copy=False)[1:],
-                chunk["seconds"].to_numpy(dtype=np.float64, copy=False)[:-1]
-        )
+archive_path = st.secrets.get("archive_path")
+symbol = st.secrets.get("symbol", "BTCUSDT")
 
-        hist_time[:], _ = np.histogram(
-                time_dif[:n-1],
-                bins=bins["time_dif"]
-        )
-        hist_qty[:], _ = np.histogram(
-                chunk["quantity"].to_numpy(dtype=np.float32, copy=False),
-                bins=bins["quantity"]
-        )
+source, source_key = trade_source(st.secrets["db_url"], archive_path, symbol, ("time", "price", "quantity"))
 
-        counts_time[:] += hist_time[:]
-        counts_qty[:] += hist_qty[:]
-
-        del chunk
-
-    df = pd.DataFrame(
-            {
-                "time_dif": counts_time,
-                "quantity": counts_qty,
-                "returns": counts_ret,
-            }
-    )
-    return df, bins
-
-if st.button("Run analysis"):
-    df, bins = load_histograms(start_time, end_time, r_len, bins_size)
-
-    figure = make_subplots()
-
-    bins_time = 0.5 * (bins["time_dif"][:-1] + bins["time_dif"][1:])
-    figure.add_trace(
-            go.Scatter(
-                x=bins_time,
-                y=df.time_dif,
-                mode="markers",
-                marker_color="red"
-            )
-    )
-
-    figure.update(layout_xaxis_rangeslider_visible=False)
-    figure.update_layout(title="BTC/USDT")
-    figure.update_yaxes(title_text="Count")
-    figure.update_xaxes(title_text="Time Difference ms")
-    figure.update_xaxes(type="log")
-    figure.update_yaxes(type="log")
-
-    st.subheader("Trade Time Difference Histogram")
-    st.plotly_chart(figure)
+# Reduce the trades inside the database and only fetch the results.
+server_side = st.secrets.get("server_side", False) and not archive_path
+engine = get_engine(st.secrets["db_url"], **st.secrets.get("db_pool", {}))
+cache = PartialCache(
+    st.secrets.get("cache_path", ".cache/analytics"),
+    max_bytes=st.secrets.get("cache_max_mb", 256) * 2 ** 20,
+)
 
+# Shortest time between two redraws of the charts while the analysis runs.
+REDRAW_SECONDS = 1.0
+
+# Title, x axis title and caption about the zero values of each histogram.
+CHARTS = {
+    "time_dif": (
+        "Trade Time Difference Histogram", "Time Difference ms",
+        "{} trades in the same millisecond are not shown.",
+    ),
+    "quantity": ("Trade Size Histogram", "Trade Size", None),
+    "returns": ("Absolute Logarithmic Returns Histogram", "Returns", "{} zero returns are not shown."),
+}
+
+def iter_histograms(start_time, end_time, r_len):
+    """Yield the end of the hours processed so far and the histograms of the
+    trades up to there, one hour at a time."""
+    def compute(bounds):
+        if server_side:
+            return [sql_histogram_partial(engine, start, end, r_len) for start, end in bounds]
+        return [partial_histograms(source(start, end), r_len) for start, end in bounds]
+
+    total = empty_histograms()
+    for (_, end), partial in cache.iter_partials(
+        "histograms",
+        (source_key, r_len),
+        start_time,
+        end_time,
+        compute,
+        complete_before=loaded_until(engine),
+    ):
+        total = merge_histograms(total, partial, r_len)
+        yield end, total["histograms"]
+
+def density(histogram: LogHistogram, bins: int) -> tuple[np.ndarray, np.ndarray]:
+    edges, counts = histogram.bins(bins)
+    total = max(histogram.total, 1)
+    return np.sqrt(edges[:-1] * edges[1:]), counts / (total * np.diff(edges))
+
+def histogram_figure(histogram, x_title):
     figure = make_subplots()
-    
-    bins_qty = 0.5 * (bins["quantity"][:-1] + bins["quantity"][1:])
-    figure.add_trace(
-            go.Scatter(
-                x=bins_qty,
-                y=df.quantity,
-                mode="markers",
-                marker_color="red"
-            )
-    )
 
-    figure.update(layout_xaxis_rangeslider_visible=False)
-    figure.update_layout(title="BTC/USDT")
-    figure.update_yaxes(title_text="Count")
-    figure.update_xaxes(title_text="Trade Size")
-    figure.update_xaxes(type="log")
-    figure.update_yaxes(type="log")
-
-    st.subheader("Trade Size Histogram")
-    st.plotly_chart(figure)
-
-    figure = make_subplots()
-    
-    bins_ret = 0.5 * (bins["returns"][:-1] + bins["returns"][1:])
+    bins, values = density(histogram, bins_size)
     figure.add_trace(
             go.Scatter(
-                x=bins_ret,
-                y=df.returns,
+                x=bins,
+                y=values,
                 mode="markers",
                 marker_color="red"
             )
@@ -257,10 +128,47 @@ if st.button("Run analysis"):
 
     figure.update(layout_xaxis_rangeslider_visible=False)
     figure.update_layout(title="BTC/USDT")
-    figure.update_yaxes(title_text="Count")
-    figure.update_xaxes(title_text="Returns")
+    figure.update_yaxes(title_text="Density")
+    figure.update_xaxes(title_text=x_title)
     figure.update_xaxes(type="log")
     figure.update_yaxes(type="log")
 
-    st.subheader("Absolute Logarithmic Returns Histogram")
-    st.plotly_chart(figure)
+    return figure
+
+def draw(histograms, placeholders, key):
+    for name, placeholder in placeholders.items():
+        title, x_title, zeros = CHARTS[name]
+        with placeholder.container():
+            st.subheader(title)
+            st.plotly_chart(histogram_figure(histograms[name], x_title), key=f"{name}-{key}")
+            if zeros:
+                st.caption(zeros.format(histograms[name].zeros))
+
+params = (start_time, end_time, r_len)
+run = st.button("Run analysis")
+# Pressing Cancel re-runs the page, which stops the analysis in progress.
+if run:
+    st.button("Cancel")
+progress = st.empty()
+status = st.empty()
+placeholders = {name: st.empty() for name in CHARTS}
+
+if run:
+    hours = len(hour_pieces(start_time, end_time))
+    progress.progress(0.0, text="Computing histograms...")
+    drawn = 0.0
+    for done, (covered, histograms) in enumerate(iter_histograms(*params), start=1):
+        progress.progress(done / hours, text=f"Trades up to {covered:%Y-%m-%d %H:%M}")
+        if done < hours and time.monotonic() - drawn < REDRAW_SECONDS:
+            continue
+        st.session_state["histograms"] = (params, histograms, covered, done == hours)
+        draw(histograms, placeholders, done)
+        drawn = time.monotonic()
+    progress.empty()
+
+if st.session_state.get("histograms", (None,))[0] == params:
+    _, histograms, covered, complete = st.session_state["histograms"]
+    if not run:
+        draw(histograms, placeholders, "saved")
+    if not complete:
+        status.info(f"Analysis cancelled, showing the trades up to {covered:%Y-%m-%d %H:%M}.")
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+from rollups import merge_candles
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """
+
+    Pick the points of a line that best preserve its shape, with the Largest
+    Triangle Three Buckets algorithm.
+
+    The first and last points are always kept. The others are split into
+    `points - 2` buckets of consecutive points, and each bucket keeps the point
+    forming the largest triangle with the point kept in the previous bucket and
+    the average of the next one, so peaks and troughs survive the reduction.
+
+
+    Args:
+        x: Increasing x values (numbers or datetimes).
+        y: y values.
+        points: Number of points to keep.
+
+
+    Returns:
+        Sorted indices of the kept points (all of them when there are no more
+        than `points`).
+
+
+    Raises:
+        ValueError: When fewer than 3 points are asked for a longer line.
+    """
+    n = len(y)
+    if points >= n:
+        return np.arange(n)
+    if points < 3:
+        raise ValueError("LTTB keeps at least 3 points")
+    x = _as_float(x)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+
+    edges = np.floor(np.linspace(1, n - 1, points - 1)).astype(np.int64)
+    kept = np.empty(points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < points - 1:
+            next_x, next_y = x[end:edges[i + 2]].mean(), y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        # Twice the area of the triangle (previous, candidate, next average).
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        kept[i + 1] = previous
+
+    return kept
+
+def min_max(y: np.ndarray, points: int) -> np.ndarray:
+    """
+
+    Keep the smallest and largest value of every bucket of consecutive points.
+
+    Suited to bars, whose spikes LTTB may average away.
+
+
+    Args:
+        y: Values, NaNs are ignored.
+        points: Maximum number of points to keep (two per bucket).
+
+
+    Returns:
+        Sorted, unique indices of the kept points.
+    """
+    n = len(y)
+    if points >= n:
+        return np.arange(n)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(0, n, max(points // 2, 1) + 1).astype(np.int64)
+    kept = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        bucket = y[start:end]
+        if np.isnan(bucket).all():
+            continue
+        kept.extend((start + int(np.nanargmin(bucket)), start + int(np.nanargmax(bucket))))
+
+    return np.unique(np.asarray(kept, dtype=np.int64))
+
+def downsample_candles(candles: pd.DataFrame, points: int, time_column: str = "bucket") -> pd.DataFrame:
+    """
+
+    Merge runs of consecutive candles so that at most `points` remain.
+
+    Merged candles open at the first open, close at the last close and span the
+    highest high and lowest low of their run, so price extremes stay visible;
+    volumes and counts are summed.
+
+
+    Args:
+        candles: Candles sorted by time, with the columns of a rollup table.
+        points: Maximum number of candles to keep.
+        time_column: Column holding the start time of the candles.
+
+
+    Returns:
+        Candles with the same columns, each starting at the time of the first
+        candle of its run.
+    """
+    n = len(candles)
+    if points >= n:
+        return candles
+    run = np.arange(n) * points // n
+    starts = np.searchsorted(run, run, side="left")
+    keys = pd.Series(candles[time_column].to_numpy()[starts], name=time_column, index=candles.index)
+
+    return merge_candles(candles, keys)[candles.columns]
+
+def _as_float(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
@@ -1,14 +1,79 @@
-from typing import Tuple, Union
+from typing import Iterator, List, Tuple, Union
+import json
+import re
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
 import pandas as pd
-from utils import get_logger
+from utils import get_logger, WeightLimiter
 logger = get_logger("extract")
 
-def extract(symbol: str, start_time: int, trade_id: Union[int, None] = None, 
-            end_time: Union[int, None] = None) -> pd.DataFrame:
+BASE_URL = "https://api.binance.com"
+AGG_TRADES_WEIGHT = 4
+RETRY_STATUSES = (418, 429, 500, 502, 503, 504)
+AGG_TRADE_FIELDS = ["a", "p", "q", "f", "l", "T", "m", "M"]
+_KEY = re.compile(rb'"([a-zA-Z])":')
+
+
+class _BinanceRetry(Retry):
+    # Binance sends Retry-After on 418 (IP ban) as well as on 429.
+    RETRY_AFTER_STATUS_CODES = frozenset({418, 429, 503})
+
+
+class BinanceSession(requests.Session):
+    """
+
+    Keep-alive HTTP session used for every call made to the Binance REST API.
+
+    Connections are pooled and reused between pages, transient failures
+    (418/429/5xx) are retried with exponential backoff honouring `Retry-After`, and
+    every request is metered through a shared `WeightLimiter` that is kept in sync
+    with the `X-MBX-USED-WEIGHT-1M` header returned by the exchange.
+
+
+    Args:
+        pool_size (int): Number of pooled connections kept open per host.
+        timeout (float): Default connect/read timeout in seconds.
+        retries (int): Maximum number of retries per request.
+        backoff (float): Exponential backoff factor between retries, in seconds.
+        limiter (WeightLimiter): Rate limiter shared by every user of the session.
+            A new one with the default Binance cap is created when None.
     """
-    
+    def __init__(self, pool_size: int = 10, timeout: float = 10.0, retries: int = 5,
+                 backoff: float = 0.5, limiter: Union[WeightLimiter, None] = None):
+        super().__init__()
+        retry = _BinanceRetry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({"GET"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.timeout = timeout
+        self.limiter = limiter if limiter is not None else WeightLimiter()
+
+    def request(self, method, url, *args, weight: int = AGG_TRADES_WEIGHT, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        self.limiter.acquire(weight)
+        response = super().request(method, url, *args, **kwargs)
+        used_weight = response.headers.get("X-MBX-USED-WEIGHT-1M")
+        if used_weight is not None:
+            self.limiter.sync(int(used_weight))
+
+        return response
+
+
+def extract(symbol: str, start_time: int, trade_id: Union[int, None] = None,
+            end_time: Union[int, None] = None,
+            session: Union[BinanceSession, None] = None) -> pd.DataFrame:
+    """
+
     Extract aggregated trades from Binance between a starting timestamp or trade id and
     the current timestamp.
 
@@ -17,6 +82,7 @@ def extract(symbol: str, start_time: int, trade_id: Union[int, None] = None,
         symbol: Trading pair symbol (e.g., "BTCUSDT").
         start_time: Start timestamp in miliseconds.
         trade_id: Start trade id.
+        session: HTTP session reused for every page. A new one is created when None.
 
 
     Returns:
@@ -25,29 +91,116 @@ def extract(symbol: str, start_time: int, trade_id: Union[int, None] = None,
 
     Notes:
         When trade_id is not None it is used as a starting point instead of start_time.
+        Pages are kept as separate chunks and concatenated once at the end, so the
+        cost of building the dataframe grows linearly with the size of the window.
     """
-    logger.info(f"Extracting trades for {symbol} from timestamp {start_time}")    
+    pages: List[pd.DataFrame] = list(extract_pages(symbol, start_time, trade_id, end_time, session))
+    if not pages:
+        return pd.DataFrame()
+
+    return pd.concat(pages, ignore_index=True)
+
+def extract_pages(symbol: str, start_time: int, trade_id: Union[int, None] = None,
+                  end_time: Union[int, None] = None,
+                  session: Union[BinanceSession, None] = None) -> Iterator[pd.DataFrame]:
+    """
+
+    Stream aggregated trades from Binance one page at a time.
+
+
+    Args:
+        symbol: Trading pair symbol (e.g., "BTCUSDT").
+        start_time: Start timestamp in miliseconds.
+        trade_id: Start trade id.
+        end_time: Stop paginating once a page ends at or after this timestamp.
+        session: HTTP session reused for every page. A new one is created when None.
+
+
+    Yields:
+        Pandas dataframe with the aggregated trades of a single API page (up to 1000 rows).
+    """
+    if session is None:
+        session = BinanceSession()
+    logger.info(f"Extracting trades for {symbol} from timestamp {start_time}")
     if trade_id is None:
-        url = f"https://api.binance.com/api/v3/aggTrades?symbol={symbol}&startTime={start_time}&limit=1000" 
+        url = f"{BASE_URL}/api/v3/aggTrades?symbol={symbol}&startTime={start_time}&limit=1000"
     else:
-        url = f"https://api.binance.com/api/v3/aggTrades?symbol={symbol}&fromId={trade_id}&limit=1000" 
-    df, start_time, trade_id = _process_call(url, pd.DataFrame())
+        url = f"{BASE_URL}/api/v3/aggTrades?symbol={symbol}&fromId={trade_id}&limit=1000"
+    page, start_time, trade_id = _process_call(url, session)
+    if page.empty:
+        return
+    yield page
     if end_time is None:
         end_time = time.time() * 1000
 
     while start_time < end_time:
         logger.info(f"Extracting trades for {symbol} from timestamp {start_time}")
-        url = f"https://api.binance.com/api/v3/aggTrades?symbol={symbol}&fromId={trade_id}&limit=1000" 
-        df, start_time, trade_id = _process_call(url, df)
+        url = f"{BASE_URL}/api/v3/aggTrades?symbol={symbol}&fromId={trade_id}&limit=1000"
+        page, start_time, trade_id = _process_call(url, session)
+        if page.empty:
+            return
+        yield page
 
-    return df
-
-def _process_call(url: str, df: pd.DataFrame) -> Tuple[pd.DataFrame, int, int]:
-    response = requests.get(url)
+def _process_call(url: str, session: Union[BinanceSession, None] = None
+                  ) -> Tuple[pd.DataFrame, Union[int, None], Union[int, None]]:
+    if session is None:
+        session = BinanceSession()
+    response = session.get(url)
     response.raise_for_status()
-    data = response.json()
-    df = pd.concat([df, pd.DataFrame(data)], ignore_index=True)
-    last_time = data[-1]["T"]
-    last_trade_id = data[-1]["a"] + 1
+    page = decode_agg_trades(response.content)
+    if page.empty:
+        return page, None, None
+    last_time = int(page["T"].iloc[-1])
+    last_trade_id = int(page["a"].iloc[-1]) + 1
+
+    return page, last_time, last_trade_id
+
+def decode_agg_trades(body: bytes) -> pd.DataFrame:
+    """
+
+    Decode a raw `/api/v3/aggTrades` response body into per-column arrays.
+
+
+    Args:
+        body: Raw JSON bytes of the response.
+
+
+    Returns:
+        Pandas dataframe with the a/p/q/f/l/T/m/M fields, prices and quantities
+        already parsed as float64.
+
+
+    Notes:
+        Binance serialises every trade with the same keys in the same order, so
+        the body is turned into a flat comma separated list of numbers with a few
+        bytes-level substitutions and parsed by numpy in a single C call. No
+        per-row dict is ever created. Bodies that do not have the expected layout
+        fall back to the regular JSON decoder.
+    """
+    rows = body.count(b"{")
+    if rows == 0:
+        return pd.DataFrame()
+    first = body[:body.find(b"}") + 1]
+    if _KEY.findall(first) != [field.encode() for field in AGG_TRADE_FIELDS]:
+        return pd.DataFrame(json.loads(body))
+
+    flat = body.replace(b"true", b"1").replace(b"false", b"0")
+    flat = flat.translate(None, b'"{}[]:' + "".join(AGG_TRADE_FIELDS).encode())
+    values = np.fromstring(flat, dtype=np.float64, sep=",")
+    if values.size != rows * len(AGG_TRADE_FIELDS):
+        return pd.DataFrame(json.loads(body))
+    values = values.reshape(rows, len(AGG_TRADE_FIELDS))
 
-    return df, last_time, last_trade_id
+    return pd.DataFrame(
+        {
+            "a": values[:, 0].astype(np.int64),
+            "p": np.ascontiguousarray(values[:, 1]),
+            "q": np.ascontiguousarray(values[:, 2]),
+            "f": values[:, 3].astype(np.int64),
+            "l": values[:, 4].astype(np.int64),
+            "T": values[:, 5].astype(np.int64),
+            "m": values[:, 6].astype(bool),
+            "M": values[:, 7].astype(bool),
+        },
+        copy=False,
+    )
@@ -0,0 +1,201 @@
+from typing import AsyncIterator, Callable, Dict, List, Tuple, Union
+import asyncio
+import time
+import aiohttp
+import pandas as pd
+from extract import AGG_TRADES_WEIGHT, BASE_URL, RETRY_STATUSES, decode_agg_trades
+from utils import get_logger, WeightLimiter
+logger = get_logger("extract_async")
+
+Sink = Callable[[str, pd.DataFrame], None]
+
+def extract_many(symbols: List[str], start_time: int,
+                 trade_ids: Union[Dict[str, Union[int, None]], None] = None,
+                 end_time: Union[int, None] = None, sink: Union[Sink, None] = None,
+                 limiter: Union[WeightLimiter, None] = None, pool_size: int = 10,
+                 timeout: float = 10.0, retries: int = 5, backoff: float = 0.5,
+                 base_url: str = BASE_URL, batch_size: int = 50_000,
+                 sinks: int = 5) -> Dict[str, pd.DataFrame]:
+    """
+
+    Extract aggregated trades for several trading pairs concurrently from a single
+    event loop.
+
+
+    Args:
+        symbols: Trading pair symbols (e.g., ["BTCUSDT", "ETHUSDT"]).
+        start_time: Start timestamp in miliseconds.
+        trade_ids: Start trade id per symbol. Symbols missing from the mapping (or
+            mapped to None) start from start_time.
+        end_time: Stop paginating once a page ends at or after this timestamp.
+        sink: Called as `sink(symbol, df)` with batches of at most batch_size
+            trades of a symbol, in order, in a worker thread so the next pages
+            keep downloading while it transforms and loads. When None, the
+            frames are returned.
+        limiter: Rate limiter shared by every symbol. A new one with the default
+            Binance cap is created when None.
+        pool_size: Maximum number of concurrent connections.
+        timeout: Total timeout of a single request in seconds.
+        retries: Maximum number of retries per request, on connection errors,
+            timeouts and 418/429/5xx responses.
+        backoff: Exponential backoff factor between retries, in seconds.
+        base_url: Binance REST endpoint, overridable for tests.
+        batch_size: Number of rows handed to the sink at a time. At most one
+            batch per symbol waits for the sink, so memory stays bounded whatever
+            the size of a symbol's backlog.
+        sinks: Most sink calls running at once, across all symbols. Keep it
+            within the database connection pool, or loads wait for connections.
+
+
+    Returns:
+        Dictionary mapping each symbol to its dataframe of aggregated trades as
+        returned by the Binance API. Empty when a sink is given.
+    """
+    return asyncio.run(extract_many_async(
+        symbols, start_time, trade_ids, end_time, sink, limiter, pool_size,
+        timeout, retries, backoff, base_url, batch_size, sinks
+    ))
+
+async def extract_many_async(symbols: List[str], start_time: int,
+                             trade_ids: Union[Dict[str, Union[int, None]], None] = None,
+                             end_time: Union[int, None] = None, sink: Union[Sink, None] = None,
+                             limiter: Union[WeightLimiter, None] = None, pool_size: int = 10,
+                             timeout: float = 10.0, retries: int = 5, backoff: float = 0.5,
+                             base_url: str = BASE_URL, batch_size: int = 50_000,
+                             sinks: int = 5) -> Dict[str, pd.DataFrame]:
+    """Coroutine version of `extract_many`, for callers already inside an event loop."""
+    trade_ids = trade_ids or {}
+    limiter = limiter if limiter is not None else WeightLimiter()
+    connector = aiohttp.TCPConnector(limit=pool_size)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    if end_time is None:
+        end_time = time.time() * 1000
+
+    sinking = asyncio.Semaphore(sinks)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as http:
+        async def run(symbol: str) -> Tuple[str, pd.DataFrame]:
+            pages = extract_pages_async(
+                http, symbol, start_time, trade_ids.get(symbol), end_time,
+                limiter, retries, backoff, base_url
+            )
+            if sink is not None:
+                rows = await _feed(pages, symbol, sink, batch_size, sinking)
+                logger.info(f"Extracted {rows} trades for {symbol}")
+                return symbol, pd.DataFrame()
+            frames = [page async for page in pages]
+            df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            logger.info(f"Extracted {len(df)} trades for {symbol}")
+            return symbol, df
+
+        results = await asyncio.gather(*(run(symbol) for symbol in symbols))
+
+    if sink is not None:
+        return {}
+    return dict(results)
+
+async def extract_pages_async(http: aiohttp.ClientSession, symbol: str, start_time: int,
+                              trade_id: Union[int, None], end_time: Union[int, float],
+                              limiter: WeightLimiter, retries: int = 5, backoff: float = 0.5,
+                              base_url: str = BASE_URL) -> AsyncIterator[pd.DataFrame]:
+    """
+
+    Stream the aggregated trades of one symbol page by page.
+
+
+    Args:
+        http: aiohttp session shared by every symbol.
+        symbol: Trading pair symbol (e.g., "BTCUSDT").
+        start_time: Start timestamp in miliseconds.
+        trade_id: Start trade id, used instead of start_time when not None.
+        end_time: Stop paginating once a page ends at or after this timestamp.
+        limiter: Rate limiter shared by every symbol.
+        retries: Maximum number of retries per request.
+        backoff: Exponential backoff factor between retries, in seconds.
+        base_url: Binance REST endpoint, overridable for tests.
+
+
+    Yields:
+        Pandas dataframe with the aggregated trades of a single API page.
+    """
+    logger.info(f"Extracting trades for {symbol} from timestamp {start_time}")
+    if trade_id is None:
+        url = f"{base_url}/api/v3/aggTrades?symbol={symbol}&startTime={start_time}&limit=1000"
+    else:
+        url = f"{base_url}/api/v3/aggTrades?symbol={symbol}&fromId={trade_id}&limit=1000"
+
+    while True:
+        page = decode_agg_trades(await _get_body(http, url, limiter, retries, backoff))
+        if page.empty:
+            return
+        yield page
+        if page["T"].iloc[-1] >= end_time:
+            return
+        trade_id = int(page["a"].iloc[-1]) + 1
+        url = f"{base_url}/api/v3/aggTrades?symbol={symbol}&fromId={trade_id}&limit=1000"
+
+async def _feed(pages: AsyncIterator[pd.DataFrame], symbol: str, sink: Sink, batch_size: int,
+                sinking: asyncio.Semaphore) -> int:
+    """Pass the pages of a symbol to the sink in batches of batch_size rows, each
+    batch being sunk in a worker thread (once `sinking` allows) while the next one
+    downloads."""
+    running = None
+    rows = 0
+
+    async def sink_batch(batch: pd.DataFrame):
+        async with sinking:
+            await asyncio.to_thread(sink, symbol, batch)
+
+    async def hand_over(batch: pd.DataFrame):
+        nonlocal running, rows
+        if running is not None:
+            await running
+        running = asyncio.ensure_future(sink_batch(batch))
+        rows += len(batch)
+
+    pending: List[pd.DataFrame] = []
+    buffered = 0
+    try:
+        async for page in pages:
+            pending.append(page)
+            buffered += len(page)
+            while buffered >= batch_size:
+                df = pd.concat(pending, ignore_index=True)
+                await hand_over(df.iloc[:batch_size].reset_index(drop=True))
+                pending = [df.iloc[batch_size:].reset_index(drop=True)]
+                buffered -= batch_size
+        if buffered:
+            await hand_over(pd.concat(pending, ignore_index=True))
+    finally:
+        if running is not None:
+            await running
+
+    return rows
+
+async def _get_body(http: aiohttp.ClientSession, url: str, limiter: WeightLimiter,
+                    retries: int, backoff: float) -> bytes:
+    for attempt in range(retries + 1):
+        await limiter.acquire_async(AGG_TRADES_WEIGHT)
+        try:
+            async with http.get(url) as response:
+                used_weight = response.headers.get("X-MBX-USED-WEIGHT-1M")
+                if used_weight is not None:
+                    limiter.sync(int(used_weight))
+                if response.status not in RETRY_STATUSES or attempt == retries:
+                    response.raise_for_status()
+                    return await response.read()
+                retry_after = response.headers.get("Retry-After")
+                reason = f"status {response.status}"
+        except aiohttp.ClientResponseError:
+            # An error status that is not worth retrying.
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # Connection drops, broken payloads and timeouts are retried like the sync
+            # BinanceSession does.
+            if attempt == retries:
+                raise
+            retry_after, reason = None, repr(e)
+
+        delay = float(retry_after) if retry_after is not None else backoff * 2 ** attempt
+        logger.warning(f"Request failed with {reason}, retrying in {delay}s")
+        await asyncio.sleep(delay)
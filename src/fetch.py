@@ -0,0 +1,152 @@
+from typing import Iterator, Union
+import datetime as dt
+import io
+import numpy as np
+import pandas as pd
+from sqlalchemy import DateTime, bindparam, text
+from sqlalchemy.engine.base import Connection, Engine
+from utils import get_logger, naive_utc
+logger = get_logger("fetch")
+
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+# PostgreSQL timestamps are microseconds since 2000-01-01.
+PG_EPOCH_US = 946_684_800_000_000
+
+# Layout of one row of the binary COPY of SIGNED_TRADES: a field count, then the
+# length and big-endian value of every (non-null, fixed-width) field.
+COPY_ROW = np.dtype([
+    ("fields", ">i2"),
+    ("time_len", ">i4"), ("time", ">i8"),
+    ("trade_id_len", ">i4"), ("trade_id", ">i8"),
+    ("price_len", ">i4"), ("price", ">f8"),
+    ("sign_len", ">i4"), ("sign", ">i2"),
+    ("quantity_len", ">i4"), ("quantity", ">f8"),
+])
+FIELD_SIZES = {"time": 8, "trade_id": 8, "price": 8, "sign": 2, "quantity": 8}
+
+# Casts make every field fixed-width and non-null, so a COPY row maps onto COPY_ROW.
+SIGNED_TRADES = """
+    SELECT
+        time,
+        trade_id,
+        COALESCE(CAST(price AS DOUBLE PRECISION), 'NaN') AS price,
+        CAST(CASE WHEN order_type = 'Sell' THEN -1 ELSE 1 END AS SMALLINT) AS sign,
+        COALESCE(CAST(quantity AS DOUBLE PRECISION), 'NaN') AS quantity
+    FROM {table}
+    WHERE time BETWEEN {start} AND {end}{after}
+    ORDER BY time, trade_id
+"""
+
+def fetch_signed_trades(engine: Engine, start_time: dt.datetime, end_time: dt.datetime,
+                        chunk_rows: int = 1_000_000, table: str = "trades") -> Iterator[pd.DataFrame]:
+    """
+
+    Stream the time, price, sign and quantity of the trades of an inclusive time
+    range, in time order, as typed numpy-backed chunks.
+
+    On PostgreSQL (psycopg2) every chunk is one binary `COPY ... TO STDOUT` of
+    the next `chunk_rows` trades (keyset pagination on time and trade_id), decoded
+    by `decode_copy_rows` straight into numpy arrays: no Python object is built
+    per row and NUMERIC columns are converted to float64 by the server. Other
+    databases are read through a server-side cursor in batches of `chunk_rows`.
+
+
+    Args:
+        engine: SQLAlchemy engine of the trades database.
+        start_time: Start of the range (inclusive).
+        end_time: End of the range (inclusive).
+        chunk_rows: Trades per chunk.
+        table: Trades table.
+
+
+    Returns:
+        Iterator of dataframes with `time` (datetime64[us]), `price` (float64),
+        `sign` (int8) and `quantity` (float64) columns.
+    """
+    start, end = naive_utc(start_time), naive_utc(end_time)
+    with engine.connect() as conn:
+        if conn.dialect.driver == "psycopg2":
+            yield from _copy_chunks(conn, start, end, chunk_rows, table)
+        else:
+            yield from _cursor_chunks(conn, start, end, chunk_rows, table)
+
+def decode_copy_rows(data: Union[bytes, memoryview]) -> pd.DataFrame:
+    """
+
+    Decode the binary COPY output of the SIGNED_TRADES query.
+
+
+    Args:
+        data: Whole COPY payload: header, rows and trailer.
+
+
+    Returns:
+        Dataframe with `time`, `trade_id`, `price`, `sign` and `quantity` columns
+        viewing numpy arrays decoded in bulk from the payload.
+
+
+    Raises:
+        ValueError: When the payload is not a binary COPY of rows laid out as
+            COPY_ROW (e.g. a null value or a different query).
+    """
+    data = memoryview(data)
+    if bytes(data[:len(COPY_SIGNATURE)]) != COPY_SIGNATURE:
+        raise ValueError("Not a binary COPY payload")
+    extension = int.from_bytes(data[len(COPY_SIGNATURE) + 4:len(COPY_SIGNATURE) + 8], "big")
+    body = data[len(COPY_SIGNATURE) + 8 + extension:-2]
+    if bytes(data[-2:]) != b"\xff\xff" or len(body) % COPY_ROW.itemsize:
+        raise ValueError("Binary COPY rows do not match the trades layout")
+
+    rows = np.frombuffer(body, dtype=COPY_ROW)
+    if (rows["fields"] != len(FIELD_SIZES)).any() or any(
+        (rows[f"{name}_len"] != size).any() for name, size in FIELD_SIZES.items()
+    ):
+        raise ValueError("Binary COPY rows do not match the trades layout")
+
+    return pd.DataFrame({
+        "time": (rows["time"].astype(np.int64) + PG_EPOCH_US).view("datetime64[us]"),
+        "trade_id": rows["trade_id"].astype(np.int64),
+        "price": rows["price"].astype(np.float64),
+        "sign": rows["sign"].astype(np.int8),
+        "quantity": rows["quantity"].astype(np.float64),
+    })
+
+def _copy_chunks(conn: Connection, start: pd.Timestamp, end: pd.Timestamp,
+                 chunk_rows: int, table: str) -> Iterator[pd.DataFrame]:
+    cursor = conn.connection.cursor()
+    after = ""
+    params = {"start": start.to_pydatetime(), "end": end.to_pydatetime()}
+    try:
+        while True:
+            query = SIGNED_TRADES.format(table=table, start="%(start)s", end="%(end)s", after=after)
+            query = cursor.mogrify(f"{query} LIMIT {int(chunk_rows)}", params).decode()
+            buffer = io.BytesIO()
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", buffer)
+            chunk = decode_copy_rows(buffer.getbuffer())
+            if chunk.empty:
+                return
+            yield chunk.drop(columns="trade_id")
+            if len(chunk) < chunk_rows:
+                return
+            after = " AND (time, trade_id) > (%(last_time)s, %(last_id)s)"
+            params["last_time"] = pd.Timestamp(chunk["time"].iloc[-1]).to_pydatetime()
+            params["last_id"] = int(chunk["trade_id"].iloc[-1])
+    finally:
+        cursor.close()
+
+def _cursor_chunks(conn: Connection, start: pd.Timestamp, end: pd.Timestamp,
+                   chunk_rows: int, table: str) -> Iterator[pd.DataFrame]:
+    query = text(SIGNED_TRADES.format(table=table, start=":start_time", end=":end_time", after="")).bindparams(
+        bindparam("start_time", type_=DateTime), bindparam("end_time", type_=DateTime)
+    )
+    result = conn.execution_options(stream_results=True, max_row_buffer=chunk_rows).execute(
+        query, {"start_time": start.to_pydatetime(), "end_time": end.to_pydatetime()}
+    )
+    for rows in result.partitions(chunk_rows):
+        chunk = pd.DataFrame(rows, columns=list(result.keys()))
+        yield pd.DataFrame({
+            "time": pd.to_datetime(chunk["time"], format="ISO8601").to_numpy(dtype="datetime64[us]"),
+            "price": chunk["price"].to_numpy(dtype=np.float64),
+            "sign": chunk["sign"].to_numpy(dtype=np.int8),
+            "quantity": chunk["quantity"].to_numpy(dtype=np.float64),
+        })
@@ -0,0 +1,178 @@
+from typing import Dict, Iterable, Tuple
+import numpy as np
+import pandas as pd
+
+# Fixed log grid shared by every histogram: PER_DECADE bins per power of ten
+# between 10**MIN_EXP and 10**MAX_EXP (values outside go to the edge bins).
+PER_DECADE = 200
+MIN_EXP = -12
+MAX_EXP = 12
+
+SERIES = ("time_dif", "quantity", "returns")
+# Histograms of every series, plus the first and last trades needed to merge.
+Partial = Dict[str, object]
+
+def partial_histograms(chunks: Iterable[pd.DataFrame], r_len: int) -> Partial:
+    """
+
+    Histogram inter-trade times, trade sizes and absolute returns in one pass.
+
+
+    Args:
+        chunks: Dataframes of consecutive trades in time order, with `time`,
+            `price` and `quantity` columns.
+        r_len: Number of trades each absolute log return spans.
+
+
+    Returns:
+        Partial result with a `LogHistogram` per series (`time_dif` in
+        milliseconds, `quantity` and `returns`) and the first and last trades,
+        which `merge_histograms` uses to join it exactly with the partial result
+        of the trades that follow.
+    """
+    total = empty_histograms()
+    for chunk in chunks:
+        if not chunk.empty:
+            total = merge_histograms(total, _chunk_histograms(chunk, r_len), r_len)
+
+    return total
+
+def merge_histograms(first: Partial, second: Partial, r_len: int) -> Partial:
+    """
+
+    Join the partial results of two consecutive runs of trades, adding the time
+    difference and the returns that straddle both runs.
+
+
+    Args:
+        first: Partial result of the earlier trades.
+        second: Partial result of the trades that immediately follow.
+        r_len: Number of trades each absolute log return spans.
+
+
+    Returns:
+        Partial result of both runs.
+    """
+    if first["n"] == 0:
+        return second
+    if second["n"] == 0:
+        return first
+    prices = np.concatenate([first["last_prices"], second["first_prices"]])
+    bridge = np.abs(np.log(prices[r_len:] / prices[:max(0, prices.size - r_len)]))
+
+    histograms = {
+        name: LogHistogram().merge(first["histograms"][name]).merge(second["histograms"][name])
+        for name in SERIES
+    }
+    histograms["time_dif"].add(np.array([second["first_time"] - first["last_time"]]))
+    histograms["returns"].add(bridge)
+    return {
+        "n": first["n"] + second["n"],
+        "histograms": histograms,
+        "first_time": first["first_time"],
+        "last_time": second["last_time"],
+        "first_prices": np.concatenate([first["first_prices"], second["first_prices"]])[:r_len],
+        "last_prices": np.concatenate([first["last_prices"], second["last_prices"]])[-r_len:],
+    }
+
+def empty_histograms() -> Partial:
+    """Return the partial result of no trades."""
+    return {"n": 0, "histograms": {name: LogHistogram() for name in SERIES}}
+
+def _chunk_histograms(chunk: pd.DataFrame, r_len: int) -> Partial:
+    times = chunk["time"].to_numpy(dtype="datetime64[ms]").astype(np.int64)
+    prices = chunk["price"].to_numpy(dtype=np.float64)
+    values = {
+        "time_dif": np.diff(times),
+        "quantity": chunk["quantity"].to_numpy(dtype=np.float64),
+        "returns": np.abs(np.log(prices[r_len:] / prices[:max(0, prices.size - r_len)])),
+    }
+    histograms = {name: LogHistogram() for name in SERIES}
+    for name, array in values.items():
+        histograms[name].add(array)
+
+    return {
+        "n": len(chunk),
+        "histograms": histograms,
+        "first_time": int(times[0]),
+        "last_time": int(times[-1]),
+        "first_prices": prices[:r_len].copy(),
+        "last_prices": prices[-r_len:].copy(),
+    }
+
+
+class LogHistogram:
+    """
+
+    Mergeable histogram of non-negative values on a fixed log-spaced grid.
+
+    Every value is counted in one of PER_DECADE bins per power of ten, so
+    histograms of different chunks, shards or hours add up exactly, without
+    knowing the range of the data in advance. `bins` then regroups the fine grid
+    into any number of log-spaced bins between the smallest and largest value.
+    Zeros, which have no place on a log axis, are counted apart.
+
+
+    Attributes:
+        counts: int64 counts of the fine grid.
+        zeros: Number of zero values.
+        low: Smallest positive value, inf when there is none.
+        high: Largest value, -inf when there is none.
+    """
+    def __init__(self):
+        self.counts = np.zeros((MAX_EXP - MIN_EXP) * PER_DECADE, dtype=np.int64)
+        self.zeros = 0
+        self.low = np.inf
+        self.high = -np.inf
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum()) + self.zeros
+
+    def add(self, values: np.ndarray):
+        """Count an array of non-negative values (NaNs are ignored)."""
+        values = np.asarray(values, dtype=np.float64)
+        positive = values[values > 0]
+        self.zeros += int(np.count_nonzero(values == 0))
+        if not positive.size:
+            return
+        index = np.floor((np.log10(positive) - MIN_EXP) * PER_DECADE).astype(np.int64)
+        np.clip(index, 0, self.counts.size - 1, out=index)
+        self.counts += np.bincount(index, minlength=self.counts.size)
+        self.low = min(self.low, float(positive.min()))
+        self.high = max(self.high, float(positive.max()))
+
+    def merge(self, other: "LogHistogram") -> "LogHistogram":
+        """Add the counts of another histogram to this one and return it."""
+        self.counts += other.counts
+        self.zeros += other.zeros
+        self.low = min(self.low, other.low)
+        self.high = max(self.high, other.high)
+
+        return self
+
+    def bins(self, bins: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+
+        Regroup the positive values into log-spaced bins.
+
+
+        Args:
+            bins: Number of bins between the smallest and largest positive value.
+
+
+        Returns:
+            Tuple of the bins+1 edges and the bins counts. Counts are exact up to
+            the fine grid resolution: a fine bin straddling an edge is counted in
+            the bin holding its center.
+        """
+        if self.low > self.high:
+            return np.zeros(bins + 1), np.zeros(bins, dtype=np.int64)
+        high = max(self.high, self.low * 10 ** (1 / PER_DECADE))
+        edges = np.geomspace(self.low, high, bins + 1)
+        filled = np.flatnonzero(self.counts)
+        centers = 10.0 ** (MIN_EXP + (filled + 0.5) / PER_DECADE)
+        index = np.clip(np.searchsorted(edges, centers, side="right") - 1, 0, bins - 1)
+        counts = np.bincount(index, weights=self.counts[filled], minlength=bins)
+
+        return edges, counts.astype(np.int64)
@@ -0,0 +1,195 @@
+from typing import Callable, List, Union
+import asyncio
+import json
+import aiohttp
+import pandas as pd
+from extract import BASE_URL, decode_agg_trades
+from extract_async import extract_pages_async
+from utils import get_logger, WeightLimiter
+logger = get_logger("live")
+
+STREAM_URL = "wss://stream.binance.com:9443"
+# How often an idle stream checks whether it was asked to stop, in seconds.
+POLL_SECONDS = 0.5
+
+Sink = Callable[[pd.DataFrame], None]
+
+def run_live(symbol: str, sink: Sink, trade_id: Union[int, None] = None,
+             start_time: Union[int, None] = None, flush_ms: int = 500, flush_rows: int = 5_000,
+             limiter: Union[WeightLimiter, None] = None, reconnect_delay: float = 1.0,
+             max_reconnect_delay: float = 60.0, timeout: float = 10.0, retries: int = 5,
+             backoff: float = 0.5, stream_url: str = STREAM_URL, base_url: str = BASE_URL) -> int:
+    """
+
+    Ingest the aggregated trades of a symbol live from the Binance aggTrade
+    websocket stream, until interrupted.
+
+    Trades are grouped into micro-batches handed to the sink (usually transform
+    followed by load) every `flush_ms` milliseconds or `flush_rows` trades,
+    whichever comes first, so the database sees small steady writes and the
+    data is at most about `flush_ms` old. Whenever the stream (re)connects, the
+    trades missed since the last one passed to the sink are first fetched from
+    the REST API, so a disconnection leaves no gap. Trades already passed to the
+    sink are never passed again.
+
+
+    Args:
+        symbol: Trading pair symbol (e.g., "BTCUSDT").
+        sink: Called with each batch of raw aggregated trades (a/p/q/f/l/T/m/M
+            columns, as returned by `extract`), in a worker thread.
+        trade_id: Next trade id to ingest, e.g. the stored checkpoint plus one.
+        start_time: Start timestamp in miliseconds, used instead of trade_id for
+            the first gap fill when trade_id is None. When both are None the
+            stream starts at the first live trade.
+        flush_ms: Longest time a trade waits in the current batch.
+        flush_rows: Largest number of trades in a batch.
+        limiter: Rate limiter of the REST gap fills.
+        reconnect_delay: First delay before reconnecting, doubled after every
+            failed attempt up to max_reconnect_delay.
+        max_reconnect_delay: Longest delay between two connection attempts.
+        timeout: Total timeout of a single REST request in seconds.
+        retries: Maximum number of retries per REST request.
+        backoff: Exponential backoff factor between REST retries, in seconds.
+        stream_url: Binance websocket endpoint, overridable for tests.
+        base_url: Binance REST endpoint, overridable for tests.
+
+
+    Returns:
+        Total number of trades passed to the sink.
+
+
+    Raises:
+        Exception: Any error raised by the sink. Restarting from the stored
+            checkpoint resumes without gaps.
+    """
+    return asyncio.run(live_async(
+        symbol, sink, trade_id, start_time, flush_ms, flush_rows, limiter, reconnect_delay,
+        max_reconnect_delay, timeout, retries, backoff, stream_url, base_url
+    ))
+
+async def live_async(symbol: str, sink: Sink, trade_id: Union[int, None] = None,
+                     start_time: Union[int, None] = None, flush_ms: int = 500, flush_rows: int = 5_000,
+                     limiter: Union[WeightLimiter, None] = None, reconnect_delay: float = 1.0,
+                     max_reconnect_delay: float = 60.0, timeout: float = 10.0, retries: int = 5,
+                     backoff: float = 0.5, stream_url: str = STREAM_URL, base_url: str = BASE_URL,
+                     stop: Union[asyncio.Event, None] = None) -> int:
+    """Coroutine version of `run_live`, which also returns once `stop` is set."""
+    ingest = _LiveIngest(
+        symbol, sink, trade_id, start_time, flush_ms, flush_rows,
+        limiter if limiter is not None else WeightLimiter(), retries, backoff, base_url
+    )
+    stop = stop if stop is not None else asyncio.Event()
+    url = f"{stream_url}/ws/{symbol.lower()}@aggTrade"
+    delay = reconnect_delay
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as rest, \
+            aiohttp.ClientSession() as stream:
+        while not stop.is_set():
+            try:
+                async with stream.ws_connect(url, heartbeat=60) as ws:
+                    logger.info(f"Connected to the {symbol} aggTrade stream")
+                    delay = reconnect_delay
+                    await ingest.consume(ws, rest, stop)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"{symbol} stream failed: {e!r}")
+            if stop.is_set():
+                break
+            logger.info(f"Reconnecting to the {symbol} stream in {delay}s")
+            try:
+                await asyncio.wait_for(stop.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, max_reconnect_delay)
+
+    return ingest.rows
+
+
+class _LiveIngest:
+    """State of a live ingestion kept across reconnections: the last trade id
+    passed to the sink and the number of trades so far."""
+    def __init__(self, symbol: str, sink: Sink, trade_id: Union[int, None], start_time: Union[int, None],
+                 flush_ms: int, flush_rows: int, limiter: WeightLimiter, retries: int, backoff: float,
+                 base_url: str):
+        self.symbol = symbol
+        self.sink = sink
+        self.last_id = trade_id - 1 if trade_id is not None else None
+        self.start_time = start_time
+        self.flush_seconds = flush_ms / 1000
+        self.flush_rows = flush_rows
+        self.limiter = limiter
+        self.retries = retries
+        self.backoff = backoff
+        self.base_url = base_url
+        self.rows = 0
+
+    async def consume(self, ws: aiohttp.ClientWebSocketResponse, rest: aiohttp.ClientSession,
+                      stop: asyncio.Event):
+        """Micro-batch the trades of one connection until it closes or `stop` is set."""
+        loop = asyncio.get_running_loop()
+        pending: List[bytes] = []
+        deadline = None
+        first = True
+        try:
+            while not stop.is_set():
+                wait = POLL_SECONDS if deadline is None else max(0.0, deadline - loop.time())
+                try:
+                    message = await ws.receive(timeout=wait)
+                except asyncio.TimeoutError:
+                    message = None
+                if message is not None:
+                    if message.type != aiohttp.WSMsgType.TEXT:
+                        logger.info(f"{self.symbol} stream closed ({message.type.name})")
+                        return
+                    body = message.data.encode()
+                    start = body.find(b'"a":')
+                    if start < 0:
+                        continue
+                    if first:
+                        first = False
+                        trade = json.loads(body)
+                        await self._fill_gap(rest, int(trade["a"]), int(trade["T"]))
+                    # Drop the event fields so batches have the REST layout.
+                    pending.append(b"{" + body[start:])
+                    if deadline is None:
+                        deadline = loop.time() + self.flush_seconds
+                if pending and (len(pending) >= self.flush_rows or loop.time() >= deadline):
+                    await self._flush(decode_agg_trades(b"[" + b",".join(pending) + b"]"))
+                    pending, deadline = [], None
+        finally:
+            if pending:
+                await self._flush(decode_agg_trades(b"[" + b",".join(pending) + b"]"))
+
+    async def _fill_gap(self, rest: aiohttp.ClientSession, first_id: int, first_time: int):
+        """Pass the trades between the last one ingested and the first one streamed
+        to the sink, fetched from the REST API."""
+        if self.last_id is None and self.start_time is None:
+            self.last_id = first_id - 1
+            return
+        if self.last_id is not None and first_id <= self.last_id + 1:
+            return
+        logger.info(f"Filling {self.symbol} trades up to id {first_id} from the REST API")
+        trade_id = self.last_id + 1 if self.last_id is not None else None
+        pages: List[pd.DataFrame] = []
+        async for page in extract_pages_async(
+            rest, self.symbol, self.start_time or 0, trade_id, first_time,
+            self.limiter, self.retries, self.backoff, self.base_url
+        ):
+            pages.append(page[page["a"] < first_id])
+            while sum(len(page) for page in pages) >= self.flush_rows:
+                trades = pd.concat(pages, ignore_index=True)
+                await self._flush(trades.iloc[:self.flush_rows])
+                pages = [trades.iloc[self.flush_rows:]]
+        if pages:
+            await self._flush(pd.concat(pages, ignore_index=True))
+
+    async def _flush(self, batch: pd.DataFrame):
+        if batch.empty:
+            return
+        if self.last_id is not None:
+            batch = batch[batch["a"] > self.last_id].reset_index(drop=True)
+        if batch.empty:
+            return
+        await asyncio.to_thread(self.sink, batch)
+        self.rows += len(batch)
+        self.last_id = int(batch["a"].iloc[-1])
+        logger.info(f"Ingested {len(batch)} {self.symbol} trades up to id {self.last_id}")
@@ -1,10 +1,25 @@
+from typing import Dict, Iterator, List, Set, Union
+import io
+from functools import partial
 import pandas as pd
-from sqlalchemy import create_engine
-from sqlalchemy.engine.base import Engine
-from utils import get_logger
+from sqlalchemy import DateTime, bindparam, inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine.base import Connection, Engine
+from archive import write_archive
+from partitions import ensure_partitions, is_partitioned, remember_partitions
+from rollups import update_rollups
+from transform import to_decimal_strings
+from utils import get_logger, save_checkpoint
 logger = get_logger("load")
 
-def load(df: pd.DataFrame, engine: Engine):
+COPY_CHUNK_ROWS = 100_000
+# Trades tables known to exist, so the DDL is only issued once per process.
+_known_tables: Set[str] = {"trades"}
+
+def load(df: pd.DataFrame, engine: Engine, table: str = "trades",
+         symbol: Union[str, None] = None, scales: Union[Dict[str, int], None] = None,
+         rollups: bool = True, archive: Union[str, None] = None,
+         raw: Union[pd.DataFrame, None] = None):
     """
 
     Load aggregated trades data into PostgreSQL database.
@@ -13,6 +28,196 @@ def load(df: pd.DataFrame, engine: Engine):
     Args:
         df: Pandas dataframe of the transformed aggregated trades.
         engine: SQLAlchemy engine used to connect to the database.
+        table: Destination table, `trades_<symbol>` for the pairs of a watchlist.
+        symbol: When given, the highest trade id of the batch is saved as the
+            symbol's checkpoint in the same transaction as the rows.
+        scales: Decimals of the fixed-point columns, as passed to `transform`.
+            Those columns are written as exact decimal strings, so no precision
+            is lost on the way in.
+        rollups: Whether to merge the new trades into the 1m/1h/1d candle tables
+            (see `rollups.update_rollups`) in the same transaction.
+        archive: Directory of the local Parquet archive. When given, the newly
+            inserted trades are also written there under `symbol` just before
+            the transaction commits (see `archive.write_archive`), so the
+            archive never misses trades the database holds.
+        raw: Pandas dataframe of the aggregated trades as returned by the API,
+            archived next to the transformed columns.
+
+
+    Notes:
+        On PostgreSQL the rows are streamed with `COPY FROM STDIN` into a temporary
+        staging table and merged with `INSERT ... ON CONFLICT DO NOTHING`, so
+        re-loading trades that are already stored is a no-op. A missing watchlist
+        table is created like `trades`, with the same partitioning. When the table
+        is partitioned by time, the monthly partitions the batch needs are created
+        first. Other databases
+        (SQLite in the tests) fall back to batched inserts that skip duplicates.
+        Trades already stored are dropped from the batch up front, so they are
+        not re-sent, and the rollups are built from the trades the insert reports
+        as actually written, so overlapping loads never count a trade twice.
     """
     logger.info(f"Loading {len(df)} rows into the database")
-    df.to_sql("trades", engine, if_exists="append", index=False)
+    if archive is not None and symbol is None:
+        raise ValueError("Archiving trades requires their symbol")
+    if df.empty:
+        return
+
+    scales = scales or {}
+    last_trade_id = df["trade_id"].max()
+    created: List[str] = []
+    partitions: List[str] = []
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            created = _ensure_table(conn, table)
+            partitions = ensure_partitions(conn, df["time"], table)
+        new = _new_rows(conn, df, table)
+        if not new.empty:
+            inserted = _insert(conn, new, table, scales)
+            if len(inserted) < len(new):
+                # A concurrent load stored some of them since the snapshot above.
+                new = new[new["trade_id"].isin(inserted)]
+        if rollups:
+            update_rollups(conn, new, table, scales)
+        if symbol is not None:
+            save_checkpoint(conn, symbol, last_trade_id)
+        # Before the commit: a failed write rolls the batch back, checkpoint
+        # included, so the next run loads and archives it again.
+        if archive is not None and not new.empty:
+            if raw is not None:
+                raw = raw[raw["a"].isin(new["trade_id"])]
+            write_archive(raw, new, archive, symbol, scales)
+    # Only once committed: rolled back DDL must be issued again.
+    _known_tables.update(created)
+    remember_partitions(partitions)
+
+def _insert(conn: Connection, df: pd.DataFrame, table: str, scales: Dict[str, int]) -> List[int]:
+    """Insert the rows whose trade_id is not stored yet and return their trade ids."""
+    if conn.dialect.name == "postgresql":
+        return _copy_load(df, conn, table, scales)
+    inserted: List[int] = []
+    _with_decimals(df, scales).to_sql(
+        table, conn, if_exists="append", index=False,
+        method=partial(_insert_ignore, inserted=inserted)
+    )
+    return inserted
+
+def _ensure_table(conn: Connection, table: str) -> List[str]:
+    """Create a watchlist trades table with the layout and partitioning of `trades`,
+    returning it when the DDL was issued."""
+    if table in _known_tables:
+        return []
+    partitioning = " PARTITION BY RANGE (time)" if is_partitioned(conn, "trades") else ""
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} (LIKE trades INCLUDING ALL){partitioning}"))
+    logger.info(f"Ensured table {table}")
+    return [table]
+
+def _new_rows(conn: Connection, df: pd.DataFrame, table: str) -> pd.DataFrame:
+    """Drop the rows of the batch whose trade_id is already stored."""
+    if not inspect(conn).has_table(table):
+        return df
+    # The time bounds let PostgreSQL prune partitions that cannot hold the batch.
+    stored = conn.execute(
+        text(f"SELECT trade_id FROM {table} "
+             f"WHERE trade_id BETWEEN :low AND :high AND time BETWEEN :start AND :end")
+        .bindparams(bindparam("start", type_=DateTime), bindparam("end", type_=DateTime)),
+        {
+            "low": int(df["trade_id"].min()),
+            "high": int(df["trade_id"].max()),
+            "start": df["time"].min().to_pydatetime(),
+            "end": df["time"].max().to_pydatetime(),
+        }
+    ).scalars().all()
+    if not stored:
+        return df
+    logger.info(f"Skipping {len(stored)} trades already stored in {table}")
+
+    return df[~df["trade_id"].isin(stored)]
+
+def _copy_load(df: pd.DataFrame, conn: Connection, table: str, scales: Dict[str, int]) -> List[int]:
+    staging = f"{table}_staging"
+    columns = ", ".join(df.columns)
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {staging} "
+            f"(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"
+        )
+        cursor.copy_expert(
+            f"COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)",
+            _CsvStream(df, scales)
+        )
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) "
+            f"SELECT {columns} FROM {staging} "
+            f"ON CONFLICT DO NOTHING RETURNING trade_id"
+        )
+        inserted = [row[0] for row in cursor.fetchall()]
+        logger.info(f"Inserted {len(inserted)} new rows into {table}")
+    finally:
+        cursor.close()
+
+    return inserted
+
+def _with_decimals(df: pd.DataFrame, scales: Dict[str, int]) -> pd.DataFrame:
+    """Replace fixed-point integer columns with their exact decimal representation."""
+    if not scales:
+        return df
+    return df.assign(**{
+        column: to_decimal_strings(df[column].to_numpy(), scale)
+        for column, scale in scales.items()
+    })
+
+def _insert_ignore(pd_table, conn: Connection, keys, data_iter, inserted: List[int]) -> int:
+    """pandas `to_sql` insertion method that skips rows whose trade_id is already
+    stored, appending the trade ids it does insert to `inserted`."""
+    rows = [dict(zip(keys, row)) for row in data_iter]
+    dialect = {"sqlite": sqlite, "postgresql": postgresql}.get(conn.dialect.name)
+    if dialect is None:
+        conn.execute(pd_table.table.insert(), rows)
+        inserted.extend(row["trade_id"] for row in rows)
+        return len(rows)
+    statement = (
+        dialect.insert(pd_table.table).on_conflict_do_nothing()
+        .returning(pd_table.table.c.trade_id)
+    )
+    ids = conn.execute(statement, rows).scalars().all()
+    inserted.extend(ids)
+
+    return len(ids)
+
+
+class _CsvStream(io.TextIOBase):
+    """
+
+    Read-only file object that renders a dataframe as CSV a chunk of rows at a time,
+    so `COPY` can consume it without the whole payload being held in memory.
+    """
+    def __init__(self, df: pd.DataFrame, scales: Union[Dict[str, int], None] = None,
+                 chunk_rows: int = COPY_CHUNK_ROWS):
+        self._chunks = self._render(df, scales or {}, chunk_rows)
+        self._current = io.StringIO()
+
+    @staticmethod
+    def _render(df: pd.DataFrame, scales: Dict[str, int], chunk_rows: int) -> Iterator[str]:
+        for start in range(0, len(df), chunk_rows):
+            chunk = _with_decimals(df.iloc[start:start + chunk_rows], scales)
+            yield chunk.to_csv(index=False, header=False)
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        parts = []
+        while size != 0:
+            data = self._current.read(size)
+            parts.append(data)
+            if size > 0:
+                size -= len(data)
+                if size == 0:
+                    break
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._current = io.StringIO(chunk)
+
+        return "".join(parts)
@@ -1,24 +1,39 @@
 import yaml
 import time
-from sqlalchemy import create_engine
-from extract import extract
-from transform import transform
+from extract import extract, extract_pages, BinanceSession
+from extract_async import extract_many
+from backfill import backfill_time_range
+from transform import transform, fixed_point_scales
+from live import run_live
 from load import load
-from utils import get_logger, get_latest_trade_id
+from precompute import start_precompute
+from stream import run_stream
+from utils import get_engine, get_logger, get_checkpoint, get_latest_trade_id, trades_table, WeightLimiter
 logger = get_logger("main")
 
+CONFIG_PATH = "/root/binance-etl-pipeline/config/config.yaml"
+
 def main():
     """
 
     Run the full ETL pipeline for downloading and storing Binance aggregated trades
-    from a single trading pair.
+    from a single trading pair, or from every pair of a watchlist when `symbols`
+    is set in the configuration.
 
     Steps performed:
         1. Initialize logger and configuration.
-        2. Extract data from the Binance API.
+        2. Extract data from the Binance API, either page by page, as concurrently
+           downloaded trade id partitions in backfill mode, or for all symbols of
+           the watchlist at once from a single event loop. In streaming mode,
+           steps 2 to 4 overlap: fixed-size batches are transformed and loaded
+           while the next pages download. In live mode, the job keeps running
+           and ingests the websocket trade stream in micro-batches instead.
         3. Transform the raw trade data into a structured format.
-        4. Insert the transformed data into the PostgreSQL database.
+        4. Insert the transformed data into the PostgreSQL database and, when
+           `archive.path` is set, into the local Parquet archive.
         5. Record success or detailed error information in the logs.
+        6. When `precompute.enabled` is set, start precomputing the dashboard
+           presets in a background process.
 
 
     Raises:
@@ -27,30 +42,148 @@ def main():
             tools to detect the failed execution.
     """
     logger.info("ETL job started")
-    with open("/root/binance-etl-pipeline/config/config.yaml") as f:
+    with open(CONFIG_PATH) as f:
         config = yaml.safe_load(f)
-    symbol = config["symbol"]
+    symbols = config.get("symbols") or [config["symbol"]]
     db_url = config["database"]["url"]
     hours_back = config["hours_back"]
+    backfill_config = config.get("backfill", {})
+    http_config = config.get("http", {})
+    stream_config = config.get("stream", {})
+    live_config = config.get("live", {})
+    archive = config.get("archive", {}).get("path")
+    scales = {symbol: _scales(config, symbol) for symbol in symbols}
     start_time = int(time.time()*1000 - hours_back*60*60*1000)
-    engine = create_engine(db_url)
+    pool_config = config["database"].get("pool", {})
+    engine = get_engine(db_url, **pool_config)
+    limiter = WeightLimiter(http_config.get("max_weight", 6000))
 
     logger.info("Retrieving latest tradeId stored...")
-    trade_id = get_latest_trade_id(db_url)
-    if trade_id is not None:
-        trade_id +=1 
+    trade_ids = {}
+    for symbol in symbols:
+        trade_id = get_checkpoint(engine, symbol)
+        if trade_id is None:
+            # First run with checkpoints: fall back to scanning the existing trades.
+            trade_id = get_latest_trade_id(db_url, trades_table(symbol, symbols))
+        trade_ids[symbol] = trade_id + 1 if trade_id is not None else None
+
+    if len(symbols) > 1:
+        try:
+            _run_watchlist(
+                symbols, start_time, trade_ids, scales, engine, limiter, http_config, archive,
+                sinks=pool_config.get("pool_size", 5),
+            )
+            logger.info("ETL job finished successfully")
+        except Exception as e:
+            logger.exception("ETL failed due to an error")
+            raise
+        _precompute(config)
+        return
+
+    symbol = symbols[0]
+    trade_id = trade_ids[symbol]
+    session = BinanceSession(
+        pool_size=http_config.get("pool_size", 10),
+        timeout=http_config.get("timeout", 10.0),
+        retries=http_config.get("retries", 5),
+        backoff=http_config.get("backoff", 0.5),
+        limiter=limiter,
+    )
 
     try:
+        if live_config.get("enabled", False):
+            logger.info("Ingesting live trades...")
+            rows = run_live(
+                symbol,
+                lambda raw: load(
+                    transform(raw, scales[symbol]), engine, symbol=symbol,
+                    scales=scales[symbol], archive=archive, raw=raw
+                ),
+                trade_id=trade_id,
+                start_time=start_time,
+                flush_ms=live_config.get("flush_ms", 500),
+                flush_rows=live_config.get("flush_rows", 5_000),
+                limiter=limiter,
+                timeout=http_config.get("timeout", 10.0),
+                retries=http_config.get("retries", 5),
+                backoff=http_config.get("backoff", 0.5),
+            )
+            logger.info(f"Live ingestion stopped, {rows} rows ingested")
+            return
         logger.info("Extracting data...")
-        raw = extract(symbol, start_time, trade_id=trade_id)
+        if backfill_config.get("enabled", False):
+            raw = backfill_time_range(
+                symbol,
+                start_time,
+                trade_id=trade_id,
+                workers=backfill_config.get("workers", 4),
+                partition_size=backfill_config.get("partition_size", 100_000),
+                session=session,
+            )
+        elif stream_config.get("enabled", False):
+            rows = run_stream(
+                extract_pages(symbol, start_time, trade_id=trade_id, session=session),
+                lambda batch: load(
+                    transform(batch, scales[symbol]), engine, symbol=symbol,
+                    scales=scales[symbol], archive=archive, raw=batch
+                ),
+                batch_size=stream_config.get("batch_size", 50_000),
+                max_pending=stream_config.get("max_pending", 2),
+            )
+            logger.info(f"ETL job finished successfully, {rows} rows streamed")
+            _precompute(config)
+            return
+        else:
+            raw = extract(symbol, start_time, trade_id=trade_id, session=session)
         logger.info("Transforming data...")
-        transformed = transform(raw)
+        transformed = transform(raw, scales[symbol])
         logger.info("Loading data...")
-        load(transformed, engine)
+        load(transformed, engine, symbol=symbol, scales=scales[symbol], archive=archive, raw=raw)
         logger.info("ETL job finished successfully")
     except Exception as e:
         logger.exception("ETL failed due to an error")
         raise
+    _precompute(config)
+
+def _precompute(config):
+    """Start precomputing the dashboard presets in the background, when enabled."""
+    if config.get("precompute", {}).get("enabled", False):
+        logger.info("Starting dashboard precompute")
+        start_precompute(CONFIG_PATH)
+
+def _scales(config, symbol):
+    """Return the fixed-point scales configured for a symbol, empty to keep floats."""
+    increments = config.get("fixed_point", {}).get(symbol)
+    if not increments:
+        return {}
+    return fixed_point_scales(str(increments["tick_size"]), str(increments["step_size"]))
+
+def _run_watchlist(symbols, start_time, trade_ids, scales, engine, limiter, http_config, archive,
+                   sinks=5):
+    """Extract every symbol concurrently and transform/load each one in batches as
+    its pages arrive, with at most `sinks` loads (one pooled connection each) at once."""
+    def sink(symbol, raw):
+        if raw.empty:
+            return
+        logger.info(f"Transforming and loading {symbol}...")
+        load(
+            transform(raw, scales[symbol]), engine, table=trades_table(symbol, symbols),
+            symbol=symbol, scales=scales[symbol], archive=archive, raw=raw
+        )
+
+    logger.info(f"Extracting data for {len(symbols)} symbols...")
+    extract_many(
+        symbols,
+        start_time,
+        trade_ids=trade_ids,
+        sink=sink,
+        limiter=limiter,
+        pool_size=http_config.get("pool_size", 10),
+        timeout=http_config.get("timeout", 10.0),
+        retries=http_config.get("retries", 5),
+        backoff=http_config.get("backoff", 0.5),
+        sinks=sinks,
+    )
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,129 @@
+from typing import List, Set, Tuple
+import datetime as dt
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine.base import Connection, Engine
+from utils import get_logger
+logger = get_logger("partitions")
+
+# Partitions known to exist, so the DDL is only issued once per process.
+_known_partitions: Set[str] = set()
+
+def partition_name(table: str, month: dt.date) -> str:
+    """Return the name of a table's monthly partition (e.g. trades_2026_03)."""
+    return f"{table}_{month.year}_{month.month:02d}"
+
+def month_bounds(times: pd.Series) -> List[Tuple[dt.date, dt.date]]:
+    """
+
+    List the monthly partition ranges covered by a batch of timestamps.
+
+
+    Args:
+        times: Timestamps of the batch.
+
+
+    Returns:
+        Sorted list of (first day of month, first day of next month) tuples.
+    """
+    months = times.dt.to_period("M").unique()
+    return [
+        (month.start_time.date(), (month + 1).start_time.date())
+        for month in sorted(months)
+    ]
+
+def is_partitioned(conn: Connection, table: str) -> bool:
+    """Return True when table is a PostgreSQL range-partitioned table."""
+    if conn.dialect.name != "postgresql":
+        return False
+    relkind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE relname = :table"),
+        {"table": table}
+    ).scalar()
+
+    return relkind == "p"
+
+def ensure_partitions(conn: Connection, times: pd.Series, table: str = "trades") -> List[str]:
+    """
+
+    Create the monthly partitions a batch of trades will be written to.
+
+    Does nothing unless `table` is partitioned by time (see
+    `sql/create_tables.sql`). Indexes defined on the parent table, including the
+    time index, are created on each new partition automatically.
+
+
+    Args:
+        conn: Open connection inside the load transaction.
+        times: Timestamps of the batch.
+        table: Partitioned trades table.
+
+
+    Returns:
+        Names of the partitions the DDL was issued for. Pass them to
+        `remember_partitions` once the transaction has committed, so a rolled
+        back partition is created again by the next load.
+    """
+    bounds = [
+        (start, end) for start, end in month_bounds(times)
+        if partition_name(table, start) not in _known_partitions
+    ]
+    if not bounds or not is_partitioned(conn, table):
+        return []
+
+    created = []
+    for start, end in bounds:
+        name = partition_name(table, start)
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{start}') TO ('{end}')"
+        ))
+        logger.info(f"Ensured partition {name} for [{start}, {end})")
+        created.append(name)
+
+    return created
+
+def remember_partitions(names: List[str]):
+    """Record partitions whose creation has been committed, so their DDL is skipped."""
+    _known_partitions.update(names)
+
+def detach_partitions(engine: Engine, before: dt.date, table: str = "trades") -> List[str]:
+    """
+
+    Detach the monthly partitions holding only trades older than a date.
+
+    Detached partitions become regular tables that can be archived or dropped
+    without touching the rest of the data.
+
+
+    Args:
+        engine: SQLAlchemy engine used to connect to the database.
+        before: Partitions ending on or before this date are detached.
+        table: Partitioned trades table.
+
+
+    Returns:
+        Names of the detached partitions.
+    """
+    query = text("""
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :table
+    """)
+    detached = []
+    with engine.begin() as conn:
+        for name, bound in conn.execute(query, {"table": table}).fetchall():
+            # Bound looks like: FOR VALUES FROM ('2026-03-01 00:00:00') TO ('2026-04-01 00:00:00')
+            if "TO ('" not in bound:
+                continue
+            upper = bound.rsplit("TO ('", 1)[-1].split("'")[0]
+            if pd.Timestamp(upper).date() > before:
+                continue
+            conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            _known_partitions.discard(name)
+            detached.append(name)
+            logger.info(f"Detached partition {name}")
+
+    return detached
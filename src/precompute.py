@@ -0,0 +1,160 @@
+from typing import Dict, Sequence, Tuple, Union
+import datetime as dt
+import fcntl
+import os
+import subprocess
+import sys
+from functools import partial
+import yaml
+from sqlalchemy.engine.base import Engine
+from analytics_cache import PartialCache
+from archive import read_trades
+from correlations import Source, read_signed_trades, shard_partials
+from histograms import partial_histograms
+from rollups import loaded_until
+from utils import get_engine, get_logger
+logger = get_logger("precompute")
+
+# Preset ranges of the analysis pages, ending at the start of the current hour.
+ANALYSIS_PRESETS = {
+    "Last 6 hours": dt.timedelta(hours=6),
+    "Last 12 hours": dt.timedelta(hours=12),
+    "Last 24 hours": dt.timedelta(hours=24),
+    "Last 48 hours": dt.timedelta(hours=48),
+}
+# Default "Max lag" and "Trades per return" of the analysis pages.
+K_MAX = 100
+R_LEN = 100
+CHUNK_ROWS = 1_000_000
+
+def trade_source(db_url: str, archive_path: Union[str, None] = None, symbol: str = "BTCUSDT",
+                 columns: Sequence[str] = ("time", "price", "sign", "quantity")) -> Tuple[Source, str]:
+    """
+
+    Build the trade source of the analysis pages and the key of its cache entries.
+
+
+    Args:
+        db_url: Database URL, read when there is no archive.
+        archive_path: Root of the Parquet archive, preferred when set.
+        symbol: Trading pair read from the archive.
+        columns: Columns read from the archive.
+
+
+    Returns:
+        Tuple of the picklable source (called with a start and end time, returns
+        chunks of trades) and the key identifying its data in the cache.
+    """
+    if archive_path:
+        source = partial(read_trades, archive_path, symbol, columns=list(columns), chunk_rows=CHUNK_ROWS)
+        return source, f"archive:{archive_path}:{symbol}"
+    return partial(read_signed_trades, db_url, chunk_rows=CHUNK_ROWS), "db:trades"
+
+def precompute(engine: Engine, db_url: str, cache: PartialCache, now: Union[dt.datetime, None] = None,
+               archive_path: Union[str, None] = None, symbol: str = "BTCUSDT",
+               k_max: int = K_MAX, r_len: int = R_LEN, workers: Union[int, None] = None) -> Dict[str, int]:
+    """
+
+    Fill the dashboard cache with the hours of every preset range.
+
+    Correlations (default lag and return length) and histograms are computed
+    for the longest preset of their page, whose hours include those of the
+    shorter ones, with the same cache keys as the pages. Only hours fully loaded
+    are cached, so the pages are left with at most the current hour to compute.
+    Candles need no precompute: the loader keeps the candle rollups up to date
+    and the Market Overview page reads them directly.
+
+
+    Args:
+        engine: Engine of the trades database.
+        db_url: URL of the same database, for the process pool workers.
+        cache: Cache shared with the dashboard.
+        now: End of the preset ranges, defaults to the start of the current hour.
+        archive_path: Parquet archive the dashboard reads trades from, if any.
+        symbol: Trading pair of the archive.
+        k_max: Largest lag of the correlations.
+        r_len: Number of trades each return spans.
+        workers: Processes computing the correlations (one per CPU when None).
+
+
+    Returns:
+        Number of hour pieces of each kind.
+    """
+    now = now or dt.datetime.now(dt.UTC).replace(minute=0, second=0, microsecond=0)
+    complete_before = loaded_until(engine)
+    if complete_before is None:
+        logger.info("No trades loaded yet, nothing to precompute")
+        return {}
+    analysis_start = now - max(ANALYSIS_PRESETS.values())
+    correlations, correlations_key = trade_source(db_url, archive_path, symbol)
+    histograms, histograms_key = trade_source(db_url, archive_path, symbol, ("time", "price", "quantity"))
+
+    counts = {
+        "correlations": len(cache.partials(
+            "correlations", (correlations_key, k_max, r_len), analysis_start, now,
+            lambda bounds: shard_partials(correlations, bounds, k_max, r_len, workers=workers),
+            complete_before=complete_before,
+        )),
+        "histograms": len(cache.partials(
+            "histograms", (histograms_key, r_len), analysis_start, now,
+            lambda bounds: [partial_histograms(histograms(start, end), r_len) for start, end in bounds],
+            complete_before=complete_before,
+        )),
+    }
+    logger.info(f"Precomputed dashboard presets up to {now}: {counts}")
+
+    return counts
+
+def start_precompute(config_path: str) -> subprocess.Popen:
+    """Run `precompute.py` on a config file in a detached background process, so
+    the caller (e.g. a cron job) does not wait for it."""
+    return subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), config_path],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+def main(config_path: str):
+    """
+
+    Precompute the dashboard presets described by a pipeline config file.
+
+    Uses the `precompute` section of the config (`cache_path`, the dashboard's
+    cache directory, plus optional `cache_max_mb`, `k_max` and `r_len`), the
+    database URL and the archive path. Only one run at a time does any work:
+    a run started while another holds the lock exits immediately.
+    """
+    with open(config_path) as f:
+        config = yaml.safe_load(f)
+    settings = config["precompute"]
+    db_url = config["database"]["url"]
+    symbols = config.get("symbols") or [config["symbol"]]
+    cache = PartialCache(settings["cache_path"], max_bytes=settings.get("cache_max_mb", 256) * 2 ** 20)
+
+    # Next to the cache rather than inside it, where it could be evicted.
+    lock_path = f"{os.path.normpath(cache.path)}.lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info("Another precompute run is in progress, skipping")
+            return
+        try:
+            precompute(
+                get_engine(db_url, **config["database"].get("pool", {})),
+                db_url,
+                cache,
+                archive_path=config.get("archive", {}).get("path"),
+                symbol=symbols[0],
+                k_max=settings.get("k_max", K_MAX),
+                r_len=settings.get("r_len", R_LEN),
+            )
+        except Exception:
+            logger.exception("Precompute failed due to an error")
+            raise
+
+if __name__ == "__main__":
+    main(sys.argv[1])
@@ -0,0 +1,174 @@
+from typing import Dict, Union
+import numpy as np
+import pandas as pd
+from sqlalchemy import inspect, text
+from sqlalchemy.engine.base import Connection, Engine
+from transform import as_float
+from utils import get_logger
+logger = get_logger("rollups")
+
+# Rollup resolutions, as table suffix -> pandas frequency.
+RESOLUTIONS = {
+    "1m": "min",
+    "1h": "h",
+    "1d": "D",
+}
+
+ROLLUP_DDL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        bucket TIMESTAMP PRIMARY KEY,
+        open DOUBLE PRECISION NOT NULL,
+        high DOUBLE PRECISION NOT NULL,
+        low DOUBLE PRECISION NOT NULL,
+        close DOUBLE PRECISION NOT NULL,
+        volume DOUBLE PRECISION NOT NULL,
+        trades_count BIGINT NOT NULL,
+        signed_volume DOUBLE PRECISION NOT NULL,
+        first_trade_id BIGINT NOT NULL,
+        last_trade_id BIGINT NOT NULL
+    )
+"""
+
+# Merge a batch's candles into the stored ones. Open/close come from whichever side
+# holds the earliest/latest trade id, so batches can arrive in any order.
+UPSERT = """
+    INSERT INTO {table} (
+        bucket, open, high, low, close, volume, trades_count, signed_volume,
+        first_trade_id, last_trade_id
+    )
+    VALUES (
+        :bucket, :open, :high, :low, :close, :volume, :trades_count, :signed_volume,
+        :first_trade_id, :last_trade_id
+    )
+    ON CONFLICT (bucket) DO UPDATE SET
+        open = CASE WHEN excluded.first_trade_id < {table}.first_trade_id
+                    THEN excluded.open ELSE {table}.open END,
+        first_trade_id = CASE WHEN excluded.first_trade_id < {table}.first_trade_id
+                              THEN excluded.first_trade_id ELSE {table}.first_trade_id END,
+        close = CASE WHEN excluded.last_trade_id > {table}.last_trade_id
+                     THEN excluded.close ELSE {table}.close END,
+        last_trade_id = CASE WHEN excluded.last_trade_id > {table}.last_trade_id
+                             THEN excluded.last_trade_id ELSE {table}.last_trade_id END,
+        high = CASE WHEN excluded.high > {table}.high THEN excluded.high ELSE {table}.high END,
+        low = CASE WHEN excluded.low < {table}.low THEN excluded.low ELSE {table}.low END,
+        volume = {table}.volume + excluded.volume,
+        trades_count = {table}.trades_count + excluded.trades_count,
+        signed_volume = {table}.signed_volume + excluded.signed_volume
+"""
+
+def rollup_table(trades_table: str, resolution: str) -> str:
+    """Return the rollup table of a trades table (e.g. trades, "1h" -> candles_1h)."""
+    return f"{trades_table.replace('trades', 'candles', 1)}_{resolution}"
+
+def aggregate(df: pd.DataFrame, freq: str,
+              scales: Union[Dict[str, int], None] = None) -> pd.DataFrame:
+    """
+
+    Aggregate transformed trades into OHLCV candles.
+
+
+    Args:
+        df: Pandas dataframe of transformed aggregated trades.
+        freq: Pandas frequency of the candles (e.g. "min", "h", "D").
+        scales: Decimals of the fixed-point columns of `df`, empty for floats.
+
+
+    Returns:
+        Pandas dataframe with one row per bucket: open, high, low, close, volume,
+        trades_count, signed_volume (buy minus sell quantity) and the first and last
+        trade ids of the bucket.
+    """
+    scales = scales or {}
+    price, quantity = as_float(df, "price", scales), as_float(df, "quantity", scales)
+    trade_id = df["trade_id"].to_numpy()
+    order = None if (np.diff(trade_id) >= 0).all() else np.argsort(trade_id, kind="stable")
+    sign = np.where((df["order_type"] == "Sell").to_numpy(), -1.0, 1.0)
+    trades = pd.DataFrame(
+        {
+            "bucket": df["time"].dt.floor(freq).to_numpy(),
+            "price": price,
+            "quantity": quantity,
+            "signed": sign * quantity,
+            "trade_id": trade_id,
+        },
+        copy=False,
+    )
+    if order is not None:
+        trades = trades.iloc[order]
+
+    grouped = trades.groupby("bucket", sort=True)
+    return pd.DataFrame({
+        "open": grouped["price"].first(),
+        "high": grouped["price"].max(),
+        "low": grouped["price"].min(),
+        "close": grouped["price"].last(),
+        "volume": grouped["quantity"].sum(),
+        "trades_count": grouped.size(),
+        "signed_volume": grouped["signed"].sum(),
+        "first_trade_id": grouped["trade_id"].first(),
+        "last_trade_id": grouped["trade_id"].last(),
+    }).reset_index()
+
+def coarsen(candles: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """Merge candles sorted by bucket into coarser ones (e.g. 1m candles into 1h)."""
+    return merge_candles(candles, candles["bucket"].dt.floor(freq))
+
+def merge_candles(candles: pd.DataFrame, keys: pd.Series) -> pd.DataFrame:
+    """Merge the candles sharing a key into one, keys ordered like the candles.
+    The merged candles are indexed by key, in a column named after `keys`."""
+    grouped = candles.groupby(keys, sort=True)
+    return pd.DataFrame({
+        "open": grouped["open"].first(),
+        "high": grouped["high"].max(),
+        "low": grouped["low"].min(),
+        "close": grouped["close"].last(),
+        "volume": grouped["volume"].sum(),
+        "trades_count": grouped["trades_count"].sum(),
+        "signed_volume": grouped["signed_volume"].sum(),
+        "first_trade_id": grouped["first_trade_id"].first(),
+        "last_trade_id": grouped["last_trade_id"].last(),
+    }).reset_index()
+
+def loaded_until(engine: Engine, trades_table: str = "trades") -> Union[pd.Timestamp, None]:
+    """Return the time up to which trades are fully loaded (the start of the minute
+    of the newest trade), or None when nothing is loaded yet."""
+    table = rollup_table(trades_table, "1m")
+    with engine.connect() as conn:
+        if not inspect(conn).has_table(table):
+            return None
+        latest = conn.execute(text(f"SELECT MAX(bucket) FROM {table}")).scalar()
+
+    return pd.Timestamp(latest) if latest is not None else None
+
+def update_rollups(conn: Connection, df: pd.DataFrame, trades_table: str = "trades",
+                   scales: Union[Dict[str, int], None] = None):
+    """
+
+    Merge a batch of newly loaded trades into the 1m/1h/1d candle rollups.
+
+
+    Args:
+        conn: Open connection inside the load transaction, so rollups are committed
+            atomically with the trades.
+        df: Pandas dataframe of the transformed trades that were actually inserted
+            (already stored trades must be left out, or they are counted twice).
+        trades_table: Table the trades were loaded into.
+        scales: Decimals of the fixed-point columns of `df`, as passed to `load`.
+    """
+    if df.empty:
+        return
+    candles = None
+    for resolution, freq in RESOLUTIONS.items():
+        table = rollup_table(trades_table, resolution)
+        # Only the finest rollup is built from trades, the others from its candles.
+        candles = aggregate(df, freq, scales) if candles is None else coarsen(candles, freq)
+        conn.execute(text(ROLLUP_DDL.format(table=table)))
+        conn.execute(text(UPSERT.format(table=table)), _records(candles))
+        logger.info(f"Updated {len(candles)} candles in {table}")
+
+def _records(candles: pd.DataFrame) -> list:
+    records = candles.astype(object).to_dict("records")
+    for record in records:
+        record["bucket"] = record["bucket"].to_pydatetime()
+
+    return records
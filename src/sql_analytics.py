@@ -0,0 +1,244 @@
+import datetime as dt
+import numpy as np
+import pandas as pd
+from sqlalchemy import DateTime, bindparam, text
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.engine.base import Connection, Engine
+from correlations import Partial, empty_partial, partial_correlations
+from histograms import LogHistogram, MIN_EXP, PER_DECADE, SERIES, empty_histograms
+from utils import get_logger, naive_utc
+logger = get_logger("sql_analytics")
+
+# Trades of the range in time order, as floats so fixed-point NUMERIC columns are
+# reduced in double precision like in Python.
+TRADES_CTE = """
+    ordered AS (
+        SELECT
+            ROW_NUMBER() OVER (ORDER BY time, trade_id) AS rn,
+            CASE WHEN order_type = 'Sell' THEN -1.0 ELSE 1.0 END AS sign,
+            CAST(price AS DOUBLE PRECISION) AS price,
+            CAST(quantity AS DOUBLE PRECISION) AS quantity,
+            {epoch_ms} AS ms
+        FROM {table}
+        WHERE time BETWEEN :start_time AND :end_time
+    )
+"""
+
+# Lags reduced per query: each one adds three window columns and four sums, and
+# a query must stay well below the column limits of the database.
+LAGS_PER_QUERY = 100
+
+# Products of every series with itself shifted by each lag, in a single ordered
+# pass over the trades (no self-join).
+LAG_SUMS = """
+    WITH {trades},
+    series AS (
+        SELECT
+            rn,
+            sign,
+            sign * quantity AS size,
+            ABS(LN(price / LAG(price, :r_len) OVER (ORDER BY rn))) AS ret
+        FROM ordered
+    ),
+    lagged AS (
+        SELECT sign, size, ret, {lagged}
+        FROM series
+        WINDOW by_rn AS (ORDER BY rn)
+    )
+    SELECT {sums}
+    FROM lagged
+"""
+
+LAGGED = (
+    "LAG(sign, {lag}) OVER by_rn AS sign_{lag}, "
+    "LAG(size, {lag}) OVER by_rn AS size_{lag}, "
+    "LAG(ret, {lag}) OVER by_rn AS ret_{lag}"
+)
+
+SUMS = (
+    "SUM(sign * sign_{lag}) AS sign_sum_{lag}, "
+    "SUM(size * size_{lag}) AS size_sum_{lag}, "
+    "SUM(sign * size_{lag}) AS cross_sum_{lag}, "
+    "SUM(ret * ret_{lag}) AS returns_sum_{lag}"
+)
+
+HISTOGRAM_COUNTS = """
+    WITH {trades},
+    series AS (
+        SELECT
+            ms - LAG(ms) OVER (ORDER BY rn) AS time_dif,
+            quantity,
+            ABS(LN(price / LAG(price, :r_len) OVER (ORDER BY rn))) AS returns
+        FROM ordered
+    ),
+    binned AS (
+        {bins}
+    )
+    SELECT name, bin, COUNT(*) AS count, MIN(value) AS low, MAX(value) AS high
+    FROM binned
+    GROUP BY name, bin
+"""
+
+# Bin of a positive value on the LogHistogram grid, -1 for zeros. Values outside
+# the grid go to the edge bins, like the np.clip of LogHistogram.add.
+BIN = """
+        SELECT
+            '{name}' AS name,
+            CASE WHEN {name} = 0 THEN -1
+                 ELSE {greatest}(0, {least}(:n_bins - 1, FLOOR((LOG10({name}) - :min_exp) * :per_decade)))
+            END AS bin,
+            {name} AS value
+        FROM series
+        WHERE {name} IS NOT NULL
+"""
+
+EDGES = """
+    WITH {trades}
+    SELECT * FROM (
+        SELECT 'head' AS part, rn, sign, price, quantity, ms FROM ordered ORDER BY rn LIMIT :rows
+    ) head
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'tail' AS part, rn, sign, price, quantity, ms FROM ordered ORDER BY rn DESC LIMIT :rows
+    ) tail
+"""
+
+def sql_correlation_partial(engine: Engine, start_time: dt.datetime, end_time: dt.datetime,
+                            k_max: int, r_len: int, table: str = "trades") -> Partial:
+    """
+
+    Compute the lagged product sums of a time range inside the database.
+
+    The per-lag products are reduced inside the database, in one ordered pass
+    over the trades per `LAGS_PER_QUERY` lags (`LAG(x, k) OVER (ORDER BY rn)`
+    columns), so only k_max sums and a few boundary rows leave the database
+    instead of every trade.
+
+
+    Args:
+        engine: SQLAlchemy engine of the trades database.
+        start_time: Start of the range (inclusive).
+        end_time: End of the range (inclusive).
+        k_max: Largest lag, in trades.
+        r_len: Number of trades each absolute log return spans.
+        table: Trades table.
+
+
+    Returns:
+        Partial result equal (up to floating point rounding) to
+        `correlations.partial_correlations` over the same trades.
+    """
+    params = {**_bounds(start_time, end_time), "r_len": r_len}
+    sums = {name: np.zeros(k_max) for name in ("sign", "size", "cross", "returns")}
+    with engine.connect() as conn:
+        trades = _trades_cte(conn, table)
+        for first in range(1, k_max + 1, LAGS_PER_QUERY):
+            lags = range(first, min(first + LAGS_PER_QUERY, k_max + 1))
+            query = LAG_SUMS.format(
+                trades=trades,
+                lagged=", ".join(LAGGED.format(lag=lag) for lag in lags),
+                sums=", ".join(SUMS.format(lag=lag) for lag in lags),
+            )
+            row = conn.execute(_query(query), params).mappings().one()
+            for name, values in sums.items():
+                values[first - 1:lags.stop - 1] = [row[f"{name}_sum_{lag}"] or 0.0 for lag in lags]
+        head, tail = _edges(conn, trades, params, k_max + r_len)
+    if head.empty:
+        return empty_partial()
+
+    n = int(tail["rn"].iloc[-1])
+    partial = partial_correlations([head], k_max, r_len)
+    partial["tail"] = partial_correlations([tail], k_max, r_len)["tail"]
+    partial["n"] = n
+    partial["n_ret"] = max(0, n - r_len)
+    partial["sums"] = sums
+    logger.info(f"Reduced {n} trades to lag sums in the database")
+
+    return partial
+
+def sql_histogram_partial(engine: Engine, start_time: dt.datetime, end_time: dt.datetime,
+                          r_len: int, table: str = "trades") -> Partial:
+    """
+
+    Compute the histograms of a time range inside the database.
+
+    Values are binned on the `histograms.LogHistogram` grid by a GROUP BY query,
+    so only the non-empty bin counts leave the database.
+
+
+    Args:
+        engine: SQLAlchemy engine of the trades database.
+        start_time: Start of the range (inclusive).
+        end_time: End of the range (inclusive).
+        r_len: Number of trades each absolute log return spans.
+        table: Trades table.
+
+
+    Returns:
+        Partial result equal to `histograms.partial_histograms` over the same
+        trades.
+    """
+    params = {
+        **_bounds(start_time, end_time), "r_len": r_len,
+        "min_exp": MIN_EXP, "per_decade": PER_DECADE, "n_bins": LogHistogram().counts.size,
+    }
+    with engine.connect() as conn:
+        trades = _trades_cte(conn, table)
+        # SQLite has no GREATEST/LEAST, its multi-argument MAX/MIN are the same.
+        greatest, least = ("GREATEST", "LEAST") if conn.dialect.name == "postgresql" else ("MAX", "MIN")
+        bins = " UNION ALL ".join(
+            BIN.format(name=name, greatest=greatest, least=least) for name in SERIES
+        )
+        counts = pd.read_sql(_query(HISTOGRAM_COUNTS.format(trades=trades, bins=bins)), conn, params=params)
+        head, tail = _edges(conn, trades, params, r_len)
+    if head.empty:
+        return empty_histograms()
+
+    histograms = {name: LogHistogram() for name in SERIES}
+    for name, rows in counts.groupby("name"):
+        histogram = histograms[name]
+        zeros = rows["bin"] < 0
+        histogram.zeros = int(rows.loc[zeros, "count"].sum())
+        positive = rows[~zeros]
+        if positive.empty:
+            continue
+        index = positive["bin"].to_numpy(dtype=np.int64)
+        np.add.at(histogram.counts, index, positive["count"].to_numpy(dtype=np.int64))
+        histogram.low = float(positive["low"].min())
+        histogram.high = float(positive["high"].max())
+
+    n = int(tail["rn"].iloc[-1])
+    return {
+        "n": n,
+        "histograms": histograms,
+        "first_time": int(round(head["ms"].iloc[0])),
+        "last_time": int(round(tail["ms"].iloc[-1])),
+        "first_prices": head["price"].to_numpy(dtype=np.float64)[:r_len],
+        "last_prices": tail["price"].to_numpy(dtype=np.float64)[-r_len:],
+    }
+
+def _query(sql: str) -> TextClause:
+    return text(sql).bindparams(bindparam("start_time", type_=DateTime), bindparam("end_time", type_=DateTime))
+
+def _bounds(start_time: dt.datetime, end_time: dt.datetime) -> dict:
+    return {
+        "start_time": naive_utc(start_time).to_pydatetime(),
+        "end_time": naive_utc(end_time).to_pydatetime(),
+    }
+
+def _trades_cte(conn: Connection, table: str) -> str:
+    if conn.dialect.name == "postgresql":
+        epoch_ms = "EXTRACT(EPOCH FROM time) * 1000"
+    else:
+        # SQLite stores timestamps as text.
+        epoch_ms = "ROUND((julianday(time) - 2440587.5) * 86400000.0)"
+    return TRADES_CTE.format(table=table, epoch_ms=epoch_ms)
+
+def _edges(conn: Connection, trades: str, params: dict, rows: int):
+    """Return the first and last `rows` trades of the range, in time order."""
+    edges = pd.read_sql(_query(EDGES.format(trades=trades)), conn, params={**params, "rows": rows})
+    edges = edges.astype({"ms": np.float64}).sort_values("rn", kind="stable")
+    head = edges[edges["part"] == "head"].reset_index(drop=True)
+    tail = edges[edges["part"] == "tail"].reset_index(drop=True)
+
+    return head, tail
@@ -0,0 +1,111 @@
+from typing import Callable, Iterable, Iterator, List
+import queue
+import threading
+import pandas as pd
+from utils import get_logger
+logger = get_logger("stream")
+
+_DONE = object()
+
+def batched(pages: Iterable[pd.DataFrame], batch_size: int) -> Iterator[pd.DataFrame]:
+    """
+
+    Regroup API pages into batches of exactly batch_size rows.
+
+
+    Args:
+        pages: Iterable of dataframes, typically the pages yielded by `extract_pages`.
+        batch_size: Number of rows in every batch but the last one.
+
+
+    Yields:
+        Pandas dataframe with batch_size rows (the last batch may be smaller).
+    """
+    pending: List[pd.DataFrame] = []
+    rows = 0
+    for page in pages:
+        pending.append(page)
+        rows += len(page)
+        if rows < batch_size:
+            continue
+        df = pd.concat(pending, ignore_index=True)
+        full = len(df) - len(df) % batch_size
+        for start in range(0, full, batch_size):
+            yield df.iloc[start:start + batch_size].reset_index(drop=True)
+        pending = [df.iloc[full:].reset_index(drop=True)] if full < len(df) else []
+        rows = len(df) - full
+
+    if rows:
+        yield pd.concat(pending, ignore_index=True)
+
+def run_stream(pages: Iterable[pd.DataFrame], sink: Callable[[pd.DataFrame], None],
+               batch_size: int = 50_000, max_pending: int = 2) -> int:
+    """
+
+    Push extracted pages through a sink in fixed-size batches, with backpressure.
+
+    Pages are consumed in the calling thread while a single worker thread passes
+    each batch to the sink (usually transform followed by load). At most
+    `max_pending` batches wait between the two, so downloading stalls whenever the
+    database falls behind and memory stays bounded by roughly
+    `(max_pending + 2) * batch_size` rows, whatever the size of the backlog.
+
+
+    Args:
+        pages: Iterable of dataframes, typically the pages yielded by `extract_pages`.
+        sink: Callable that processes one batch.
+        batch_size: Number of rows handed to the sink at a time.
+        max_pending: Maximum number of batches buffered ahead of the sink.
+
+
+    Returns:
+        Total number of rows passed to the sink.
+
+
+    Raises:
+        Exception: Any error raised by the pages iterable or by the sink. Once the
+            sink fails no further pages are downloaded.
+    """
+    batches: queue.Queue = queue.Queue(maxsize=max_pending)
+    errors: List[BaseException] = []
+    stop = threading.Event()
+
+    def consume():
+        while True:
+            batch = batches.get()
+            if batch is _DONE:
+                return
+            try:
+                sink(batch)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+                return
+
+    worker = threading.Thread(target=consume, name="stream-sink", daemon=True)
+    worker.start()
+
+    rows = 0
+    try:
+        for batch in batched(pages, batch_size):
+            if not _put(batches, batch, stop):
+                break
+            rows += len(batch)
+            logger.info(f"Queued batch of {len(batch)} rows ({rows} rows so far)")
+    finally:
+        _put(batches, _DONE, stop)
+        worker.join()
+
+    if errors:
+        raise errors[0]
+    return rows
+
+def _put(batches: queue.Queue, item, stop: threading.Event) -> bool:
+    """Block until the item is queued, giving up if the sink has failed."""
+    while not stop.is_set():
+        try:
+            batches.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
@@ -1,34 +1,153 @@
+from typing import Dict, Union
+from decimal import Decimal
+import numpy as np
 import pandas as pd
 
-def transform(df: pd.DataFrame) -> pd.DataFrame:
+ORDER_TYPES = ["Buy", "Sell"]
+# Most digits a fixed-point value may have and still fit an int64.
+MAX_FIXED_DIGITS = 18
+
+def transform(df: pd.DataFrame, scales: Union[Dict[str, int], None] = None) -> pd.DataFrame:
     """
-    
+
     Transform aggreated trades data.
 
 
     Args:
         df: Pandas dataframe of the aggregated trades.
+        scales: Decimals of the fixed-point columns, as built by
+            `fixed_point_scales` from the symbol's tick and step sizes. When given,
+            prices and quantities are kept as exact fixed-point integers instead
+            of floats.
 
 
     Returns:
-        Pandas dataframe of the transformed aggregated trades data.
+        Pandas dataframe of the transformed aggregated trades data. In fixed-point
+        mode `price`, `quantity` and `quote_qty` are int64 columns scaled by
+        10**scale and `quote_qty` is computed exactly as price * quantity.
+
+
+    Notes:
+        Every output column is parsed straight into a compact numpy array and the
+        result frame is built once, without intermediate copies: int64 trade ids,
+        float64 prices and quantities, `time` as a zero-copy datetime64[ms] view of
+        the int64 epoch-ms timestamps and `order_type` as a categorical backed by
+        int8 codes (0 = Buy, 1 = Sell).
     """
-    df["p"] = pd.to_numeric(df["p"], errors="coerce")
-    df["q"] = pd.to_numeric(df["q"], errors="coerce")
-    df["m"] = df["m"].map({True: "Sell", False: "Buy"}).astype("category")
-    df["T"] = pd.to_datetime(df["T"], unit="ms")
-    df["quote_qty"] = df["q"] * df["p"]
-    keep_cols = ["a", "p", "q", "quote_qty", "T", "m"]
-    df = df.loc[:, keep_cols]
-    df = df.rename(columns={
-        "a": "trade_id", 
-        "p": "price", 
-        "q": "quantity", 
-        "T": "time",
-        "m": "order_type"
-        })
-    df = df.drop_duplicates(subset=["trade_id"])
-
-    return df
-    
+    fixed = bool(scales)
+    if df.empty:
+        return _empty()
+
+    trade_id = np.asarray(df["a"], dtype=np.int64)
+    if fixed:
+        price = _to_fixed(df["p"], scales["price"])
+        quantity = _to_fixed(df["q"], scales["quantity"])
+        _check_product(price, quantity)
+    else:
+        price = _to_float(df["p"])
+        quantity = _to_float(df["q"])
+    timestamp = np.asarray(df["T"], dtype=np.int64)
+    is_sell = np.asarray(df["m"], dtype=np.int8)
+
+    keep = _first_occurrences(trade_id)
+    if keep is not None:
+        trade_id, price, quantity, timestamp, is_sell = (
+            trade_id[keep], price[keep], quantity[keep], timestamp[keep], is_sell[keep]
+        )
+
+    return pd.DataFrame(
+        {
+            "trade_id": trade_id,
+            "price": price,
+            "quantity": quantity,
+            "quote_qty": price * quantity,
+            "time": timestamp.view("datetime64[ms]"),
+            "order_type": pd.Categorical.from_codes(is_sell, categories=ORDER_TYPES),
+        },
+        copy=False,
+    )
+
+def fixed_point_scales(tick_size: str, step_size: str) -> Dict[str, int]:
+    """Return the decimals of the fixed-point columns for a symbol's tick and step sizes."""
+    price_scale, quantity_scale = scale_of(tick_size), scale_of(step_size)
+    return {
+        "price": price_scale,
+        "quantity": quantity_scale,
+        "quote_qty": price_scale + quantity_scale,
+    }
+
+def scale_of(increment: str) -> int:
+    """Return the number of decimals of a tick or step size (e.g. "0.00100000" -> 3)."""
+    exponent = Decimal(increment).normalize().as_tuple().exponent
+    return max(0, -exponent)
+
+def to_decimal_strings(values: np.ndarray, scale: int) -> np.ndarray:
+    """Render fixed-point integers as exact decimal strings (e.g. 123456, 2 -> "1234.56")."""
+    values = np.asarray(values, dtype=np.int64)
+    magnitude = np.abs(values)
+    whole = (magnitude // 10 ** scale).astype(str)
+    text = np.where(values < 0, np.char.add("-", whole), whole)
+    if scale == 0:
+        return text.astype(object)
+    fraction = np.char.zfill((magnitude % 10 ** scale).astype(str), scale)
+
+    return np.char.add(np.char.add(text, "."), fraction).astype(object)
+
+def as_float(df: pd.DataFrame, column: str,
+             scales: Union[Dict[str, int], None] = None) -> np.ndarray:
+    """Return a price/quantity column as floats, undoing fixed-point scaling."""
+    values = df[column].to_numpy(dtype=np.float64)
+    scale = (scales or {}).get(column)
+    if scale:
+        values = values / 10.0 ** scale
+
+    return values
+
+def _to_fixed(column: pd.Series, scale: int) -> np.ndarray:
+    """Parse decimal strings into int64 units of 10**-scale, refusing inexact values."""
+    parts = column.astype(str).str.strip().str.partition(".")
+    fraction = parts[2].str.rstrip("0")
+    if (fraction.str.len() > scale).any():
+        raise ValueError(f"Values have more than {scale} decimals, check the tick/step size")
+    digits = parts[0] + fraction.str.ljust(scale, "0")
+    if not digits.str.fullmatch(r"-?\d+").all():
+        raise ValueError("Values are not plain decimal strings")
+    if (digits.str.lstrip("-").str.len() > MAX_FIXED_DIGITS).any():
+        raise ValueError(f"Values do not fit a fixed-point column with {scale} decimals")
+
+    return digits.astype(np.int64).to_numpy()
+
+def _check_product(price: np.ndarray, quantity: np.ndarray):
+    if float(np.abs(price).max()) * float(np.abs(quantity).max()) >= 2.0 ** 63:
+        raise ValueError("Fixed-point quote quantity overflows int64, use smaller scales")
+
+def _to_float(column: pd.Series) -> np.ndarray:
+    """Parse a column of decimal strings (or numbers) into float64, NaN when invalid."""
+    try:
+        return np.asarray(column, dtype=np.float64)
+    except ValueError:
+        return pd.to_numeric(column, errors="coerce").to_numpy(dtype=np.float64)
+
+def _first_occurrences(trade_id: np.ndarray):
+    """Return the sorted positions of the first row of each trade id, or None when
+    there are no duplicates."""
+    if trade_id.size < 2 or (np.diff(trade_id) > 0).all():
+        return None
+    _, first = np.unique(trade_id, return_index=True)
+    if first.size == trade_id.size:
+        return None
+    first.sort()
+
+    return first
 
+def _empty() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "trade_id": np.empty(0, dtype=np.int64),
+            "price": np.empty(0, dtype=np.float64),
+            "quantity": np.empty(0, dtype=np.float64),
+            "quote_qty": np.empty(0, dtype=np.float64),
+            "time": np.empty(0, dtype="datetime64[ms]"),
+            "order_type": pd.Categorical.from_codes(np.empty(0, dtype=np.int8), categories=ORDER_TYPES),
+        }
+    )
@@ -1,9 +1,14 @@
-from typing import Union
+from typing import Dict, List, Tuple, Union
 import logging
 from logging import Logger
 from logging.handlers import RotatingFileHandler
+import asyncio
 import os
-from sqlalchemy import create_engine, text
+import threading
+import time
+import pandas as pd
+from sqlalchemy import create_engine, inspect, make_url, text
+from sqlalchemy.engine.base import Connection, Engine
 
 def get_logger(name: str) -> Logger:
     """
@@ -58,12 +63,206 @@ def get_logger(name: str) -> Logger:
 
     return logger
 
-def get_latest_trade_id(db_url: str) -> Union[int, None]:
+# Engines of the process by database URL, with the pid that created them.
+_engines: Dict[str, Tuple[int, Engine]] = {}
+_engines_lock = threading.Lock()
+
+def get_engine(db_url: str, pool_size: int = 5, max_overflow: int = 10, pool_recycle: int = 1800,
+               statement_timeout: Union[int, None] = None) -> Engine:
+    """
+
+    Return the shared engine of a database, creating it on first use.
+
+    Every caller of the process (ETL, dashboard pages re-run on each widget
+    interaction, worker threads) gets the same engine and therefore the same
+    connection pool, instead of opening new connections each time. Connections
+    are pre-pinged so ones dropped by the server are replaced transparently.
+
+
+    Args:
+        db_url (str): SQLAlchemy database URL.
+        pool_size (int): Connections kept open in the pool.
+        max_overflow (int): Extra connections allowed under load, closed when
+        returned to the pool.
+        pool_recycle (int): Seconds after which a connection is replaced.
+        statement_timeout (int | None): PostgreSQL statement timeout in
+        milliseconds, None for no timeout.
+
+
+    Returns:
+        Engine: Engine shared by every caller with the same URL.
+
+
+    Notes:
+        The options only apply when the engine is created: later calls with the
+        same URL return the existing engine whatever options they pass. A process
+        forked from the one that created the engine (e.g. a process pool worker)
+        gets a new engine, since pooled connections cannot be shared between
+        processes.
+    """
+    with _engines_lock:
+        pid, engine = _engines.get(db_url, (None, None))
+        if pid == os.getpid():
+            return engine
+
+        options = {"pool_pre_ping": True}
+        url = make_url(db_url)
+        if url.get_backend_name() != "sqlite":
+            options.update(pool_size=pool_size, max_overflow=max_overflow, pool_recycle=pool_recycle)
+        if statement_timeout is not None and url.get_backend_name() == "postgresql":
+            options["connect_args"] = {"options": f"-c statement_timeout={int(statement_timeout)}"}
+        engine = create_engine(url, **options)
+        _engines[db_url] = (os.getpid(), engine)
+
+    return engine
+
+def get_latest_trade_id(db_url: str, table: str = "trades") -> Union[int, None]:
     """Query database for latest trade id stored."""
-    engine = create_engine(db_url)
-    query = text("SELECT MAX(trade_id) FROM trades;")
+    engine = get_engine(db_url)
+    if not inspect(engine).has_table(table):
+        return None
+    query = text(f"SELECT MAX(trade_id) FROM {table};")
     with engine.connect() as conn:
         results = conn.execute(query).fetchall()
     
     return results[0][0]
 
+CHECKPOINTS_DDL = """
+    CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+        symbol VARCHAR(20) PRIMARY KEY,
+        trade_id BIGINT NOT NULL,
+        updated_at TIMESTAMP NOT NULL
+    )
+"""
+
+def get_checkpoint(engine: Engine, symbol: str) -> Union[int, None]:
+    """
+
+    Return the last aggregated trade id committed for a symbol.
+
+
+    Args:
+        engine (Engine): SQLAlchemy engine used to connect to the database.
+        symbol (str): Trading pair symbol (e.g., "BTCUSDT").
+
+
+    Returns:
+        int | None: Trade id stored in `ingest_checkpoints`, or None when the symbol
+        has never been loaded (or the table does not exist yet).
+    """
+    if not inspect(engine).has_table("ingest_checkpoints"):
+        return None
+    query = text("SELECT trade_id FROM ingest_checkpoints WHERE symbol = :symbol;")
+    with engine.connect() as conn:
+        return conn.execute(query, {"symbol": symbol}).scalar()
+
+def save_checkpoint(conn: Connection, symbol: str, trade_id: int):
+    """
+
+    Record the last loaded trade id of a symbol.
+
+    Meant to run on the connection that loads the batch, so the checkpoint is
+    committed atomically with the trades it covers. The stored id never moves
+    backwards.
+
+
+    Args:
+        conn (Connection): Open connection inside the load transaction.
+        symbol (str): Trading pair symbol (e.g., "BTCUSDT").
+        trade_id (int): Highest aggregated trade id of the batch.
+    """
+    conn.execute(text(CHECKPOINTS_DDL))
+    conn.execute(
+        text("""
+            INSERT INTO ingest_checkpoints (symbol, trade_id, updated_at)
+            VALUES (:symbol, :trade_id, CURRENT_TIMESTAMP)
+            ON CONFLICT (symbol) DO UPDATE SET
+                trade_id = CASE
+                    WHEN excluded.trade_id > ingest_checkpoints.trade_id THEN excluded.trade_id
+                    ELSE ingest_checkpoints.trade_id
+                END,
+                updated_at = excluded.updated_at
+        """),
+        {"symbol": symbol, "trade_id": int(trade_id)}
+    )
+
+def trades_table(symbol: str, symbols: List[str]) -> str:
+    """
+
+    Return the name of the table holding the trades of a symbol.
+
+
+    Args:
+        symbol (str): Trading pair symbol (e.g., "BTCUSDT").
+        symbols (List[str]): Every symbol tracked by the pipeline.
+
+
+    Returns:
+        str: `trades` when a single pair is tracked, `trades_<symbol>` for each pair
+        of a watchlist.
+    """
+    if len(symbols) == 1:
+        return "trades"
+    return f"trades_{symbol.lower()}"
+
+def naive_utc(value) -> pd.Timestamp:
+    """Return a naive or timezone-aware time as a naive UTC timestamp, the way
+    trade times are stored."""
+    value = pd.Timestamp(value)
+    if value.tzinfo is not None:
+        value = value.tz_convert("UTC").tz_localize(None)
+
+    return value
+
+class WeightLimiter:
+    """
+
+    Thread-safe token bucket that keeps the request weight sent to Binance under
+    the exchange cap.
+
+    A single instance is meant to be shared by every worker of a run, whether they
+    are threads or coroutines. Each call to `acquire` reserves its weight up front,
+    so concurrent callers queue behind each other instead of all waking up at the
+    same time once the bucket refills.
+
+
+    Args:
+        max_weight (int): Request weight allowed per period (Binance default is 6000
+        per minute).
+        period (float): Length of the rate-limit window in seconds.
+    """
+    def __init__(self, max_weight: int = 6000, period: float = 60.0):
+        self.max_weight = max_weight
+        self.period = period
+        self._tokens = float(max_weight)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, weight: int) -> float:
+        """Reserve weight and return how many seconds the caller must wait."""
+        with self._lock:
+            now = time.monotonic()
+            rate = self.max_weight / self.period
+            self._tokens = min(self.max_weight, self._tokens + (now - self._updated) * rate)
+            self._updated = now
+            self._tokens -= weight
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / rate
+
+    def sync(self, used_weight: int):
+        """Align the bucket with the weight the exchange reports as already used."""
+        with self._lock:
+            self._tokens = min(self._tokens, float(self.max_weight - used_weight))
+
+    def acquire(self, weight: int = 1):
+        """Block until `weight` units can be spent without exceeding the cap."""
+        delay = self._reserve(weight)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, weight: int = 1):
+        """Same as `acquire`, but yields to the event loop while waiting."""
+        delay = self._reserve(weight)
+        if delay > 0:
+            await asyncio.sleep(delay)
@@ -0,0 +1,107 @@
+import pytest
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+
+START = 1_609_459_200_000  # 2021-01-01 00:00:00 UTC
+
+def make_trades(n=2_000, seed=0, first_id=0, span_ms=None):
+    """
+
+    Synthetic transformed trades: a log-normal random walk of prices with
+    exponential quantities and random sides, from 2021-01-01.
+
+
+    Args:
+        n: Number of trades.
+        seed: Seed of the random generator.
+        first_id: trade_id of the first trade, the others following one by one.
+        span_ms: When given, trade times are drawn uniformly over this many
+            milliseconds; otherwise they are about 100 ms apart.
+    """
+    rng = np.random.default_rng(seed)
+    if span_ms is None:
+        offsets = rng.geometric(0.01, n).cumsum()
+    else:
+        offsets = np.sort(rng.integers(0, span_ms, n))
+    return pd.DataFrame({
+        "trade_id": np.arange(first_id, first_id + n),
+        "price": 40_000 * np.exp(rng.normal(0, 1e-4, n).cumsum()),
+        "quantity": rng.exponential(1.0, n),
+        "quote_qty": 0.0,
+        "time": pd.to_datetime(START + offsets, unit="ms"),
+        "order_type": pd.Categorical(rng.choice(["Buy", "Sell"], n), categories=["Buy", "Sell"]),
+    })
+
+def with_sign(trades):
+    """Add the +1 (buy) / -1 (sell) `sign` column the analytics read."""
+    return trades.assign(sign=np.where(trades["order_type"] == "Sell", -1, 1))
+
+def mock_agg_trade(trade_id):
+    return {
+        "a": trade_id,
+        "p": "0.01633102",
+        "q": "4.70443515",
+        "f": trade_id,
+        "l": trade_id,
+        "T": trade_id * 10,
+        "m": trade_id % 2 == 0,
+        "M": True
+    }
+
+
+class MockBinanceHandler(BaseHTTPRequestHandler):
+    """Serve /api/v3/aggTrades from the contiguous ranges of trade ids in
+    `server.books`, answering with the queued `server.statuses` first (None drops
+    the connection without a response)."""
+    def do_GET(self):
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        self.server.requests_seen.append(self.path)
+        if self.server.statuses:
+            status = self.server.statuses.pop(0)
+            if status is None:
+                self.close_connection = True
+                return
+            self.send_response(status)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        book = self.server.books[params["symbol"]]
+        limit = int(params.get("limit", 500))
+        if "fromId" in params:
+            first = max(int(params["fromId"]), book.start)
+        elif "startTime" in params:
+            first = max(-(-int(params["startTime"]) // 10), book.start)
+        else:
+            first = max(book.stop - limit, book.start)
+        ids = range(first, min(first + limit, book.stop))
+
+        body = json.dumps([mock_agg_trade(i) for i in ids]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-MBX-USED-WEIGHT-1M", "4")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def mock_server(request):
+    """Local mock of the Binance REST API serving the `BOOKS` of the test module."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockBinanceHandler)
+    server.books = request.module.BOOKS
+    server.statuses = []
+    server.requests_seen = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
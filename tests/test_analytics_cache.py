@@ -0,0 +1,138 @@
+import os
+import sys
+import datetime as dt
+import pandas as pd
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
+sys.path.append(parent_dir)
+
+from analytics_cache import PartialCache, hour_pieces
+
+START = pd.Timestamp("2021-01-01 00:00")
+HOUR_END = pd.Timedelta(hours=1) - pd.Timedelta(1, "ms")
+
+class Recorder:
+    """compute callback returning the piece bounds and recording each call."""
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, bounds):
+        self.calls.append(bounds)
+        return [(start, end) for start, end in bounds]
+
+
+def test_hour_pieces_split_at_full_hours():
+    pieces = hour_pieces(
+        dt.datetime(2021, 1, 1, 10, 30, tzinfo=dt.timezone.utc), pd.Timestamp("2021-01-01 12:59:59.999")
+    )
+
+    assert [(str(start), str(end), whole) for start, end, whole in pieces] == [
+        ("2021-01-01 10:30:00", "2021-01-01 10:59:59.999000", False),
+        ("2021-01-01 11:00:00", "2021-01-01 11:59:59.999000", True),
+        ("2021-01-01 12:00:00", "2021-01-01 12:59:59.999000", True),
+    ]
+
+
+def test_only_missing_hours_are_computed(tmp_path):
+    compute = Recorder()
+    complete = START + pd.Timedelta(hours=10)
+
+    first = PartialCache(str(tmp_path)).partials(
+        "test", ("a", 1), START, START + pd.Timedelta(hours=4) + HOUR_END, compute, complete_before=complete
+    )
+    # A new instance (e.g. after a restart) reads the same entries back.
+    second = PartialCache(str(tmp_path)).partials(
+        "test", ("a", 1), START + pd.Timedelta(hours=1), START + pd.Timedelta(hours=6) + HOUR_END, compute,
+        complete_before=complete,
+    )
+
+    assert len(first) == 5 and len(second) == 6
+    assert [start.hour for start, _ in compute.calls[1]] == [5, 6]
+    assert second[:4] == first[1:]
+
+
+def test_incomplete_hours_and_other_params_are_not_reused(tmp_path):
+    cache = PartialCache(str(tmp_path))
+    compute = Recorder()
+
+    for params in [("a", 1), ("a", 1), ("a", 2)]:
+        cache.partials(
+            "test", params, START, START + pd.Timedelta(hours=2) + HOUR_END, compute,
+            complete_before=START + pd.Timedelta(hours=2),
+        )
+
+    assert [len(bounds) for bounds in compute.calls] == [3, 1, 3]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = PartialCache(str(tmp_path))
+    complete = START + pd.Timedelta(days=1)
+    for hour in range(3):
+        start = START + pd.Timedelta(hours=hour)
+        cache.partials("test", "a", start, start + HOUR_END, Recorder(), complete_before=complete)
+        os.utime(next((tmp_path / "test").rglob(f"*{hour:02d}.pkl.z")), (hour, hour))
+    size = sum(path.stat().st_size for path in tmp_path.rglob("*.pkl.z"))
+
+    cache.max_bytes = size - 1
+    cache.evict()
+
+    assert sorted(path.name[-8:] for path in tmp_path.rglob("*.pkl.z")) == ["01.pkl.z", "02.pkl.z"]
+
+
+def test_unreadable_entries_are_recomputed(tmp_path):
+    cache = PartialCache(str(tmp_path))
+    compute = Recorder()
+    complete = START + pd.Timedelta(days=1)
+    cache.partials("test", "a", START, START + HOUR_END, compute, complete_before=complete)
+    next(tmp_path.rglob("*.pkl.z")).write_bytes(b"garbage")
+
+    cache.partials("test", "a", START, START + HOUR_END, compute, complete_before=complete)
+
+    assert len(compute.calls) == 2
+
+
+def test_pieces_stream_in_order_in_batches(tmp_path):
+    cache = PartialCache(str(tmp_path))
+    compute = Recorder()
+    complete = START + pd.Timedelta(days=1)
+    end = START + pd.Timedelta(hours=5) + HOUR_END
+    cache.partials("test", "a", START + pd.Timedelta(hours=2), START + pd.Timedelta(hours=2) + HOUR_END,
+                   compute, complete_before=complete)
+
+    pieces = cache.iter_partials("test", "a", START, end, compute, complete_before=complete, batch_size=2)
+    first = next(pieces)
+    pieces.close()
+    streamed = list(cache.iter_partials("test", "a", START, end, compute, complete_before=complete, batch_size=2))
+
+    assert first == ((START, START + HOUR_END), (START, START + HOUR_END))
+    assert [bounds[0].hour for bounds, _ in streamed] == [0, 1, 2, 3, 4, 5]
+    assert all(bounds == value for bounds, value in streamed)
+    # Hour 2 was cached, and the batch computed before the iteration was closed.
+    assert [[start.hour for start, _ in bounds] for bounds in compute.calls[1:]] == [[0, 1], [3, 4], [5]]
+
+
+def test_yielded_results_are_passed_on_one_piece_at_a_time(tmp_path):
+    cache = PartialCache(str(tmp_path))
+    complete = START + pd.Timedelta(days=1)
+    end = START + pd.Timedelta(hours=3) + HOUR_END
+    done = []
+
+    def compute(bounds):
+        try:
+            for start, end in bounds:
+                done.append(start.hour)
+                yield start, end
+        finally:
+            done.append("closed")
+
+    pieces = cache.iter_partials("test", "a", START, end, compute, complete_before=complete, batch_size=4)
+    first = next(pieces)
+    assert done == [0]
+    pieces.close()
+
+    assert first == ((START, START + HOUR_END), (START, START + HOUR_END))
+    assert done == [0, "closed"]
+    # Only the piece passed on was computed and cached.
+    cache.partials("test", "a", START, end, compute, complete_before=complete)
+    assert done[2:] == [1, 2, 3, "closed"]
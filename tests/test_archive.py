@@ -0,0 +1,119 @@
+import pytest
+import os
+import sys
+import datetime as dt
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
+sys.path.append(parent_dir)
+
+from archive import read_trades, write_archive
+from load import load
+from transform import transform
+from utils import get_checkpoint
+
+START = 1_609_459_200_000  # 2021-01-01 00:00:00 UTC
+
+def make_raw(first_id, n, step_ms):
+    ids = np.arange(first_id, first_id + n)
+    return pd.DataFrame({
+        "a": ids,
+        "p": [f"{price:.2f}" for price in 40_000 + ids * 0.01],
+        "q": "0.50000",
+        "f": ids,
+        "l": ids,
+        "T": START + (ids - 1_000) * step_ms,
+        "m": ids % 2 == 0,
+        "M": True,
+    })
+
+def read_all(root, columns, **kwargs):
+    chunks = list(read_trades(
+        root, "BTCUSDT", dt.datetime(2020, 12, 31), dt.datetime(2021, 1, 10), columns, **kwargs
+    ))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+
+
+def test_archive_is_partitioned_by_symbol_and_date(tmp_path):
+    raw = make_raw(1_000, 48, 3_600_000)  # two days of hourly trades
+    write_archive(raw, transform(raw), str(tmp_path), "BTCUSDT")
+
+    for dataset in ("raw", "trades"):
+        dates = sorted(os.listdir(tmp_path / dataset / "symbol=BTCUSDT"))
+        assert dates == ["date=2021-01-01", "date=2021-01-02"]
+
+
+def test_read_trades_prunes_columns_and_filters_time(tmp_path):
+    raw = make_raw(1_000, 48, 3_600_000)
+    write_archive(raw, transform(raw), str(tmp_path), "BTCUSDT")
+
+    chunks = list(read_trades(
+        str(tmp_path), "BTCUSDT",
+        dt.datetime(2021, 1, 1, 12, tzinfo=dt.timezone.utc), dt.datetime(2021, 1, 2, 5),
+        columns=["time", "price", "sign"], chunk_rows=7,
+    ))
+    df = pd.concat(chunks, ignore_index=True)
+
+    assert [len(chunk) for chunk in chunks] == [7, 7, 4]
+    assert list(df.columns) == ["time", "price", "sign"]
+    assert df["time"].is_monotonic_increasing
+    assert df["time"].iloc[0] == pd.Timestamp("2021-01-01 12:00")
+    assert df["time"].iloc[-1] == pd.Timestamp("2021-01-02 05:00")
+    assert set(df["sign"]) == {-1, 1}
+
+
+def test_rewriting_a_batch_does_not_duplicate_trades(tmp_path):
+    raw = make_raw(1_000, 10, 1_000)
+    write_archive(raw, transform(raw), str(tmp_path), "BTCUSDT")
+    write_archive(raw, transform(raw), str(tmp_path), "BTCUSDT")
+
+    assert read_all(str(tmp_path), ["trade_id"])["trade_id"].tolist() == list(range(1_000, 1_010))
+
+
+def test_read_trades_skips_trades_archived_twice(tmp_path):
+    """A batch archived by a load that failed to commit, then archived again in
+    other batches by the retry, is read once."""
+    raw = make_raw(1_000, 20, 1_000)
+    write_archive(raw.iloc[5:15], transform(raw.iloc[5:15]), str(tmp_path), "BTCUSDT")
+    write_archive(raw.iloc[:10], transform(raw.iloc[:10]), str(tmp_path), "BTCUSDT")
+    write_archive(raw.iloc[10:], transform(raw.iloc[10:]), str(tmp_path), "BTCUSDT")
+
+    archived = read_all(str(tmp_path), ["time", "trade_id"], chunk_rows=6)
+    assert archived["trade_id"].tolist() == list(range(1_000, 1_020))
+    assert archived["time"].is_monotonic_increasing
+
+
+def test_load_archives_only_new_trades(tmp_path):
+    engine = create_engine("sqlite:///:memory:")
+    first, second = make_raw(1_000, 10, 1_000), make_raw(1_005, 10, 1_000)
+    scales = {"price": 2, "quantity": 5, "quote_qty": 7}
+
+    for raw in (first, second):
+        load(transform(raw, scales), engine, symbol="BTCUSDT", scales=scales,
+             archive=str(tmp_path), raw=raw)
+
+    archived = read_all(str(tmp_path), ["trade_id", "price"])
+    assert archived["trade_id"].tolist() == list(range(1_000, 1_015))
+    np.testing.assert_allclose(archived["price"], 40_000 + archived["trade_id"] * 0.01)
+    raw_files = list((tmp_path / "raw").rglob("*.parquet"))
+    assert sum(pd.read_parquet(path).shape[0] for path in raw_files) == 15
+
+
+def test_failed_archive_write_rolls_back_the_batch(tmp_path, monkeypatch):
+    engine = create_engine("sqlite:///:memory:")
+    raw = make_raw(1_000, 10, 1_000)
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr("load.write_archive", fail)
+        with pytest.raises(OSError):
+            load(transform(raw), engine, symbol="BTCUSDT", archive=str(tmp_path), raw=raw)
+
+    assert get_checkpoint(engine, "BTCUSDT") is None
+    load(transform(raw), engine, symbol="BTCUSDT", archive=str(tmp_path), raw=raw)
+    assert read_all(str(tmp_path), ["trade_id"])["trade_id"].tolist() == list(range(1_000, 1_010))
@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
+sys.path.append(parent_dir)
+
+from backfill import backfill, backfill_time_range, partition_range
+from utils import WeightLimiter
+
+FIRST_ID = 100
+LAST_ID = 5_432
+# Trade ids served by the mock exchange (see conftest.mock_server).
+BOOKS = {"BTCUSDT": range(FIRST_ID, LAST_ID + 1)}
+
+
+def test_partition_range_is_disjoint_and_complete():
+    partitions = partition_range(10, 35, 10)
+
+    assert partitions == [(10, 19), (20, 29), (30, 35)]
+
+
+def test_backfill_stitches_partitions_in_order(mock_server):
+    server, base_url = mock_server
+
+    df = backfill("BTCUSDT", 150, 4_321, workers=4, partition_size=700, base_url=base_url)
+
+    assert list(df["a"]) == list(range(150, 4_322))
+    assert len(server.requests_seen) == 6
+
+
+def test_backfill_time_range_resolves_trade_ids(mock_server):
+    _, base_url = mock_server
+
+    df = backfill_time_range("BTCUSDT", 2_000, end_time=3_000, workers=2,
+                             partition_size=30, base_url=base_url)
+
+    assert df["a"].iloc[0] == 200
+    assert df["a"].iloc[-1] == 299
+    assert len(df) == 100
+
+
+def test_backfill_until_latest_trade(mock_server):
+    _, base_url = mock_server
+
+    df = backfill_time_range("BTCUSDT", 50_000, workers=3, partition_size=200,
+                             base_url=base_url)
+
+    assert df["a"].iloc[0] == 5_000
+    assert df["a"].iloc[-1] == LAST_ID
+
+
+def test_weight_limiter_blocks_over_budget():
+    limiter = WeightLimiter(max_weight=10, period=0.5)
+
+    started = time.monotonic()
+    for _ in range(4):
+        limiter.acquire(5)
+    elapsed = time.monotonic() - started
+
+    assert elapsed >= 0.45
@@ -0,0 +1,172 @@
+import pytest
+import os
+import sys
+from functools import partial
+import numpy as np
+import pandas as pd
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
+sys.path.append(parent_dir)
+
+from conftest import make_trades, with_sign
+from archive import read_trades, write_archive
+from correlations import (
+    LagAccumulator, correlate_chunks, direct_lag_sums, empty_partial, iter_shard_partials, lag_sums,
+    merge_partials, parallel_correlations, partial_correlations, shard_bounds, shard_partials, to_frame
+)
+from transform import transform
+
+def direct_correlations(trades, k_max, r_len):
+    """The per-lag dot product loop the Correlations page used, on a single chunk."""
+    n = len(trades)
+    signs = np.concatenate([np.zeros(k_max), trades["sign"].to_numpy(dtype=np.float64)])
+    sizes = np.concatenate([np.zeros(k_max), signs[k_max:] * trades["quantity"].to_numpy()])
+    price = trades["price"].to_numpy()
+    returns = np.concatenate([np.zeros(k_max), np.abs(np.log(price[r_len:] / price[:-r_len]))])
+    n_ret = n - r_len
+
+    result = {name: np.zeros(k_max) for name in ("sign", "size", "cross", "returns")}
+    counts, counts_ret = np.zeros(k_max), np.zeros(k_max)
+    for i in range(1, k_max + 1):
+        result["sign"][i-1] = np.dot(signs[i:n+k_max], signs[:n+k_max-i])
+        result["size"][i-1] = np.dot(sizes[i:n+k_max], sizes[:n+k_max-i])
+        result["cross"][i-1] = np.dot(signs[i:n+k_max], sizes[:n+k_max-i])
+        result["returns"][i-1] = np.dot(returns[i:n_ret+k_max], returns[:n_ret+k_max-i])
+        counts[i-1] = n - i
+        counts_ret[i-1] = n - i - r_len
+
+    return pd.DataFrame({
+        "lag": np.arange(1, k_max + 1),
+        "autocorr_sign": result["sign"] / counts,
+        "autocorr_size": result["size"] / counts,
+        "autocorr_cross": result["cross"] / counts,
+        "autocorr_returns": result["returns"] / counts_ret,
+    })
+
+def chunked(df, size):
+    return (df.iloc[start:start + size] for start in range(0, len(df), size))
+
+
+@pytest.mark.parametrize("n, k_max, history", [(1_000, 10, 0), (20_000, 300, 300), (7, 40, 12)])
+def test_lag_sums_match_direct_method(n, k_max, history):
+    rng = np.random.default_rng(1)
+    x, y, past = rng.normal(size=n), rng.normal(size=n), rng.normal(size=history)
+
+    np.testing.assert_allclose(
+        lag_sums(x, y, past, k_max), direct_lag_sums(x, y, past, k_max), atol=1e-9
+    )
+
+
+@pytest.mark.parametrize("sizes", [[5_000], [1, 2, 3, 994, 4_000], [1_234, 3_766]])
+def test_lag_accumulator_matches_numpy_reference(sizes):
+    rng = np.random.default_rng(2)
+    x, y = rng.normal(size=5_000), rng.normal(size=5_000)
+    accumulator = LagAccumulator(30, [("x", "x"), ("x", "y")], rows=1_000)
+
+    for _ in range(2):  # a reset accumulator gives the same result again
+        accumulator.reset()
+        for start, end in zip(np.cumsum([0, *sizes[:-1]]), np.cumsum(sizes)):
+            accumulator.update(x=x[start:end], y=y[start:end])
+
+        lags = np.arange(1, 31)
+        np.testing.assert_allclose(
+            accumulator.sums[("x", "x")], [np.dot(x[lag:], x[:-lag]) for lag in lags], atol=1e-9
+        )
+        np.testing.assert_allclose(
+            accumulator.sums[("x", "y")], [np.dot(x[lag:], y[:-lag]) for lag in lags], atol=1e-9
+        )
+        assert accumulator.lag_counts().tolist() == (5_000 - lags).tolist()
+
+
+def test_single_chunk_matches_direct_correlations():
+    trades = with_sign(make_trades(5_000))
+
+    pd.testing.assert_frame_equal(
+        correlate_chunks([trades], 100, 20), direct_correlations(trades, 100, 20),
+        check_exact=False, rtol=1e-9,
+    )
+
+
+@pytest.mark.parametrize("chunk_size", [1, 37, 999, 1_000])
+def test_result_does_not_depend_on_chunking(chunk_size):
+    trades = with_sign(make_trades(2_000))
+
+    pd.testing.assert_frame_equal(
+        correlate_chunks(chunked(trades, chunk_size), 50, 10),
+        correlate_chunks([trades], 50, 10),
+        check_exact=False, rtol=1e-9,
+    )
+
+
+def test_lags_without_pairs_are_nan():
+    result = correlate_chunks([with_sign(make_trades(5))], 10, 2)
+
+    assert result["autocorr_sign"].iloc[:4].notna().all()
+    assert result["autocorr_sign"].iloc[4:].isna().all()
+    assert result["autocorr_returns"].iloc[2:].isna().all()
+
+
+@pytest.mark.parametrize("cuts", [[2_500], [3, 10, 11, 1_500], [0, 40, 1_999]])
+def test_merged_shards_match_single_pass(cuts):
+    trades = with_sign(make_trades(2_000))
+    edges = [0, *cuts, len(trades)]
+
+    total = empty_partial()
+    for start, end in zip(edges, edges[1:]):
+        shard = partial_correlations([trades.iloc[start:end]], 60, 25)
+        total = merge_partials(total, shard, 60, 25)
+
+    pd.testing.assert_frame_equal(
+        to_frame(total, 60), correlate_chunks([trades], 60, 25), check_exact=False, rtol=1e-9
+    )
+
+
+def test_shard_bounds_cover_the_range_without_overlap():
+    bounds = shard_bounds(pd.Timestamp("2021-01-01"), pd.Timestamp("2021-01-02"), 3)
+
+    assert bounds[0][0] == pd.Timestamp("2021-01-01")
+    assert bounds[-1][1] == pd.Timestamp("2021-01-02")
+    for (_, end), (start, _) in zip(bounds, bounds[1:]):
+        assert start - end == pd.Timedelta(1, "ms")
+
+
+def archived_source(trades, root):
+    """Archive the trades one minute apart from 2021-01-01 and return a picklable
+    source reading them back."""
+    ids = np.arange(1_000, 1_000 + len(trades))
+    raw = pd.DataFrame({
+        "a": ids, "p": trades["price"], "q": trades["quantity"], "f": ids, "l": ids,
+        "T": 1_609_459_200_000 + (ids - 1_000) * 60_000, "m": trades["sign"] < 0, "M": True,
+    })
+    write_archive(raw, transform(raw), root, "BTCUSDT")
+    return partial(read_trades, root, "BTCUSDT", columns=["price", "sign", "quantity"], chunk_rows=500)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_parallel_correlations_match_single_pass(tmp_path, workers):
+    trades = with_sign(make_trades(3_000))
+    source = archived_source(trades, str(tmp_path))
+
+    result = parallel_correlations(
+        source, pd.Timestamp("2021-01-01"), pd.Timestamp("2021-01-04"), 40, 15,
+        shards=7, workers=workers,
+    )
+
+    pd.testing.assert_frame_equal(
+        result, correlate_chunks([trades], 40, 15), check_exact=False, rtol=1e-9
+    )
+
+
+def test_shard_partials_stream_in_order(tmp_path):
+    source = archived_source(with_sign(make_trades(3_000)), str(tmp_path))
+    bounds = shard_bounds(pd.Timestamp("2021-01-01"), pd.Timestamp("2021-01-04"), 5)
+
+    streamed = iter_shard_partials(source, bounds, 40, 15, workers=2)
+    first = next(streamed)
+    streamed.close()
+    expected = shard_partials(source, bounds, 40, 15, workers=1)
+
+    pd.testing.assert_frame_equal(to_frame(first, 40), to_frame(expected[0], 40))
+    for shard, single in zip(iter_shard_partials(source, bounds, 40, 15, workers=2), expected, strict=True):
+        pd.testing.assert_frame_equal(to_frame(shard, 40), to_frame(single, 40))
@@ -0,0 +1,82 @@
+import pytest
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
+sys.path.append(parent_dir)
+
+from downsample import downsample_candles, lttb, min_max
+from rollups import coarsen
+
+def make_candles(n=1_000, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 40_000 * np.exp(rng.normal(0, 1e-3, n).cumsum())
+    open_ = np.concatenate([[40_000], close[:-1]])
+    return pd.DataFrame({
+        "bucket": pd.date_range("2021-01-01", periods=n, freq="h"),
+        "open": open_,
+        "high": np.maximum(open_, close) * (1 + rng.exponential(1e-3, n)),
+        "low": np.minimum(open_, close) * (1 - rng.exponential(1e-3, n)),
+        "close": close,
+        "volume": rng.exponential(10, n),
+        "trades_count": rng.integers(1, 1_000, n),
+        "signed_volume": rng.normal(0, 1, n),
+        "first_trade_id": np.arange(n) * 10,
+        "last_trade_id": np.arange(n) * 10 + 9,
+    })
+
+
+def test_lttb_keeps_endpoints_and_spikes():
+    x = pd.date_range("2021-01-01", periods=10_000, freq="min").to_numpy()
+    y = np.sin(np.linspace(0, 20, 10_000))
+    y[4_321] = 50.0
+
+    kept = lttb(x, y, 300)
+
+    assert len(kept) == 300
+    assert kept[0] == 0 and kept[-1] == 9_999
+    assert (np.diff(kept) > 0).all()
+    assert 4_321 in kept
+
+
+def test_lttb_returns_short_series_whole():
+    assert lttb(np.arange(5), np.arange(5), 10).tolist() == [0, 1, 2, 3, 4]
+    with pytest.raises(ValueError):
+        lttb(np.arange(5), np.arange(5), 2)
+
+
+def test_min_max_keeps_every_bucket_extreme():
+    y = np.random.default_rng(1).normal(size=10_000)
+    y[[17, 9_000]] = np.nan
+
+    kept = min_max(y, 200)
+
+    assert len(kept) <= 200
+    assert np.nanargmax(y) in kept and np.nanargmin(y) in kept
+    assert not np.isnan(y[kept]).any()
+
+
+def test_downsampled_candles_keep_extremes_and_totals():
+    candles = make_candles()
+
+    merged = downsample_candles(candles, 300)
+
+    assert len(merged) == 300
+    assert list(merged.columns) == list(candles.columns)
+    assert merged["high"].max() == candles["high"].max()
+    assert merged["low"].min() == candles["low"].min()
+    assert merged["open"].iloc[0] == candles["open"].iloc[0]
+    assert merged["close"].iloc[-1] == candles["close"].iloc[-1]
+    assert merged["trades_count"].sum() == candles["trades_count"].sum()
+    assert merged["bucket"].iloc[0] == candles["bucket"].iloc[0]
+
+
+def test_candles_are_kept_when_they_fit():
+    candles = make_candles(96)
+
+    assert downsample_candles(candles, 96) is candles
+    # Runs of 24 hourly candles are the daily candles.
+    pd.testing.assert_frame_equal(downsample_candles(candles, 4), coarsen(candles, "D"))
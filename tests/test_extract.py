@@ -1,15 +1,19 @@
 import pytest
 import os
 import sys
+import json
+import threading
 import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import pandas as pd
+import requests
 import responses
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
 sys.path.append(parent_dir)
 
-from extract import extract, _process_call
+from extract import extract, extract_pages, _process_call, decode_agg_trades, BinanceSession
 
 def mock_agg_trade(trade_id, time):
     return {
@@ -26,7 +30,7 @@ def mock_agg_trade(trade_id, time):
 
 @responses.activate
 def test_process_call_single_page():
-    """Test that _process_call builds df, returns last timestamp and next trade id"""
+    """Test that _process_call builds the page df, returns last timestamp and next trade id"""
     url = "https://api.binance.com/api/v3/aggTrades?symbol=BTCUSDT&starTime=1000&limit=1000"
 
     mock_data = [
@@ -41,7 +45,7 @@ def test_process_call_single_page():
         status=200
     )
 
-    df, last_time, next_trade_id = _process_call(url, pd.DataFrame())
+    df, last_time, next_trade_id = _process_call(url)
 
     assert len(df) == 2
     assert last_time == 2000
@@ -124,3 +128,136 @@ def test_extract_uses_trade_id_if_provided():
 
     assert len(df) == 1
     assert df.iloc[0]["a"] == 100
+
+
+@responses.activate
+def test_extract_pages_yields_one_batch_per_page():
+    """extract_pages() must yield each API page separately, in order."""
+    symbol = "BTCUSDT"
+    url_first = f"https://api.binance.com/api/v3/aggTrades?symbol={symbol}&fromId=1&limit=1000"
+    url_second = f"https://api.binance.com/api/v3/aggTrades?symbol={symbol}&fromId=3&limit=1000"
+
+    responses.add(
+        responses.GET,
+        url_first,
+        json=[
+            mock_agg_trade(trade_id=1, time=1000),
+            mock_agg_trade(trade_id=2, time=2000),
+        ],
+        status=200
+    )
+    responses.add(
+        responses.GET,
+        url_second,
+        json=[mock_agg_trade(trade_id=3, time=5000)],
+        status=200
+    )
+
+    pages = list(extract_pages(symbol, 0, trade_id=1, end_time=4000))
+
+    assert [len(page) for page in pages] == [2, 1]
+    assert list(pages[1]["a"]) == [3]
+
+
+@responses.activate
+def test_extract_stops_on_empty_page():
+    """An empty page means there are no newer trades yet."""
+    symbol = "BTCUSDT"
+    url_first = f"https://api.binance.com/api/v3/aggTrades?symbol={symbol}&fromId=1&limit=1000"
+    url_second = f"https://api.binance.com/api/v3/aggTrades?symbol={symbol}&fromId=2&limit=1000"
+
+    responses.add(responses.GET, url_first, json=[mock_agg_trade(trade_id=1, time=1000)], status=200)
+    responses.add(responses.GET, url_second, json=[], status=200)
+
+    df = extract(symbol, 0, trade_id=1, end_time=4000)
+
+    assert list(df["a"]) == [1]
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Answer with the queued error statuses first, then with a single trade."""
+    def do_GET(self):
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = json.dumps([mock_agg_trade(trade_id=7, time=1000)] if status == 200 else {}).encode()
+        self.send_response(status)
+        if status in (418, 429):
+            self.send_header("Retry-After", "0")
+        self.send_header("X-MBX-USED-WEIGHT-1M", "5990")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def flaky_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    server.statuses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}/api/v3/aggTrades?symbol=BTCUSDT&fromId=7&limit=1000"
+    server.shutdown()
+    server.server_close()
+
+
+def test_session_retries_transient_errors(flaky_server):
+    """429/5xx responses are retried by the session instead of failing the run."""
+    server, url = flaky_server
+    server.statuses = [429, 503, 502]
+    session = BinanceSession(retries=5, backoff=0)
+
+    df, last_time, next_trade_id = _process_call(url, session)
+
+    assert server.statuses == []
+    assert list(df["a"]) == [7]
+    assert next_trade_id == 8
+
+
+def test_session_gives_up_after_max_retries(flaky_server):
+    server, url = flaky_server
+    server.statuses = [500, 500, 500]
+    session = BinanceSession(retries=1, backoff=0)
+
+    with pytest.raises(requests.HTTPError):
+        _process_call(url, session)
+
+
+def test_session_syncs_used_weight(flaky_server):
+    """The X-MBX-USED-WEIGHT-1M header drains the local weight budget."""
+    _, url = flaky_server
+    session = BinanceSession()
+
+    _process_call(url, session)
+
+    assert session.limiter._tokens <= 6000 - 5990
+
+
+def test_decode_agg_trades_matches_json_path():
+    """The bytes-level decoder must give the same values as json + DataFrame."""
+    data = [mock_agg_trade(trade_id=i, time=1_700_000_000_000 + i) for i in range(5)]
+    data[2]["m"] = False
+    for separators in [(",", ":"), (", ", ": ")]:
+        body = json.dumps(data, separators=separators).encode()
+
+        df = decode_agg_trades(body)
+        expected = pd.DataFrame(data)
+
+        assert list(df.columns) == list(expected.columns)
+        assert df["a"].tolist() == expected["a"].tolist()
+        assert df["p"].tolist() == pd.to_numeric(expected["p"]).tolist()
+        assert df["q"].tolist() == pd.to_numeric(expected["q"]).tolist()
+        assert df["T"].tolist() == expected["T"].tolist()
+        assert df["m"].tolist() == expected["m"].tolist()
+
+
+def test_decode_agg_trades_falls_back_on_unexpected_layout():
+    body = json.dumps([{"p": "1.5", "a": 1, "q": "2", "T": 10, "m": True}]).encode()
+
+    df = decode_agg_trades(body)
+
+    assert df["a"].tolist() == [1]
+    assert df["p"].tolist() == ["1.5"]
+    assert decode_agg_trades(b"[]").empty
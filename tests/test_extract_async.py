@@ -0,0 +1,85 @@
+import os
+import sys
+import threading
+import time
+import pandas as pd
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
+sys.path.append(parent_dir)
+
+from extract_async import extract_many
+
+# Trade ids served for each symbol by the mock exchange (see conftest.mock_server).
+BOOKS = {
+    "BTCUSDT": range(1, 2_501),
+    "ETHUSDT": range(10, 1_210),
+    "SOLUSDT": range(5, 6),
+}
+
+
+def test_extract_many_pages_every_symbol(mock_server):
+    _, base_url = mock_server
+
+    frames = extract_many(list(BOOKS), 0, trade_ids={"ETHUSDT": 500},
+                          end_time=100_000, base_url=base_url)
+
+    assert list(frames["BTCUSDT"]["a"]) == list(range(1, 2_501))
+    assert list(frames["ETHUSDT"]["a"]) == list(range(500, 1_210))
+    assert list(frames["SOLUSDT"]["a"]) == [5]
+
+
+def test_extract_many_feeds_each_symbol_to_sink(mock_server):
+    _, base_url = mock_server
+    received = {"BTCUSDT": [], "ETHUSDT": []}
+
+    def sink(symbol, df):
+        received[symbol].append(df)
+
+    frames = extract_many(["BTCUSDT", "ETHUSDT"], 0, end_time=100_000, sink=sink,
+                          base_url=base_url, batch_size=800)
+
+    assert frames == {}
+    assert [len(df) for df in received["BTCUSDT"]] == [800, 800, 800, 100]
+    assert [len(df) for df in received["ETHUSDT"]] == [800, 400]
+    assert list(pd.concat(received["BTCUSDT"])["a"]) == list(range(1, 2_501))
+
+
+def test_extract_many_bounds_concurrent_sinks(mock_server):
+    _, base_url = mock_server
+    lock = threading.Lock()
+    running, most = 0, 0
+
+    def sink(symbol, df):
+        nonlocal running, most
+        with lock:
+            running += 1
+            most = max(most, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+
+    extract_many(list(BOOKS), 0, end_time=100_000, sink=sink, base_url=base_url,
+                 batch_size=300, sinks=2)
+
+    assert most == 2
+
+
+def test_extract_many_retries_rate_limited_requests(mock_server):
+    server, base_url = mock_server
+    server.statuses = [429, 503]
+
+    frames = extract_many(["SOLUSDT"], 0, end_time=100_000, backoff=0, base_url=base_url)
+
+    assert server.statuses == []
+    assert list(frames["SOLUSDT"]["a"]) == [5]
+
+
+def test_extract_many_retries_dropped_connections(mock_server):
+    server, base_url = mock_server
+    server.statuses = [None, None]
+
+    frames = extract_many(["SOLUSDT"], 0, end_time=100_000, backoff=0, base_url=base_url)
+
+    assert server.statuses == []
+    assert list(frames["SOLUSDT"]["a"]) == [5]
@@ -0,0 +1,77 @@
+import pytest
+import os
+import sys
+import struct
+import numpy as np
+import pandas as pd
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
+sys.path.append(parent_dir)
+
+from conftest import make_trades
+from fetch import COPY_SIGNATURE, decode_copy_rows, fetch_signed_trades
+from load import load
+from utils import get_engine
+
+PG_EPOCH = pd.Timestamp("2000-01-01")
+
+def copy_payload(rows, extension=b""):
+    """Render rows of (time, trade_id, price, sign, quantity) the way PostgreSQL's
+    binary COPY does, one field at a time."""
+    parts = [COPY_SIGNATURE, struct.pack(">iI", 0, len(extension)), extension]
+    for time, trade_id, price, sign, quantity in rows:
+        micros = (time - PG_EPOCH) // pd.Timedelta(1, "us")
+        parts.append(struct.pack(">h", 5))
+        parts.append(struct.pack(">iq", 8, micros))
+        parts.append(struct.pack(">iq", 8, trade_id))
+        parts.append(struct.pack(">id", 8, price))
+        parts.append(struct.pack(">ih", 2, sign))
+        parts.append(struct.pack(">id", 8, quantity))
+    parts.append(struct.pack(">h", -1))
+    return b"".join(parts)
+
+def test_binary_copy_rows_are_decoded_in_bulk():
+    rows = [
+        (pd.Timestamp("2021-01-01 00:00:00.123456"), 7, 40_000.5, -1, 0.25),
+        (pd.Timestamp("1999-12-31 23:59:59"), 8, 1e-8, 1, 3.0),
+    ]
+
+    chunk = decode_copy_rows(copy_payload(rows, extension=b"ext"))
+
+    assert chunk["time"].tolist() == [row[0] for row in rows]
+    assert chunk["trade_id"].tolist() == [7, 8]
+    assert chunk["price"].tolist() == [40_000.5, 1e-8]
+    assert chunk["sign"].dtype == np.int8 and chunk["sign"].tolist() == [-1, 1]
+    assert chunk["quantity"].tolist() == [0.25, 3.0]
+
+
+def test_empty_copy_payload():
+    assert decode_copy_rows(copy_payload([])).empty
+
+
+@pytest.mark.parametrize("payload", [
+    b"not a copy payload",
+    # Null quantity: the field has length -1 and no data.
+    copy_payload([(PG_EPOCH, 1, 1.0, 1, 1.0)])[:-14] + struct.pack(">ih", -1, -1),
+])
+def test_unexpected_payloads_are_rejected(payload):
+    with pytest.raises(ValueError):
+        decode_copy_rows(payload)
+
+
+def test_cursor_batches_match_the_table(tmp_path):
+    trades = make_trades(2_500)
+    engine = get_engine(f"sqlite:///{tmp_path / 'trades.db'}")
+    load(trades, engine, rollups=False)
+    start, end = trades["time"].iloc[100], trades["time"].iloc[2_199]
+
+    chunks = list(fetch_signed_trades(engine, start, end, chunk_rows=700))
+    fetched = pd.concat(chunks, ignore_index=True)
+    expected = trades.iloc[100:2_200].reset_index(drop=True)
+
+    assert [len(chunk) for chunk in chunks] == [700, 700, 700]
+    assert fetched["time"].tolist() == expected["time"].tolist()
+    np.testing.assert_allclose(fetched["price"], expected["price"])
+    np.testing.assert_allclose(fetched["quantity"], expected["quantity"])
+    assert fetched["sign"].tolist() == np.where(expected["order_type"] == "Sell", -1, 1).tolist()
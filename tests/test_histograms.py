@@ -0,0 +1,52 @@
+import pytest
+import os
+import sys
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
+sys.path.append(parent_dir)
+
+from conftest import make_trades
+from histograms import LogHistogram, merge_histograms, partial_histograms, PER_DECADE
+
+def counts(partial):
+    return {name: (h.counts.tolist(), h.zeros) for name, h in partial["histograms"].items()}
+
+
+def test_log_bins_match_numpy_histogram():
+    rng = np.random.default_rng(1)
+    values = np.concatenate([rng.lognormal(0, 3, 100_000), np.zeros(7)])
+    histogram = LogHistogram()
+    histogram.add(values)
+
+    edges, binned = histogram.bins(50)
+    expected, _ = np.histogram(values[values > 0], bins=edges)
+
+    assert histogram.zeros == 7
+    assert binned.sum() == 100_000
+    assert edges[0] == values[values > 0].min() and edges[-1] == values.max()
+    # Only the fine bins straddling an edge may land on the neighbouring bin.
+    width = np.log10(edges[1] / edges[0])
+    assert np.abs(binned - expected).max() <= expected.max() * 2 / (PER_DECADE * width)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 999, 3_000])
+def test_histograms_do_not_depend_on_chunking(chunk_size):
+    trades = make_trades(3_000)
+    chunks = (trades.iloc[start:start + chunk_size] for start in range(0, len(trades), chunk_size))
+
+    assert counts(partial_histograms(chunks, 10)) == counts(partial_histograms([trades], 10))
+
+
+def test_merged_runs_count_every_difference_and_return():
+    trades = make_trades(3_000)
+    first = partial_histograms([trades.iloc[:1_000]], 10)
+    second = partial_histograms([trades.iloc[1_000:]], 10)
+
+    merged = merge_histograms(first, second, 10)["histograms"]
+
+    assert merged["time_dif"].total == len(trades) - 1
+    assert merged["quantity"].total == len(trades)
+    assert merged["returns"].total == len(trades) - 10
+    assert counts({"histograms": merged}) == counts(partial_histograms([trades], 10))
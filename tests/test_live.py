@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
+sys.path.append(parent_dir)
+
+from conftest import mock_agg_trade
+from live import live_async
+from transform import transform
+
+# Trade ids available from the REST API of the mock exchange.
+BOOK = range(1, 1_000)
+
+def mock_event(trade_id):
+    return json.dumps({"e": "aggTrade", "E": trade_id * 10 + 1, "s": "BTCUSDT", **mock_agg_trade(trade_id)})
+
+
+def make_exchange(connections, interval=0.0):
+    """Mock exchange whose n-th websocket connection streams the trade ids of
+    connections[n] then closes, and whose REST API serves BOOK."""
+    connections = list(connections)
+
+    async def stream(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        if not connections:
+            await ws.receive()
+            return ws
+        # Subscription responses carry no trade and must be skipped.
+        await ws.send_str(json.dumps({"result": None, "id": 1}))
+        for trade_id in connections.pop(0):
+            await ws.send_str(mock_event(trade_id))
+            await asyncio.sleep(interval)
+        await ws.close()
+        return ws
+
+    async def agg_trades(request):
+        params = request.query
+        if "fromId" in params:
+            first = max(int(params["fromId"]), BOOK.start)
+        else:
+            first = max(-(-int(params["startTime"]) // 10), BOOK.start)
+        ids = range(first, min(first + int(params["limit"]), BOOK.stop))
+        return web.json_response([mock_agg_trade(i) for i in ids])
+
+    app = web.Application()
+    app.router.add_get("/ws/btcusdt@aggTrade", stream)
+    app.router.add_get("/api/v3/aggTrades", agg_trades)
+    return TestServer(app, host="127.0.0.1")
+
+async def ingest(connections, last_id, interval=0.0, **kwargs):
+    """Run live ingestion against the mock exchange until trade last_id is
+    ingested, returning the batches passed to the sink."""
+    server = make_exchange(connections, interval)
+    await server.start_server()
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    batches = []
+
+    def sink(batch):
+        batches.append(batch)
+        if batch["a"].iloc[-1] >= last_id:
+            loop.call_soon_threadsafe(stop.set)
+
+    try:
+        url = str(server.make_url("")).rstrip("/")
+        rows = await asyncio.wait_for(live_async(
+            "BTCUSDT", sink, stop=stop, reconnect_delay=0.01, backoff=0.0,
+            stream_url=url.replace("http", "ws", 1), base_url=url, **kwargs
+        ), 10)
+    finally:
+        await server.close()
+    assert rows == sum(len(batch) for batch in batches)
+    return batches
+
+
+def test_reconnections_fill_gaps_without_duplicates():
+    # From the checkpoint to the first live trade, a reconnection overlapping
+    # the trades already streamed, then one that missed trades 101 to 109.
+    connections = [range(50, 81), range(78, 101), range(110, 121)]
+
+    batches = asyncio.run(ingest(connections, 120, trade_id=1, flush_rows=20))
+
+    ids = [trade_id for batch in batches for trade_id in batch["a"]]
+    assert ids == list(range(1, 121))
+    assert max(len(batch) for batch in batches) <= 20
+    assert not transform(batches[-1]).empty
+
+def test_batches_are_flushed_by_rows_and_time():
+    batches = asyncio.run(ingest([range(500, 525)], 524, flush_rows=10, flush_ms=200))
+
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+
+    batches = asyncio.run(ingest([range(500, 506)], 505, interval=0.1, flush_rows=1_000, flush_ms=20))
+
+    assert len(batches) > 1
+    assert [trade_id for batch in batches for trade_id in batch["a"]] == list(range(500, 506))
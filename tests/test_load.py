@@ -1,14 +1,15 @@
 import pytest
 import os
 import sys
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc, text
 import pandas as pd
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
 sys.path.append(parent_dir)
 
-from load import load
+from load import load, _CsvStream
+from utils import get_checkpoint
 
 def make_sample_df():
     return pd.DataFrame({
@@ -30,3 +31,65 @@ def test_load_trades_into_sqlite(tmp_path):
     assert result["trade_id"].tolist() == [12345, 12346]
     assert pytest.approx(result["price"].tolist(), rel=1e-6) == [40000.0, 40010.0]
 
+
+def test_load_skips_duplicate_trade_ids():
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE trades (trade_id BIGINT PRIMARY KEY, price NUMERIC, quantity NUMERIC, "
+            "quote_qty NUMERIC, time TIMESTAMP, order_type VARCHAR(6))"
+        ))
+    df = make_sample_df()
+    load(df, engine)
+    load(df, engine)
+    overlapping = pd.concat([df, make_sample_df().assign(trade_id=[12346, 12347])])
+    load(overlapping, engine)
+    result = pd.read_sql("SELECT * FROM trades ORDER BY trade_id", engine)
+
+    assert result["trade_id"].tolist() == [12345, 12346, 12347]
+
+def test_csv_stream_matches_to_csv():
+    df = pd.concat([make_sample_df()] * 5, ignore_index=True)
+    stream = _CsvStream(df, chunk_rows=3)
+    expected = df.to_csv(index=False, header=False)
+
+    parts = []
+    while True:
+        data = stream.read(7)
+        if not data:
+            break
+        parts.append(data)
+
+    assert "".join(parts) == expected
+    assert _CsvStream(df, chunk_rows=4).read() == expected
+
+def test_load_commits_checkpoint_with_batch():
+    engine = create_engine("sqlite:///:memory:")
+    assert get_checkpoint(engine, "BTCUSDT") is None
+
+    load(make_sample_df(), engine, symbol="BTCUSDT")
+    assert get_checkpoint(engine, "BTCUSDT") == 12346
+
+    load(make_sample_df().assign(trade_id=[12000, 12001]), engine, symbol="BTCUSDT")
+    assert get_checkpoint(engine, "BTCUSDT") == 12346
+    assert get_checkpoint(engine, "ETHUSDT") is None
+
+def test_failed_load_does_not_advance_checkpoint():
+    engine = create_engine("sqlite:///:memory:")
+    load(make_sample_df(), engine, symbol="BTCUSDT")
+    bad = make_sample_df().assign(trade_id=[20000, 20001], unknown_column=1)
+
+    with pytest.raises(exc.OperationalError):
+        load(bad, engine, symbol="BTCUSDT")
+
+    assert get_checkpoint(engine, "BTCUSDT") == 12346
+
+def test_csv_stream_writes_fixed_point_as_decimals():
+    df = make_sample_df().assign(price=[4000000, 4001000], quantity=[100, 200])
+    df = df.assign(quote_qty=df["price"] * df["quantity"])
+    scales = {"price": 2, "quantity": 5, "quote_qty": 7}
+
+    lines = _CsvStream(df, scales).read().splitlines()
+
+    assert lines[0].split(",")[:4] == ["12345", "40000.00", "0.00100", "40.0000000"]
+    assert lines[1].split(",")[:4] == ["12346", "40010.00", "0.00200", "80.0200000"]
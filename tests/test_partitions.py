@@ -0,0 +1,53 @@
+import os
+import sys
+import datetime as dt
+import pandas as pd
+from sqlalchemy import create_engine
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
+sys.path.append(parent_dir)
+
+from partitions import ensure_partitions, month_bounds, partition_name, remember_partitions
+
+def test_month_bounds_cover_every_month_of_the_batch():
+    times = pd.Series(pd.to_datetime(["2025-12-31 23:59:59", "2026-01-01 00:00:00", "2026-03-15 12:00:00"]))
+
+    assert month_bounds(times) == [
+        (dt.date(2025, 12, 1), dt.date(2026, 1, 1)),
+        (dt.date(2026, 1, 1), dt.date(2026, 2, 1)),
+        (dt.date(2026, 3, 1), dt.date(2026, 4, 1)),
+    ]
+
+def test_partition_name():
+    assert partition_name("trades", dt.date(2026, 3, 1)) == "trades_2026_03"
+    assert partition_name("trades_ethusdt", dt.date(2026, 11, 1)) == "trades_ethusdt_2026_11"
+
+def test_ensure_partitions_is_a_no_op_without_partitioning():
+    engine = create_engine("sqlite:///:memory:")
+    times = pd.Series(pd.to_datetime(["2026-03-15"]))
+
+    with engine.begin() as conn:
+        assert ensure_partitions(conn, times) == []
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(str(statement))
+
+
+def test_partitions_are_cached_only_once_remembered(monkeypatch):
+    monkeypatch.setattr("partitions._known_partitions", set())
+    monkeypatch.setattr("partitions.is_partitioned", lambda conn, table: True)
+    conn = RecordingConnection()
+    times = pd.Series(pd.to_datetime(["2026-03-15"]))
+
+    assert ensure_partitions(conn, times) == ["trades_2026_03"]
+    # Not remembered, as if the load rolled back: the DDL is issued again.
+    assert ensure_partitions(conn, times) == ["trades_2026_03"]
+    remember_partitions(["trades_2026_03"])
+    assert ensure_partitions(conn, times) == []
+    assert len(conn.statements) == 2
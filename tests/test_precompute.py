@@ -0,0 +1,82 @@
+import os
+import sys
+import fcntl
+import pandas as pd
+import yaml
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
+sys.path.append(parent_dir)
+
+from conftest import make_trades, with_sign
+import precompute
+from analytics_cache import PartialCache
+from correlations import merge_partials, partial_correlations, to_frame
+from load import load
+from precompute import ANALYSIS_PRESETS, trade_source
+from rollups import loaded_until
+from utils import get_engine
+
+NOW = pd.Timestamp("2021-01-03 00:00")
+
+class Recorder:
+    """compute callback recording the bounds it is called with."""
+    def __init__(self, compute):
+        self.compute = compute
+        self.calls = []
+
+    def __call__(self, bounds):
+        self.calls.append([start for start, _ in bounds])
+        return self.compute(bounds)
+
+
+def test_presets_are_served_from_the_cache(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'trades.db'}"
+    engine = get_engine(db_url)
+    trades = make_trades(5_000, span_ms=48 * 3_600_000)
+    load(trades, engine)
+    cache = PartialCache(str(tmp_path / "cache"))
+
+    counts = precompute.precompute(engine, db_url, cache, now=NOW, k_max=10, r_len=5, workers=1)
+
+    assert counts == {"correlations": 48 + 1, "histograms": 48 + 1}
+    # What the Correlations page does for its presets: only the last, partly
+    # loaded hour and the instant at the end of the range are left to compute.
+    source, key = trade_source(db_url)
+    signed = with_sign(trades)
+    compute = Recorder(lambda bounds: [partial_correlations(source(start, end), 10, 5) for start, end in bounds])
+    for delta in ANALYSIS_PRESETS.values():
+        partials = cache.partials(
+            "correlations", (key, 10, 5), NOW - delta, NOW, compute, complete_before=loaded_until(engine)
+        )
+        total = partials[0]
+        for partial in partials[1:]:
+            total = merge_partials(total, partial, 10, 5)
+        expected = partial_correlations([signed[signed["time"] >= NOW - delta]], 10, 5)
+        pd.testing.assert_frame_equal(to_frame(total, 10), to_frame(expected, 10))
+
+    assert compute.calls == [[NOW - pd.Timedelta(hours=1), NOW]] * len(ANALYSIS_PRESETS)
+
+
+def test_nothing_is_done_without_trades(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'empty.db'}"
+
+    assert precompute.precompute(get_engine(db_url), db_url, PartialCache(str(tmp_path / "cache")), now=NOW) == {}
+
+
+def test_concurrent_runs_are_skipped(tmp_path, monkeypatch):
+    config = tmp_path / "config.yaml"
+    config.write_text(yaml.safe_dump({
+        "symbol": "BTCUSDT",
+        "database": {"url": f"sqlite:///{tmp_path / 'trades.db'}"},
+        "precompute": {"enabled": True, "cache_path": str(tmp_path / "cache")},
+    }))
+    runs = []
+    monkeypatch.setattr(precompute, "precompute", lambda *args, **kwargs: runs.append(kwargs))
+
+    with open(tmp_path / "cache.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        precompute.main(str(config))
+    precompute.main(str(config))
+
+    assert len(runs) == 1 and runs[0]["symbol"] == "BTCUSDT"
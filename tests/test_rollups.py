@@ -0,0 +1,121 @@
+import pytest
+import os
+import sys
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
+sys.path.append(parent_dir)
+
+from conftest import make_trades
+from load import load
+from rollups import aggregate, coarsen, loaded_until, rollup_table
+
+# Trades spread over three hours, so every rollup has several candles.
+SPAN_MS = 3 * 3_600_000
+
+def read_candles(engine, resolution):
+    df = pd.read_sql(f"SELECT * FROM {rollup_table('trades', resolution)} ORDER BY bucket", engine)
+    df["bucket"] = pd.to_datetime(df["bucket"])
+    return df
+
+
+def test_aggregate_builds_ohlcv():
+    trades = make_trades(4, span_ms=SPAN_MS)
+    trades["time"] = pd.to_datetime([0, 10_000, 70_000, 80_000], unit="ms")
+    trades["price"] = [10.0, 12.0, 9.0, 11.0]
+    trades["quantity"] = [1.0, 2.0, 3.0, 4.0]
+    trades["order_type"] = pd.Categorical(["Buy", "Sell", "Sell", "Buy"], categories=["Buy", "Sell"])
+
+    candles = aggregate(trades, "min")
+
+    assert candles["open"].tolist() == [10.0, 9.0]
+    assert candles["high"].tolist() == [12.0, 11.0]
+    assert candles["low"].tolist() == [10.0, 9.0]
+    assert candles["close"].tolist() == [12.0, 11.0]
+    assert candles["volume"].tolist() == [3.0, 7.0]
+    assert candles["trades_count"].tolist() == [2, 2]
+    assert candles["signed_volume"].tolist() == [-1.0, 1.0]
+
+
+def test_aggregate_undoes_fixed_point_scales():
+    trades = make_trades(100, span_ms=SPAN_MS)
+    fixed = trades.assign(
+        price=np.rint(trades["price"] * 100).astype(np.int64),
+        quantity=np.rint(trades["quantity"] * 100_000).astype(np.int64),
+    )
+    floats = fixed.assign(price=fixed["price"] / 100, quantity=fixed["quantity"] / 100_000)
+
+    candles = aggregate(fixed, "min", {"price": 2, "quantity": 5, "quote_qty": 7})
+
+    pd.testing.assert_frame_equal(candles, aggregate(floats, "min"))
+
+
+def test_coarsen_matches_direct_aggregation():
+    trades = make_trades(500, span_ms=SPAN_MS)
+
+    direct = aggregate(trades, "h")
+    coarse = coarsen(aggregate(trades, "min"), "h")
+
+    pd.testing.assert_frame_equal(direct, coarse, check_dtype=False)
+
+
+@pytest.mark.parametrize("order", [[0, 1, 2], [2, 0, 1]])
+def test_incremental_rollups_match_full_aggregation(order):
+    """Overlapping batches loaded in any order must end up as the full aggregation."""
+    engine = create_engine("sqlite:///:memory:")
+    trades = make_trades(500, span_ms=SPAN_MS)
+    batches = [trades.iloc[0:200], trades.iloc[150:400], trades.iloc[380:]]
+
+    for i in order:
+        load(batches[i], engine)
+
+    for resolution, freq in [("1m", "min"), ("1h", "h"), ("1d", "D")]:
+        stored = read_candles(engine, resolution)
+        expected = aggregate(trades, freq)
+        pd.testing.assert_frame_equal(
+            stored[expected.columns], expected, check_dtype=False, check_exact=False
+        )
+
+
+def test_reloading_whole_seconds_is_not_double_counted():
+    engine = create_engine("sqlite:///:memory:")
+    trades = make_trades(10, span_ms=SPAN_MS)
+    trades["time"] = pd.to_datetime(1_609_459_200_000 + np.arange(10) * 1000, unit="ms")
+
+    load(trades, engine)
+    load(trades, engine)
+
+    assert read_candles(engine, "1m")["trades_count"].sum() == 10
+
+
+def test_concurrent_loads_count_only_the_trades_they_insert(monkeypatch):
+    """Loads whose snapshots of the stored trades overlap must not both count them."""
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE trades (trade_id BIGINT PRIMARY KEY, price NUMERIC, quantity NUMERIC, "
+            "quote_qty NUMERIC, time TIMESTAMP, order_type VARCHAR(6))"
+        ))
+    # Both loads took their snapshot before the other one committed.
+    monkeypatch.setattr("load._new_rows", lambda conn, df, table: df)
+    trades = make_trades(500, span_ms=SPAN_MS)
+
+    load(trades.iloc[:300], engine)
+    load(trades.iloc[200:], engine)
+
+    stored = read_candles(engine, "1m")
+    expected = aggregate(trades, "min")
+    pd.testing.assert_frame_equal(stored[expected.columns], expected, check_dtype=False, check_exact=False)
+
+
+def test_loaded_until_is_the_minute_of_the_newest_trade():
+    engine = create_engine("sqlite:///:memory:")
+    assert loaded_until(engine) is None
+
+    trades = make_trades(10, span_ms=SPAN_MS)
+    load(trades, engine)
+
+    assert loaded_until(engine) == trades["time"].max().floor("min")
@@ -0,0 +1,87 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
+sys.path.append(parent_dir)
+
+from conftest import make_trades, with_sign
+from correlations import merge_partials, partial_correlations, to_frame
+from histograms import partial_histograms
+from load import load
+from sql_analytics import sql_correlation_partial, sql_histogram_partial
+
+START = pd.Timestamp("2021-01-01")
+END = pd.Timestamp("2021-01-02")
+
+def loaded(trades):
+    engine = create_engine("sqlite:///:memory:")
+    load(trades, engine, rollups=False)
+    return engine
+
+
+def test_sql_lag_sums_match_python():
+    trades = make_trades()
+    engine = loaded(trades)
+
+    result = sql_correlation_partial(engine, START, END, 20, 5)
+    expected = partial_correlations([with_sign(trades)], 20, 5)
+
+    assert (result["n"], result["n_ret"]) == (expected["n"], expected["n_ret"])
+    for name in expected["sums"]:
+        np.testing.assert_allclose(result["sums"][name], expected["sums"][name], rtol=1e-9, atol=1e-9)
+    pd.testing.assert_frame_equal(to_frame(result, 20), to_frame(expected, 20), rtol=1e-9)
+
+
+def test_sql_partials_merge_across_ranges():
+    trades = make_trades()
+    engine = loaded(trades)
+    middle = trades["time"].iloc[999]
+
+    first = sql_correlation_partial(engine, START, middle, 20, 5)
+    second = sql_correlation_partial(engine, middle + pd.Timedelta(1, "ms"), END, 20, 5)
+    expected = partial_correlations([with_sign(trades)], 20, 5)
+
+    pd.testing.assert_frame_equal(
+        to_frame(merge_partials(first, second, 20, 5), 20), to_frame(expected, 20), rtol=1e-9
+    )
+
+
+def test_sql_histograms_match_python():
+    trades = make_trades()
+    engine = loaded(trades)
+
+    result = sql_histogram_partial(engine, START, END, 5)
+    expected = partial_histograms([trades], 5)
+
+    assert (result["first_time"], result["last_time"]) == (expected["first_time"], expected["last_time"])
+    for name, histogram in expected["histograms"].items():
+        assert result["histograms"][name].counts.tolist() == histogram.counts.tolist()
+        assert result["histograms"][name].zeros == histogram.zeros
+
+
+def test_sql_histograms_clip_values_outside_the_grid():
+    trades = make_trades(300)
+    quantity = trades["quantity"].to_numpy().copy()
+    quantity[::3] = 1e-13
+    quantity[1::7] = 1e14
+    trades["quantity"] = quantity
+    engine = loaded(trades)
+
+    result = sql_histogram_partial(engine, START, END, 5)["histograms"]["quantity"]
+    expected = partial_histograms([trades], 5)["histograms"]["quantity"]
+
+    assert result.counts[0] == expected.counts[0] > 0
+    assert result.counts[-1] == expected.counts[-1] > 0
+    assert result.counts.tolist() == expected.counts.tolist()
+    assert result.zeros == expected.zeros == 0
+
+
+def test_empty_range():
+    engine = loaded(make_trades())
+
+    assert sql_correlation_partial(engine, END, END, 20, 5)["n"] == 0
+    assert sql_histogram_partial(engine, END, END, 5)["n"] == 0
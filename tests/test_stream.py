@@ -0,0 +1,77 @@
+import pytest
+import os
+import sys
+import threading
+import pandas as pd
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
+sys.path.append(parent_dir)
+
+from stream import batched, run_stream
+
+def make_pages(sizes):
+    start = 0
+    for size in sizes:
+        yield pd.DataFrame({"a": range(start, start + size)})
+        start += size
+
+
+def test_batched_yields_fixed_size_batches():
+    batches = list(batched(make_pages([3, 4, 1, 7, 2]), 5))
+
+    assert [len(batch) for batch in batches] == [5, 5, 5, 2]
+    assert list(pd.concat(batches)["a"]) == list(range(17))
+
+
+def test_run_stream_passes_every_row_in_order():
+    received = []
+
+    rows = run_stream(make_pages([1000] * 10), lambda batch: received.append(batch), batch_size=2500)
+
+    assert rows == 10_000
+    assert [len(batch) for batch in received] == [2500] * 4
+    assert list(pd.concat(received)["a"]) == list(range(10_000))
+
+
+def test_run_stream_applies_backpressure():
+    """The producer must not run more than max_pending batches ahead of the sink."""
+    release = threading.Event()
+    produced = []
+    consumed = []
+
+    def pages():
+        for page in make_pages([10] * 20):
+            produced.append(len(page))
+            yield page
+
+    def sink(batch):
+        release.wait()
+        consumed.append(len(batch))
+
+    worker = threading.Thread(target=run_stream, args=(pages(), sink), kwargs={"batch_size": 10, "max_pending": 2})
+    worker.start()
+    worker.join(timeout=0.5)
+
+    # One batch held by the sink, two queued and one blocked in put().
+    assert len(produced) <= 4
+    release.set()
+    worker.join()
+    assert sum(consumed) == 200
+
+
+def test_run_stream_stops_when_sink_fails():
+    produced = []
+
+    def pages():
+        for page in make_pages([10] * 100):
+            produced.append(len(page))
+            yield page
+
+    def sink(batch):
+        raise RuntimeError("database is down")
+
+    with pytest.raises(RuntimeError, match="database is down"):
+        run_stream(pages(), sink, batch_size=10, max_pending=1)
+
+    assert len(produced) < 100
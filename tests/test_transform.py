@@ -1,12 +1,14 @@
+import pytest
 import os
 import sys
+import numpy as np
 import pandas as pd
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
 sys.path.append(parent_dir)
 
-from transform import transform
+from transform import transform, fixed_point_scales, scale_of, to_decimal_strings
 
 def test_convert_trades_to_dataframe():
     raw = [
@@ -54,3 +56,64 @@ def test_convert_trades_to_dataframe():
     assert df["order_type"][1] == "Buy"
     assert len(df.columns) == 6
 
+
+def test_transform_uses_compact_dtypes():
+    raw = pd.DataFrame({
+        "a": [3, 1, 2, 3],
+        "p": ["10.5", "11.0", "12.25", "10.5"],
+        "q": ["2", "1", "4", "2"],
+        "f": [1, 1, 1, 1],
+        "l": [1, 1, 1, 1],
+        "T": [1000, 1001, 1002, 1000],
+        "m": [True, False, True, True],
+        "M": [True, True, True, True],
+    })
+    df = transform(raw)
+
+    assert df["trade_id"].tolist() == [3, 1, 2]
+    assert df["trade_id"].dtype == np.int64
+    assert df["quote_qty"].tolist() == [21.0, 11.0, 49.0]
+    assert df["time"].to_numpy().view(np.int64).tolist() == [1000, 1001, 1002]
+    assert df["order_type"].cat.codes.dtype == np.int8
+    assert df["order_type"].tolist() == ["Sell", "Buy", "Sell"]
+
+def test_transform_empty_frame():
+    df = transform(pd.DataFrame())
+
+    assert df.empty
+    assert list(df.columns) == ["trade_id", "price", "quantity", "quote_qty", "time", "order_type"]
+
+def test_transform_fixed_point_is_exact():
+    raw = pd.DataFrame({
+        "a": [1, 2],
+        "p": ["67012.34000000", "0.10000000"],
+        "q": ["0.00300000", "3.00000000"],
+        "T": [1000, 1001],
+        "m": [True, False],
+    })
+    df = transform(raw, fixed_point_scales("0.01", "0.00001"))
+
+    assert df["price"].tolist() == [6701234, 10]
+    assert df["quantity"].tolist() == [300, 300000]
+    assert df["quote_qty"].tolist() == [6701234 * 300, 10 * 300000]
+    assert to_decimal_strings(df["quote_qty"], 7).tolist() == ["201.0370200", "0.3000000"]
+
+def test_transform_fixed_point_rejects_wrong_scale():
+    raw = pd.DataFrame({"a": [1], "p": ["1.234"], "q": ["1"], "T": [1000], "m": [True]})
+
+    with pytest.raises(ValueError):
+        transform(raw, {"price": 2, "quantity": 0, "quote_qty": 2})
+
+def test_transform_fixed_point_parses_strings_exactly():
+    prices = ["90071992547409.93", "0.07", "-12.5", "3"]
+    raw = pd.DataFrame({"a": [1, 2, 3, 4], "p": prices, "q": ["1"] * 4, "T": [1000] * 4, "m": [True] * 4})
+
+    df = transform(raw, {"price": 2, "quantity": 0, "quote_qty": 2})
+
+    assert df["price"].tolist() == [9007199254740993, 7, -1250, 300]
+
+def test_scale_helpers():
+    assert fixed_point_scales("0.01", "0.00001") == {"price": 2, "quantity": 5, "quote_qty": 7}
+    assert scale_of("0.01000000") == 2
+    assert scale_of("1.00000000") == 0
+    assert to_decimal_strings(np.array([-5, 123456, 0]), 3).tolist() == ["-0.005", "123.456", "0.000"]
@@ -0,0 +1,45 @@
+import os
+import sys
+import threading
+from sqlalchemy import text
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.abspath(os.path.join(current_dir, "..", "src"))
+sys.path.append(parent_dir)
+
+import utils
+from utils import get_engine, get_latest_trade_id
+
+
+def test_engine_is_shared_by_url(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'shared.db'}"
+    engines = []
+    threads = [threading.Thread(target=lambda: engines.append(get_engine(db_url))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(engine is engines[0] for engine in engines)
+    assert get_engine(db_url, pool_size=1) is engines[0]
+    assert get_engine(f"sqlite:///{tmp_path / 'other.db'}") is not engines[0]
+
+
+def test_forked_process_gets_its_own_engine(tmp_path, monkeypatch):
+    db_url = f"sqlite:///{tmp_path / 'forked.db'}"
+    engine = get_engine(db_url)
+
+    monkeypatch.setattr(utils.os, "getpid", lambda: -1)
+
+    assert get_engine(db_url) is not engine
+
+
+def test_latest_trade_id_uses_the_shared_engine(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'trades.db'}"
+    with get_engine(db_url).begin() as conn:
+        conn.execute(text("CREATE TABLE trades (trade_id INTEGER)"))
+        conn.execute(text("INSERT INTO trades VALUES (1), (7)"))
+
+    assert get_latest_trade_id(db_url) == 7
+    assert get_latest_trade_id(db_url, table="missing") is None
+    assert get_engine(db_url).pool.checkedout() == 0